@@ -0,0 +1,84 @@
+"""Compare two ``bench.run`` result files and flag regressions.
+
+    python -m bench.compare before.json after.json --threshold 0.1
+
+Results are matched on target and size. A result regresses when its median
+latency grows by more than ``--threshold`` (and by more than the noise
+floor), or its peak memory by more than ``--memory-threshold``. Exits with
+status 1 when anything regressed, so it can gate CI.
+"""
+import argparse
+import json
+import sys
+
+# Latency changes smaller than this are noise, whatever the ratio
+NOISE_FLOOR_S = 0.005
+NOISE_FLOOR_MB = 5.0
+
+def load_results(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report.get('meta', {}), {
+        (result['target'], result['size']): result for result in report['results'] if result['status'] == 'ok'
+    }
+
+def _memory(result):
+    """Traced peak for functions, RSS growth of the server process tree for endpoints"""
+    if result.get('peak_traced_mb') is not None:
+        return result['peak_traced_mb']
+    return result.get('rss_growth_mb')
+
+def compare(baseline, current, threshold=0.1, memory_threshold=0.25):
+    """One row per result present in both files, with ratios and a regression flag"""
+    rows = []
+    for key in sorted(baseline.keys() & current.keys(), key=lambda key: (key[1], key[0])):
+        before, after = baseline[key], current[key]
+        old, new = before['latency_s']['median'], after['latency_s']['median']
+        ratio = new / old if old > 0 else float('inf')
+        old_memory, new_memory = _memory(before), _memory(after)
+        memory_ratio = None
+        if old_memory is not None and new_memory is not None and old_memory > 0:
+            memory_ratio = new_memory / old_memory
+        slower = ratio > 1 + threshold and new - old > NOISE_FLOOR_S
+        heavier = (memory_ratio is not None and memory_ratio > 1 + memory_threshold
+                   and new_memory - old_memory > NOISE_FLOOR_MB)
+        rows.append({
+            "target": key[0], "size": key[1], "before_s": old, "after_s": new, "ratio": ratio,
+            "before_mb": old_memory, "after_mb": new_memory, "memory_ratio": memory_ratio,
+            "regression": slower or heavier,
+        })
+    return rows
+
+def _format_mb(value):
+    return '-' if value is None else f"{value:,.1f}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.1, help="Allowed relative latency increase")
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help="Allowed relative memory increase")
+    parser.add_argument('--json', action='store_true', help="Print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    baseline_meta, baseline = load_results(args.baseline)
+    current_meta, current = load_results(args.current)
+    rows = compare(baseline, current, args.threshold, args.memory_threshold)
+    if args.json:
+        json.dump({"baseline": baseline_meta, "current": current_meta, "results": rows}, sys.stdout, indent=2)
+    else:
+        print(f"baseline {baseline_meta.get('git_commit')}  vs  current {current_meta.get('git_commit')}")
+        print(f"{'target':52} {'size':>9} {'before ms':>11} {'after ms':>11} {'x':>6} {'MB before':>10} {'MB after':>10}")
+        for row in rows:
+            print(
+                f"{row['target'][:52]:52} {row['size']:>9} {row['before_s'] * 1000:>11,.1f} "
+                f"{row['after_s'] * 1000:>11,.1f} {row['ratio']:>6.2f} {_format_mb(row['before_mb']):>10} "
+                f"{_format_mb(row['after_mb']):>10}{'  REGRESSION' if row['regression'] else ''}"
+            )
+        missing = sorted(baseline.keys() - current.keys())
+        if missing:
+            print(f"{len(missing)} baseline results missing from the current run")
+    return 1 if any(row['regression'] for row in rows) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
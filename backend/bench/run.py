@@ -0,0 +1,708 @@
+"""Latency, throughput and peak memory of the backend endpoints and utilities.
+
+Each benchmark runs at every requested size on seeded synthetic data (see
+``bench.synthetic``); sizes count line items. Endpoints are called through
+the real ASGI app, process pool included, with models, cache, datasets and
+warehouse in a throwaway directory. Results are written as JSON for
+``bench.compare``.
+
+    cd backend
+    python -m bench.run --sizes 1k,10k,100k --output before.json
+    python -m bench.run --sizes 1k,10k,100k --targets market-basket,forecast --output after.json
+    python -m bench.compare before.json after.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import defaultdict
+from functools import cached_property
+import pyarrow as pa
+from bench.synthetic import RetailDataGenerator, transaction_records, transaction_rows, daily_sales
+
+SIZE_UNITS = {'k': 1_000, 'm': 1_000_000}
+# Endpoint payloads above this many line items are sent as Arrow instead of JSON
+DEFAULT_JSON_LIMIT = 200_000
+# Uploads above this many rows use the streaming cleaner
+STREAMING_ROWS = 100_000
+# Executor jobs whose timeouts are raised for large sizes
+EXECUTOR_JOBS = [
+    'clean-data', 'warehouse-load', 'market-basket', 'customer-segmentation', 'anomaly-detection',
+    'sales-forecast', 'sales-forecast-batch', 'jobs'
+]
+MB = 1024 * 1024
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000"""
+    text = text.strip().lower().replace('_', '')
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+def format_size(rows):
+    for unit, factor in sorted(SIZE_UNITS.items(), key=lambda item: -item[1]):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{unit.upper() if unit == 'm' else unit}"
+    return str(rows)
+
+# ================ Memory ================
+def _process_tree(pid):
+    """``pid`` and all its descendants, from the parent IDs in /proc"""
+    children = defaultdict(list)
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces, so split after its closing parenthesis
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[parent].append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children[current])
+    return tree
+
+def tree_rss(pid=None):
+    """Resident bytes of a process and its descendants (pool workers), or None without /proc"""
+    if not os.path.isdir('/proc'):
+        return None
+    page = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for member in _process_tree(pid or os.getpid()):
+        try:
+            with open(f'/proc/{member}/statm') as f:
+                total += int(f.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+class MemorySampler:
+    """Peak resident memory of this process tree while the block runs, sampled on a thread"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, tree_rss())
+
+    def __enter__(self):
+        self.baseline = self.peak = tree_rss()
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak = max(self.peak, tree_rss())
+
+    @property
+    def peak_mb(self):
+        return None if self.peak is None else round(self.peak / MB, 1)
+
+    @property
+    def growth_mb(self):
+        return None if self.peak is None else round((self.peak - self.baseline) / MB, 1)
+
+# ================ Inputs ================
+def arrow_body(df):
+    """DataFrame as an Arrow IPC stream with plain string columns, as any client would send"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    columns = [
+        column.cast(column.type.value_type) if pa.types.is_dictionary(column.type) else column
+        for column in table.columns
+    ]
+    table = pa.table(columns, names=table.column_names)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def json_body(payload):
+    return json.dumps(payload, default=str).encode()
+
+class Inputs:
+    """Synthetic data of one size and the payloads derived from it, each built on first use"""
+
+    def __init__(self, rows, seed, workdir, json_limit):
+        self.rows = rows
+        self.seed = seed
+        self.workdir = workdir
+        self.use_arrow = rows > json_limit
+        self.format = 'arrow' if self.use_arrow else 'json'
+
+    @cached_property
+    def data(self):
+        return RetailDataGenerator(self.seed).generate(self.rows)
+
+    @property
+    def lines(self):
+        return self.data['lines']
+
+    @property
+    def transactions(self):
+        return self.data['transactions']
+
+    @cached_property
+    def records(self):
+        """Transaction.json records with nested items"""
+        return transaction_records(self.data)
+
+    @cached_property
+    def transaction_rows(self):
+        return transaction_rows(self.transactions)
+
+    @cached_property
+    def daily_sales(self):
+        return daily_sales(self.lines)
+
+    @cached_property
+    def baskets(self):
+        from utils.payloads import transaction_baskets
+        return transaction_baskets(self.lines)[0]
+
+    @cached_property
+    def csv_path(self):
+        path = os.path.join(self.workdir, f'sales-{self.rows}.csv')
+        self.lines.to_csv(path, index=False)
+        return path
+
+    @cached_property
+    def lines_arrow(self):
+        return arrow_body(self.lines)
+
+# ================ Registry ================
+class Case:
+    """One prepared benchmark: ``run`` is timed, ``reset`` runs untimed before each repetition.
+
+    ``rows`` is the number of input rows ``run`` processes, for throughput.
+    With ``warm`` set, the runs are repeated without ``reset`` as a second,
+    ``(cached)`` result.
+    """
+
+    def __init__(self, run, rows, reset=None, warm=False, format=None):
+        self.run = run
+        self.rows = rows
+        self.reset = reset
+        self.warm = warm
+        self.format = format
+
+BENCHMARKS = {}
+
+def benchmark(name, kind):
+    """Register a setup function ``(inputs, context) -> Case`` under ``name``"""
+    def register(setup):
+        BENCHMARKS[name] = (kind, setup)
+        return setup
+    return register
+
+# ================ Utility functions ================
+@benchmark('utils.payloads.transaction_baskets', 'function')
+def _transaction_baskets(inputs, context):
+    from utils.payloads import transaction_baskets
+    payload = inputs.lines if inputs.use_arrow else inputs.records
+    return Case(lambda: transaction_baskets(payload), inputs.rows, format=inputs.format)
+
+@benchmark('utils.market_basket.mine_frequent_itemsets', 'function')
+def _mine_frequent_itemsets(inputs, context):
+    from utils.market_basket import mine_frequent_itemsets
+    baskets = inputs.baskets
+    return Case(lambda: mine_frequent_itemsets(baskets, context.min_support, max_len=3), len(baskets))
+
+@benchmark('utils.market_basket.generate_association_rules', 'function')
+def _generate_association_rules(inputs, context):
+    from utils.market_basket import mine_frequent_itemsets, generate_association_rules
+    itemsets = mine_frequent_itemsets(inputs.baskets, context.min_support, max_len=3)
+    return Case(lambda: generate_association_rules(itemsets, min_confidence=0.2), len(itemsets))
+
+@benchmark('utils.clustering.calculate_rfm_features', 'function')
+def _calculate_rfm_features(inputs, context):
+    from utils.clustering import calculate_rfm_features
+    transactions = inputs.transactions
+    return Case(lambda: calculate_rfm_features(transactions), len(transactions))
+
+@benchmark('utils.clustering.SegmentationModel.fit', 'function')
+def _segmentation_fit(inputs, context):
+    from utils.clustering import SegmentationModel, RFM_FEATURES, calculate_rfm_features
+    features = calculate_rfm_features(inputs.transactions)[RFM_FEATURES].values
+    return Case(lambda: SegmentationModel(n_clusters=4).fit(features), len(features))
+
+@benchmark('utils.anomaly.AnomalyModel.fit', 'function')
+def _anomaly_fit(inputs, context):
+    from utils.anomaly import AnomalyModel
+    transactions = inputs.transactions
+    return Case(lambda: AnomalyModel().fit(transactions), len(transactions))
+
+@benchmark('utils.anomaly.AnomalyModel.score', 'function')
+def _anomaly_score(inputs, context):
+    from utils.anomaly import AnomalyModel
+    transactions = inputs.transactions
+    model = AnomalyModel().fit(transactions)
+    return Case(lambda: model.score(transactions, 0.01), len(transactions))
+
+@benchmark('utils.forecasting.forecast_catalogue', 'function')
+def _forecast_catalogue(inputs, context):
+    from utils.forecasting import forecast_catalogue
+    sales = inputs.daily_sales
+    return Case(lambda: forecast_catalogue(sales), len(sales))
+
+@benchmark('utils.recommender.ItemSimilarityIndex.ingest', 'function')
+def _recommender_ingest(inputs, context):
+    from utils.recommender import ItemSimilarityIndex
+    from utils.payloads import line_items
+    purchases = line_items(inputs.lines)
+    return Case(lambda: ItemSimilarityIndex().ingest(purchases), len(purchases))
+
+@benchmark('utils.recommender.ItemSimilarityIndex.recommend', 'function')
+def _recommender_recommend(inputs, context):
+    from utils.recommender import ItemSimilarityIndex
+    from utils.payloads import line_items
+    index = ItemSimilarityIndex()
+    index.ingest(line_items(inputs.lines))
+    customers = lookup_customers(inputs, context.lookups)
+
+    def run():
+        for customer in customers:
+            index.recommend(customer, limit=5)
+    return Case(run, len(customers))
+
+@benchmark('utils.data_cleaning.clean_file_streaming', 'function')
+def _clean_file_streaming(inputs, context):
+    from utils.data_cleaning import clean_file_streaming
+    path = inputs.csv_path
+    return Case(lambda: clean_file_streaming(path), inputs.rows)
+
+@benchmark('utils.datasets.DatasetWriter', 'function')
+def _dataset_writer(inputs, context):
+    from utils.datasets import DatasetWriter
+    root = os.path.join(inputs.workdir, 'dataset-writer')
+    lines = inputs.lines
+
+    def run():
+        writer = DatasetWriter(root)
+        writer.write(lines)
+        writer.close()
+    return Case(run, inputs.rows, reset=lambda: shutil.rmtree(root, ignore_errors=True))
+
+@benchmark('utils.datasets.read_dataset', 'function')
+def _read_dataset(inputs, context):
+    from utils.datasets import DatasetWriter, read_dataset
+    root = os.path.join(inputs.workdir, 'dataset-reader')
+    if not os.path.exists(root):
+        writer = DatasetWriter(root)
+        writer.write(inputs.lines)
+        writer.close()
+    columns = ['transaction_id', 'product_name', 'quantity', 'total']
+    return Case(lambda: read_dataset(root, columns), inputs.rows)
+
+@benchmark('utils.payloads.read_arrow', 'function')
+def _read_arrow(inputs, context):
+    from utils.payloads import read_arrow
+    body = inputs.lines_arrow
+    return Case(lambda: read_arrow(body), inputs.rows)
+
+@benchmark('database.loader.StarSchemaLoader.load', 'function')
+def _star_schema_load(inputs, context):
+    from database.warehouse import create_data_warehouse
+    from database.loader import StarSchemaLoader
+    path = os.path.join(inputs.workdir, 'loader-warehouse.db')
+    lines = inputs.lines
+
+    def reset():
+        if os.path.exists(path):
+            os.unlink(path)
+    return Case(lambda: StarSchemaLoader(create_data_warehouse('sqlite:///' + path)).load(lines), inputs.rows,
+                reset=reset)
+
+# ================ Endpoints ================
+def check(response, error_field=None):
+    """Raise for HTTP errors, and for analysis errors reported inside a 200 body"""
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:300]}")
+    if error_field is not None:
+        message = str(response.json().get(error_field, ''))
+        if 'error' in message.lower():
+            raise RuntimeError(message[:300])
+    return response
+
+def lookup_customers(inputs, count):
+    customers = inputs.transactions['customer_id']
+    return customers.sample(count, replace=True, random_state=inputs.seed).tolist()
+
+def post_frame(client, path, inputs, json_payload, frame, options=None, field=None):
+    """POST a payload as JSON, or as an Arrow frame plus query options above the JSON limit"""
+    if not inputs.use_arrow:
+        body = json_body(dict(json_payload(), **(options or {})))
+        return lambda: client.post(path, content=body, headers={'content-type': 'application/json'})
+    body = arrow_body(frame())
+    params = dict(options or {}, **({'field': field} if field else {}))
+    return lambda: client.post(
+        path, content=body, params=params, headers={'content-type': 'application/vnd.apache.arrow.stream'}
+    )
+
+def clear_cache(client):
+    check(client.delete('/api/cache'))
+
+def delete_datasets(client):
+    for dataset in check(client.get('/api/datasets')).json()['datasets']:
+        check(client.delete(f"/api/datasets/{dataset['dataset_id']}"))
+
+@benchmark('POST /api/clean-data', 'endpoint')
+def _clean_data_endpoint(inputs, context):
+    client = context.client
+    path = inputs.csv_path
+    params = {'streaming': inputs.rows > STREAMING_ROWS}
+
+    def run():
+        with open(path, 'rb') as f:
+            check(client.post('/api/clean-data', params=params, files={'file': ('sales.csv', f, 'text/csv')}))
+    return Case(run, inputs.rows, reset=lambda: delete_datasets(context.client), format='csv')
+
+@benchmark('POST /api/market-basket', 'endpoint')
+def _market_basket_endpoint(inputs, context):
+    client = context.client
+    post = post_frame(
+        client, '/api/market-basket', inputs, lambda: {'transactions': inputs.records}, lambda: inputs.lines,
+        {'min_support': context.min_support, 'max_len': 3}
+    )
+    return Case(lambda: check(post(), 'cross_sell_strategy'), inputs.rows, reset=lambda: clear_cache(client),
+                warm=True, format=inputs.format)
+
+@benchmark('POST /api/market-basket (dataset)', 'endpoint')
+def _market_basket_dataset_endpoint(inputs, context):
+    client = context.client
+    with open(inputs.csv_path, 'rb') as f:
+        response = check(client.post(
+            '/api/clean-data', params={'streaming': inputs.rows > STREAMING_ROWS},
+            files={'file': ('sales.csv', f, 'text/csv')}
+        ))
+    body = json_body({'dataset_id': response.json()['dataset_id'], 'min_support': context.min_support, 'max_len': 3})
+    headers = {'content-type': 'application/json'}
+    return Case(
+        lambda: check(client.post('/api/market-basket', content=body, headers=headers), 'cross_sell_strategy'),
+        inputs.rows, reset=lambda: clear_cache(client), warm=True, format='parquet'
+    )
+
+@benchmark('POST /api/customer-segmentation', 'endpoint')
+def _segmentation_endpoint(inputs, context):
+    client = context.client
+    post = post_frame(
+        client, '/api/customer-segmentation', inputs, lambda: {'transactions': inputs.transaction_rows},
+        lambda: inputs.transactions, field='transactions'
+    )
+    # Train the saved model first, so the timed runs measure assignment
+    train = post_frame(
+        client, '/api/customer-segmentation', inputs, lambda: {'transactions': inputs.transaction_rows},
+        lambda: inputs.transactions, {'refit': True}, field='transactions'
+    )
+    check(train())
+    return Case(lambda: check(post()), len(inputs.transactions), reset=lambda: clear_cache(client), warm=True,
+                format=inputs.format)
+
+@benchmark('POST /api/anomaly-detection', 'endpoint')
+def _anomaly_endpoint(inputs, context):
+    client = context.client
+    payload = lambda: {'transactions': inputs.transaction_rows}
+    check(post_frame(
+        client, '/api/anomaly-detection', inputs, payload, lambda: inputs.transactions, {'retrain': True}
+    )())
+    post = post_frame(client, '/api/anomaly-detection', inputs, payload, lambda: inputs.transactions,
+                      {'contamination': 0.01})
+    return Case(lambda: check(post()), len(inputs.transactions), reset=lambda: clear_cache(client), warm=True,
+                format=inputs.format)
+
+@benchmark('POST /api/anomaly-detection/score', 'endpoint')
+def _anomaly_score_endpoint(inputs, context):
+    client = context.client
+    headers = {'content-type': 'application/json'}
+    check(client.post(
+        '/api/anomaly-detection', content=json_body({'transactions': inputs.transaction_rows[:20_000], 'retrain': True}),
+        headers=headers
+    ))
+    body = json_body({'transactions': inputs.transaction_rows[:context.lookups], 'contamination': 0.01})
+    return Case(lambda: check(client.post('/api/anomaly-detection/score', content=body, headers=headers)),
+                min(context.lookups, len(inputs.transactions)), format='json')
+
+@benchmark('POST /api/sales-forecast', 'endpoint')
+def _forecast_endpoint(inputs, context):
+    client = context.client
+    sales = inputs.daily_sales
+    top = sales.groupby('product_id')['sales'].sum().idxmax()
+    history = sales[sales['product_id'] == top].assign(date=lambda df: df['date'].dt.strftime('%Y-%m-%d'))
+    body = json_body({'product_id': top, 'historical_sales': history[['date', 'sales']].to_dict('records')})
+    headers = {'content-type': 'application/json'}
+    return Case(lambda: check(client.post('/api/sales-forecast', content=body, headers=headers)), len(history),
+                format='json')
+
+@benchmark('POST /api/sales-forecast/batch', 'endpoint')
+def _batch_forecast_endpoint(inputs, context):
+    client = context.client
+    sales = lambda: inputs.daily_sales.assign(date=inputs.daily_sales['date'].dt.strftime('%Y-%m-%d'))
+    post = post_frame(client, '/api/sales-forecast/batch', inputs, lambda: {'sales': sales().to_dict('records')},
+                      sales)
+    return Case(lambda: check(post()), len(inputs.daily_sales), reset=lambda: clear_cache(client), warm=True,
+                format=inputs.format)
+
+def reset_recommender(context):
+    """Start the server's similarity index from scratch; the server notices the file is gone"""
+    if os.path.exists(context.main.RECOMMENDER_PATH):
+        os.unlink(context.main.RECOMMENDER_PATH)
+
+@benchmark('POST /api/product-recommendations/index', 'endpoint')
+def _recommender_index_endpoint(inputs, context):
+    post = post_frame(
+        context.client, '/api/product-recommendations/index', inputs, lambda: {'transactions': inputs.records},
+        lambda: inputs.lines
+    )
+    return Case(lambda: check(post()), inputs.rows, reset=lambda: reset_recommender(context), format=inputs.format)
+
+@benchmark('POST /api/product-recommendations', 'endpoint')
+def _recommendations_endpoint(inputs, context):
+    client = context.client
+    reset_recommender(context)
+    check(post_frame(
+        client, '/api/product-recommendations/index', inputs, lambda: {'transactions': inputs.records},
+        lambda: inputs.lines
+    )())
+    headers = {'content-type': 'application/json'}
+    bodies = [
+        json_body({'customer': {'customer_id': customer}, 'limit': 5})
+        for customer in lookup_customers(inputs, context.lookups)
+    ]
+
+    def run():
+        for body in bodies:
+            check(client.post('/api/product-recommendations', content=body, headers=headers))
+    return Case(run, len(bodies), format='json')
+
+# ================ Runner ================
+class Context:
+    """Settings shared by all benchmarks, plus the app client once endpoints are needed"""
+
+    def __init__(self, workdir, min_support, lookups, timeout):
+        self.workdir = workdir
+        self.min_support = min_support
+        self.lookups = lookups
+        self.timeout = timeout
+        self._client = None
+        self.main = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            models_dir = os.path.join(self.workdir, 'models')
+            # Keep the benchmark away from the real models, cache, datasets and warehouse
+            os.environ.update({
+                'RETAILIQ_MODELS_DIR': models_dir,
+                'RETAILIQ_JOBS_DB': os.path.join(models_dir, 'jobs.db'),
+                'RETAILIQ_CACHE_DIR': os.path.join(models_dir, 'cache'),
+                'RETAILIQ_DATASETS_DIR': os.path.join(models_dir, 'datasets'),
+                'RETAILIQ_WAREHOUSE_URL': 'sqlite:///' + os.path.join(models_dir, 'retailiq_warehouse.db'),
+            })
+            for name in EXECUTOR_JOBS:
+                os.environ['RETAILIQ_' + name.upper().replace('-', '_') + '_TIMEOUT'] = str(self.timeout)
+            from fastapi.testclient import TestClient
+            import main
+            self.main = main
+            self._client = TestClient(main.app)
+            self._client.__enter__()
+        return self._client
+
+    def close(self):
+        if self._client is not None:
+            self._client.__exit__(None, None, None)
+
+def _timed(case, repeat, reset):
+    timings = []
+    for _ in range(repeat):
+        if reset and case.reset is not None:
+            case.reset()
+        gc.collect()
+        start = time.perf_counter()
+        case.run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def _traced_peak(case):
+    """Peak Python and numpy heap of one run, as seen by tracemalloc"""
+    if case.reset is not None:
+        case.reset()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run()
+        return round(tracemalloc.get_traced_memory()[1] / MB, 1)
+    finally:
+        tracemalloc.stop()
+
+def _result(name, kind, rows, case, timings, memory, traced=None):
+    median = statistics.median(timings)
+    return {
+        "target": name,
+        "kind": kind,
+        "size": rows,
+        "input_rows": case.rows,
+        "format": case.format,
+        "repeat": len(timings),
+        "latency_s": {
+            "min": round(min(timings), 6),
+            "median": round(median, 6),
+            "mean": round(statistics.fmean(timings), 6),
+            "max": round(max(timings), 6),
+        },
+        "rows_per_s": round(case.rows / median, 1) if median > 0 else None,
+        "peak_rss_mb": memory.peak_mb,
+        "rss_growth_mb": memory.growth_mb,
+        "peak_traced_mb": traced,
+        "status": "ok",
+    }
+
+def run_benchmark(name, kind, setup, inputs, context, repeat, warmup, trace_memory):
+    """Results of one benchmark at one size: cold runs, plus cached runs for ``warm`` cases"""
+    case = setup(inputs, context)
+    if warmup:
+        _timed(case, warmup, reset=True)
+    with MemorySampler() as memory:
+        timings = _timed(case, repeat, reset=True)
+    traced = _traced_peak(case) if trace_memory and kind == 'function' else None
+    results = [_result(name, kind, inputs.rows, case, timings, memory, traced)]
+    if case.warm:
+        case.run()
+        with MemorySampler() as memory:
+            timings = _timed(case, repeat, reset=False)
+        results.append(_result(name + ' (cached)', kind, inputs.rows, case, timings, memory))
+    return results
+
+def _version(module):
+    try:
+        return __import__(module).__version__
+    except Exception:
+        return None
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {module: _version(module) for module in ('numpy', 'pandas', 'sklearn', 'scipy', 'pyarrow', 'fastapi')},
+    }
+
+def select(targets, kind):
+    """Registered benchmarks matching any of the comma-separated name fragments"""
+    fragments = [fragment.strip().lower() for fragment in targets.split(',')] if targets else []
+    return [
+        (name, registered_kind, setup) for name, (registered_kind, setup) in BENCHMARKS.items()
+        if kind in ('all', registered_kind) and (not fragments or any(f in name.lower() for f in fragments))
+    ]
+
+def _log(message):
+    print(message, file=sys.stderr, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1k,10k,100k', help="Comma-separated line-item counts, e.g. 1k,100k,10M")
+    parser.add_argument('--targets', default=None, help="Comma-separated name fragments to run, e.g. market-basket")
+    parser.add_argument('--kind', choices=['all', 'function', 'endpoint'], default='all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--min-support', type=float, default=0.005)
+    parser.add_argument('--lookups', type=int, default=200, help="Requests per run for single-lookup endpoints")
+    parser.add_argument('--json-limit', type=parse_size, default=DEFAULT_JSON_LIMIT,
+                        help="Largest size sent as JSON; larger payloads are sent as Arrow")
+    parser.add_argument('--timeout', type=float, default=3600, help="Executor timeout per job, in seconds")
+    parser.add_argument('--no-trace', action='store_true', help="Skip the extra tracemalloc run of functions")
+    parser.add_argument('--output', default=None, help="JSON results file (default: stdout)")
+    parser.add_argument('--list', action='store_true', help="List the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    benchmarks = select(args.targets, args.kind)
+    if args.list:
+        for name, kind, _ in benchmarks:
+            print(f"{kind:9} {name}")
+        return 0
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='retailiq-bench-')
+    context = Context(workdir, args.min_support, args.lookups, args.timeout)
+    results = []
+    started = time.time()
+    try:
+        for rows in sizes:
+            inputs = Inputs(rows, args.seed, workdir, args.json_limit)
+            for name, kind, setup in benchmarks:
+                _log(f"{format_size(rows):>6}  {name} ...")
+                try:
+                    outcome = run_benchmark(
+                        name, kind, setup, inputs, context, args.repeat, args.warmup, not args.no_trace
+                    )
+                except Exception as e:
+                    traceback.print_exc()
+                    outcome = [{"target": name, "kind": kind, "size": rows, "status": "error", "error": str(e)}]
+                for result in outcome:
+                    results.append(result)
+                    _log(summary_line(result))
+    finally:
+        context.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": dict(environment(), started_at=started, duration_s=round(time.time() - started, 1),
+                     sizes=sizes, repeat=args.repeat, warmup=args.warmup, seed=args.seed,
+                     min_support=args.min_support, json_limit=args.json_limit),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        _log(f"Wrote {len(results)} results to {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return 1 if any(result['status'] != 'ok' for result in results) else 0
+
+def summary_line(result):
+    if result['status'] != 'ok':
+        return f"{format_size(result['size']):>6}  {result['target']}: ERROR {result['error']}"
+    latency = result['latency_s']['median']
+    if result['peak_traced_mb'] is not None:
+        memory = f"{result['peak_traced_mb']} MB traced"
+    elif result['rss_growth_mb'] is not None:
+        memory = f"RSS +{result['rss_growth_mb']} MB"
+    else:
+        memory = "memory n/a"
+    return (
+        f"{format_size(result['size']):>6}  {result['target']}: {latency * 1000:,.1f} ms median, "
+        f"{result['rows_per_s'] or 0:,.0f} rows/s, {memory}"
+    )
+
+if __name__ == '__main__':
+    sys.exit(main())
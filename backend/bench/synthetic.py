@@ -0,0 +1,314 @@
+"""Seeded synthetic retail data shaped like the frontend entities.
+
+Transactions follow ``src/Entities/Transaction.json`` (nested ``items``),
+customers ``Customer.json`` and products ``Product.json``. Product
+popularity is Zipf-distributed and customer activity is skewed, so a few
+products and customers dominate as in real stores; baskets also carry
+companion products so association rules and recommendations have
+something to find. Everything is generated with vectorized numpy, which
+keeps 10M line items to well under a minute.
+
+    python -m bench.synthetic --rows 100000 --output sales.csv
+"""
+import argparse
+import json
+import zlib
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['electronics', 'clothing', 'home', 'beauty', 'sports', 'books', 'toys', 'food']
+CATEGORY_WEIGHTS = [0.14, 0.18, 0.14, 0.1, 0.1, 0.1, 0.08, 0.16]
+# Median unit price per category; prices are log-normal around it
+CATEGORY_PRICES = [180.0, 35.0, 45.0, 22.0, 40.0, 14.0, 25.0, 7.0]
+SUBCATEGORIES = {
+    'electronics': ['Headphones', 'Charger', 'Speaker', 'Monitor', 'Keyboard', 'Camera'],
+    'clothing': ['T-Shirt', 'Jeans', 'Jacket', 'Sneakers', 'Dress', 'Socks'],
+    'home': ['Lamp', 'Cushion', 'Cookware', 'Towel', 'Vase', 'Storage Box'],
+    'beauty': ['Lipstick', 'Moisturizer', 'Shampoo', 'Perfume', 'Serum', 'Nail Polish'],
+    'sports': ['Yoga Mat', 'Dumbbells', 'Water Bottle', 'Running Shorts', 'Tennis Balls', 'Bike Light'],
+    'books': ['Novel', 'Cookbook', 'Biography', 'Comic', 'Travel Guide', 'Textbook'],
+    'toys': ['Puzzle', 'Board Game', 'Action Figure', 'Plush', 'Building Set', 'Doll'],
+    'food': ['Coffee', 'Tea', 'Chocolate', 'Snack Bar', 'Olive Oil', 'Pasta'],
+}
+
+PAYMENT_METHODS = ['credit_card', 'debit_card', 'cash', 'digital_wallet']
+PAYMENT_WEIGHTS = [0.42, 0.28, 0.12, 0.18]
+STATUSES = ['completed', 'pending', 'cancelled', 'refunded']
+STATUS_WEIGHTS = [0.92, 0.03, 0.02, 0.03]
+SEGMENTS = ['premium', 'regular', 'budget', 'at_risk']
+SEGMENT_WEIGHTS = [0.15, 0.5, 0.25, 0.1]
+# Relative purchase frequency of each segment
+SEGMENT_ACTIVITY = [2.5, 1.0, 0.7, 0.3]
+
+FIRST_NAMES = ['Ava', 'Liam', 'Mia', 'Noah', 'Zoe', 'Omar', 'Lena', 'Ravi', 'Sofia', 'Kenji', 'Amara', 'Lucas',
+               'Ines', 'Mateo', 'Yara', 'Elias', 'Nora', 'Hugo', 'Priya', 'Felix']
+LAST_NAMES = ['Smith', 'Garcia', 'Chen', 'Patel', 'Kowalski', 'Okafor', 'Rossi', 'Nguyen', 'Silva', 'Muller',
+              'Tanaka', 'Haddad', 'Johansson', 'Dubois', 'Kim', 'Novak']
+LOCATIONS = [('USA', 'New York'), ('USA', 'Chicago'), ('USA', 'Austin'), ('UK', 'London'), ('UK', 'Leeds'),
+             ('Germany', 'Berlin'), ('France', 'Lyon'), ('Spain', 'Madrid'), ('Canada', 'Toronto'),
+             ('India', 'Pune'), ('Japan', 'Osaka'), ('Brazil', 'Recife')]
+
+# Share of basket lines (after the first) that are the first product's companion
+COMPANION_SHARE = 0.3
+
+def _labels(prefix, n, width):
+    return pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(width).radd(prefix)
+
+def _categorical(values, codes):
+    """``values[codes]`` as a categorical, without materialising the repeated strings"""
+    value_codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(value_codes[codes], categories=uniques)
+
+class RetailDataGenerator:
+    """Deterministic generator of products, customers and transactions.
+
+    Every table depends only on the seed and the requested size, never on
+    what was generated before, so ``generate(rows)`` gives the same data in
+    any run. ``rows`` counts line items; transactions average 2.5 lines.
+    """
+
+    def __init__(self, seed=42, start='2023-01-01', days=730, n_stores=12, zipf_exponent=1.1,
+                 anomaly_rate=0.005):
+        self.seed = seed
+        self.start = pd.Timestamp(start)
+        self.days = days
+        self.n_stores = n_stores
+        self.zipf_exponent = zipf_exponent
+        self.anomaly_rate = anomaly_rate
+
+    def _rng(self, table, size):
+        return np.random.default_rng([self.seed, size, zlib.crc32(table.encode())])
+
+    def products(self, n):
+        rng = self._rng('products', n)
+        category = rng.choice(len(CATEGORIES), n, p=CATEGORY_WEIGHTS)
+        subcategory = rng.integers(0, 6, n)
+        names = np.array([SUBCATEGORIES[c][s] for c in CATEGORIES for s in range(6)], dtype=object)
+        price = np.round(np.array(CATEGORY_PRICES)[category] * rng.lognormal(0, 0.6, n), 2).clip(0.99)
+        # Popularity ranks are shuffled so the bestsellers are spread over categories
+        rank = rng.permutation(n) + 1
+        popularity = 1 / rank ** self.zipf_exponent
+        return pd.DataFrame({
+            'product_id': _labels('P', n, 6),
+            'product_name': names[category * 6 + subcategory] + ' #' + _labels('', n, 5),
+            'category': _categorical(CATEGORIES, category),
+            'subcategory': names[category * 6 + subcategory],
+            'price': price,
+            'cost': np.round(price * rng.uniform(0.4, 0.75, n), 2),
+            'stock_quantity': rng.integers(0, 500, n),
+            'reorder_level': rng.integers(10, 60, n),
+            'average_rating': np.round(rng.uniform(2.5, 5.0, n), 1),
+            'popularity': popularity / popularity.sum(),
+        })
+
+    def customers(self, n):
+        rng = self._rng('customers', n)
+        first = rng.integers(0, len(FIRST_NAMES), n)
+        last = rng.integers(0, len(LAST_NAMES), n)
+        location = rng.integers(0, len(LOCATIONS), n)
+        segment = rng.choice(len(SEGMENTS), n, p=SEGMENT_WEIGHTS)
+        names = pd.Series(np.array(FIRST_NAMES, dtype=object)[first] + ' ' + np.array(LAST_NAMES, dtype=object)[last])
+        ids = _labels('C', n, 7)
+        activity = rng.lognormal(0, 1, n) * np.array(SEGMENT_ACTIVITY)[segment]
+        return pd.DataFrame({
+            'customer_id': ids,
+            'customer_name': names,
+            'email': names.str.lower().str.replace(' ', '.') + '.' + ids.str[1:] + '@example.com',
+            'phone': '+1-555-' + pd.Series(rng.integers(0, 10_000_000, n)).astype(str).str.zfill(7),
+            'country': _categorical([country for country, _ in LOCATIONS], location),
+            'city': _categorical([city for _, city in LOCATIONS], location),
+            'age': rng.normal(40, 13, n).clip(18, 85).astype(int),
+            'gender': _categorical(['female', 'male', 'other'], rng.choice(3, n, p=[0.49, 0.49, 0.02])),
+            'segment': _categorical(SEGMENTS, segment),
+            'home_store': rng.integers(0, self.n_stores, n),
+            'activity': activity / activity.sum(),
+        })
+
+    def _days(self, rng, n):
+        """Sale days with weekend peaks, a December high and steady growth"""
+        day = np.arange(self.days)
+        dates = self.start + pd.to_timedelta(day, unit='D')
+        weight = np.where(dates.dayofweek >= 5, 1.3, 1.0)
+        weight *= 1 + 0.25 * np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 350) / 365.25)
+        weight *= 1 + 0.3 * day / self.days
+        return rng.choice(self.days, n, p=weight / weight.sum())
+
+    def generate(self, rows, n_customers=None, n_products=None):
+        """Products, customers, transactions and line items for ``rows`` line items.
+
+        Returns a dict of DataFrames: ``products``, ``customers``,
+        ``transactions`` (one row per transaction with its total) and
+        ``lines`` (one row per item, sorted by transaction, with the
+        transaction, customer and product columns the cleaner and warehouse
+        loader recognise).
+        """
+        rng = self._rng('transactions', rows)
+        basket_sizes = 1 + rng.poisson(1.5, int(rows / 2.5 * 1.2) + 10)
+        n_transactions = int(np.searchsorted(np.cumsum(basket_sizes), rows)) + 1
+        basket_sizes = basket_sizes[:n_transactions]
+        basket_sizes[-1] -= basket_sizes.sum() - rows
+        n_customers = n_customers or max(50, n_transactions // 8)
+        n_products = n_products or int(np.clip(4 * np.sqrt(rows), 40, 20_000))
+        products = self.products(n_products)
+        customers = self.customers(n_customers)
+
+        customer = rng.choice(n_customers, n_transactions, p=customers['activity'].to_numpy())
+        # Mostly the customer's home store, sometimes any other
+        store = np.where(rng.random(n_transactions) < 0.8, customers['home_store'].to_numpy()[customer],
+                         rng.integers(0, self.n_stores, n_transactions))
+        # Lunchtime and evening peaks
+        hours = np.where(rng.random(n_transactions) < 0.55, rng.normal(13, 2.5, n_transactions),
+                         rng.normal(19, 2, n_transactions)).clip(6, 23.99)
+        anomaly = rng.random(n_transactions) < self.anomaly_rate
+        # Anomalies happen in the small hours
+        hours = np.where(anomaly, rng.uniform(1, 4.5, n_transactions), hours)
+        seconds = self._days(rng, n_transactions).astype('int64') * 86400 + (hours * 3600).astype('int64')
+        timestamps = self.start + pd.to_timedelta(seconds, unit='s')
+
+        transaction = np.repeat(np.arange(n_transactions), basket_sizes)
+        position = np.arange(rows) - np.repeat(np.cumsum(basket_sizes) - basket_sizes, basket_sizes)
+        product = rng.choice(n_products, rows, p=products['popularity'].to_numpy())
+        # Each product's companion is the next one of its category
+        order = np.lexsort((np.arange(n_products), products['category'].cat.codes.to_numpy()))
+        companion = np.empty(n_products, dtype=np.int64)
+        companion[order] = np.roll(order, -1)
+        first_product = product[position == 0]
+        paired = (position > 0) & (rng.random(rows) < COMPANION_SHARE)
+        product[paired] = companion[first_product[transaction[paired]]]
+
+        price = products['price'].to_numpy()[product]
+        discounted = rng.random(rows) < 0.15
+        unit_price = np.round(price * np.where(discounted, 0.9, 1.0), 2)
+        quantity = 1 + rng.poisson(0.4, rows)
+        quantity = np.where(anomaly[transaction], quantity * rng.integers(15, 40, rows), quantity)
+        total = np.round(quantity * unit_price, 2)
+
+        transaction_ids = _labels('T', n_transactions, 9)
+        payment = rng.choice(len(PAYMENT_METHODS), n_transactions, p=PAYMENT_WEIGHTS)
+        status = rng.choice(len(STATUSES), n_transactions, p=STATUS_WEIGHTS)
+        customer_ids = customers['customer_id'].to_numpy(dtype=object)
+        customer_names = customers['customer_name'].to_numpy(dtype=object)
+        store_ids = np.array([f"S{i + 1:02d}" for i in range(self.n_stores)], dtype=object)
+
+        transactions = pd.DataFrame({
+            'transaction_id': transaction_ids,
+            'customer_id': customer_ids[customer],
+            'customer_name': customer_names[customer],
+            'transaction_date': timestamps,
+            'store_id': store_ids[store],
+            'item_count': basket_sizes,
+            'total_amount': np.round(np.bincount(transaction, weights=total, minlength=n_transactions), 2),
+            'payment_method': _categorical(PAYMENT_METHODS, payment),
+            'status': _categorical(STATUSES, status),
+            'is_anomaly': anomaly,
+        })
+        # Repeated strings stay categorical, so 10M lines fit in memory
+        lines = pd.DataFrame({
+            'transaction_id': _categorical(transaction_ids, transaction),
+            'customer_id': _categorical(customer_ids, customer[transaction]),
+            'customer_name': _categorical(customer_names, customer[transaction]),
+            'email': _categorical(customers['email'], customer[transaction]),
+            'segment': _categorical(customers['segment'].astype(str), customer[transaction]),
+            'city': _categorical(customers['city'].astype(str), customer[transaction]),
+            'country': _categorical(customers['country'].astype(str), customer[transaction]),
+            'transaction_date': timestamps.to_numpy()[transaction],
+            'store_id': _categorical(store_ids, store[transaction]),
+            'product_id': _categorical(products['product_id'], product),
+            'product_name': _categorical(products['product_name'], product),
+            'category': _categorical(products['category'].astype(str), product),
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'unit_cost': products['cost'].to_numpy()[product],
+            'total': total,
+            'payment_method': _categorical(PAYMENT_METHODS, payment[transaction]),
+            'status': _categorical(STATUSES, status[transaction]),
+        })
+        return {
+            'products': products.drop(columns='popularity'),
+            'customers': summarize_customers(customers, transactions),
+            'transactions': transactions,
+            'lines': lines,
+        }
+
+def summarize_customers(customers, transactions):
+    """Customer records with the purchase totals and churn risk of ``Customer.json``"""
+    completed = transactions[transactions['status'] != 'refunded']
+    grouped = completed.groupby('customer_id', sort=False)
+    totals = pd.DataFrame({
+        'total_purchases': grouped.size(),
+        'total_spent': grouped['total_amount'].sum().round(2),
+        'last_purchase_date': grouped['transaction_date'].max(),
+    })
+    result = customers.drop(columns=['home_store', 'activity']).join(totals, on='customer_id')
+    result['total_purchases'] = result['total_purchases'].fillna(0).astype(int)
+    result['total_spent'] = result['total_spent'].fillna(0.0)
+    idle = (transactions['transaction_date'].max() - result['last_purchase_date']).dt.days.fillna(365)
+    result['churn_risk_score'] = np.round((idle / 180).clip(0, 1) * 0.7 + (result['segment'] == 'at_risk') * 0.3, 2)
+    return result
+
+def _json_value(value):
+    if value is pd.NaT:
+        return None
+    return value.isoformat() if isinstance(value, pd.Timestamp) else str(value)
+
+def transaction_records(data, limit=None):
+    """JSON transactions with nested ``items``, as the frontend sends them"""
+    transactions = data['transactions'].iloc[:limit]
+    lines = data['lines']
+    n_lines = int(transactions['item_count'].sum())
+    items = pd.DataFrame({
+        'product_id': lines['product_id'].iloc[:n_lines].astype(str).tolist(),
+        'product_name': lines['product_name'].iloc[:n_lines].astype(str).tolist(),
+        'category': lines['category'].iloc[:n_lines].astype(str).tolist(),
+        'quantity': lines['quantity'].iloc[:n_lines].tolist(),
+        'unit_price': lines['unit_price'].iloc[:n_lines].tolist(),
+        'total': lines['total'].iloc[:n_lines].tolist(),
+    }).to_dict('records')
+    ends = np.cumsum(transactions['item_count'].to_numpy())
+    records = transaction_rows(transactions)
+    start = 0
+    for record, end in zip(records, ends):
+        record['items'] = items[start:end]
+        start = end
+    return records
+
+def transaction_rows(transactions):
+    """Flat JSON transaction records (no items), e.g. for anomaly scoring"""
+    df = transactions.assign(
+        transaction_date=transactions['transaction_date'].dt.strftime('%Y-%m-%dT%H:%M:%S'),
+        payment_method=transactions['payment_method'].astype(str),
+        status=transactions['status'].astype(str),
+    )
+    return df.to_dict('records')
+
+def daily_sales(lines):
+    """Units sold per product per day, the long format of the batch forecast"""
+    sales = lines.groupby(
+        [lines['product_id'].astype(str), lines['transaction_date'].dt.normalize().rename('date')], sort=False
+    )['quantity'].sum()
+    return sales.rename('sales').reset_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=100_000, help="Line items to generate")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--table', choices=['lines', 'transactions', 'customers', 'products'], default='lines')
+    parser.add_argument('--output', required=True, help="File to write; .csv, .parquet or .json")
+    args = parser.parse_args(argv)
+
+    data = RetailDataGenerator(args.seed).generate(args.rows)
+    if args.output.endswith('.json'):
+        if args.table == 'transactions':
+            records = transaction_records(data)
+        else:
+            records = data[args.table].to_dict('records')
+        with open(args.output, 'w') as f:
+            json.dump(records, f, default=_json_value)
+    elif args.output.endswith('.parquet'):
+        data[args.table].to_parquet(args.output, index=False)
+    else:
+        data[args.table].to_csv(args.output, index=False)
+    print(f"Wrote {len(data[args.table])} {args.table} to {args.output}")
+
+if __name__ == '__main__':
+    main()
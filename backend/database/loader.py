@@ -0,0 +1,225 @@
+import time
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from database.warehouse import FactSales, DimCustomer, DimProduct, DimDate, DimStore
+
+# Cleaned source columns tried in order for each warehouse field
+SOURCE_COLUMNS = {
+    'transaction_id': ['transaction_id', 'order_id', 'invoice_no'],
+    'customer_key': ['customer_id', 'email', 'customer_name'],
+    'customer_name': ['customer_name', 'name'],
+    'segment': ['segment'],
+    'city': ['city'],
+    'country': ['country'],
+    'product_key': ['product_id', 'sku', 'product_name'],
+    'product_name': ['product_name'],
+    'category': ['category'],
+    'store_key': ['store_id', 'store', 'store_name'],
+    'store_name': ['store_name', 'store'],
+    'region': ['region'],
+    'price': ['unit_price', 'price'],
+    'cost': ['unit_cost', 'cost'],
+    'date': ['transaction_date', 'date', 'order_date'],
+    'quantity': ['quantity', 'total_sold'],
+    'revenue': ['revenue', 'line_total', 'total'],
+}
+
+def _source(df, field):
+    """First matching source column for a warehouse field, or None"""
+    for column in SOURCE_COLUMNS[field]:
+        if column in df.columns:
+            return df[column]
+    return None
+
+def _keys(series):
+    """Natural keys as strings, keeping missing values missing"""
+    return series.astype('string')
+
+def _numeric(series, default=np.nan):
+    if series is None:
+        return default
+    return pd.to_numeric(series, errors='coerce')
+
+def _bulk_insert(conn, table, df, batch_size):
+    """executemany in batches, at the DBAPI level when the driver takes positional params"""
+    if len(df) == 0:
+        return
+    compiled = table.insert().compile(dialect=conn.dialect, column_keys=list(df.columns))
+    columns = compiled.positiontup if compiled.positional else list(df.columns)
+    # Plain Python values with None for missing, one list per column
+    values = [df[column].astype(object).where(df[column].notna(), None).tolist() for column in columns]
+    for start in range(0, len(df), batch_size):
+        batch = list(zip(*(column[start:start + batch_size] for column in values)))
+        if compiled.positional:
+            conn.exec_driver_sql(str(compiled), batch)
+        else:
+            conn.execute(table.insert(), [dict(zip(columns, row)) for row in batch])
+
+class StarSchemaLoader:
+    """Bulk ETL from cleaned DataFrames into the sales star schema.
+
+    Dimension surrogate keys are resolved through in-memory maps of natural
+    key -> surrogate key, loaded once from the warehouse and extended as new
+    customers/products/stores/dates appear; new keys are allocated here rather
+    than by the database so facts never wait on a round-trip per row. Date keys
+    are the YYYYMMDD smart key. Each ``load`` call writes its dimensions and
+    facts with batched executemany inside a single transaction.
+
+    The maps assume this loader is the only writer of the dimension tables.
+    """
+
+    def __init__(self, engine, batch_size=50_000):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.stats = {'facts': 0, 'customers': 0, 'products': 0, 'stores': 0, 'dates': 0, 'seconds': 0.0}
+        self._reset_maps()
+
+    def _reset_maps(self):
+        self._customer_ids = None
+        self._product_ids = None
+        self._store_ids = None
+        self._date_ids = None
+        self._next_ids = {}
+
+    def _load_maps(self, conn):
+        if self._customer_ids is not None:
+            return
+        self._customer_ids = dict(conn.execute(select(DimCustomer.customer_key, DimCustomer.customer_id)).all())
+        self._product_ids = dict(conn.execute(select(DimProduct.product_key, DimProduct.product_id)).all())
+        self._store_ids = dict(conn.execute(select(DimStore.store_key, DimStore.store_id)).all())
+        self._date_ids = set(conn.execute(select(DimDate.date_id)).scalars())
+        self._next_ids = {
+            'dim_customer': (conn.execute(select(func.max(DimCustomer.customer_id))).scalar() or 0) + 1,
+            'dim_product': (conn.execute(select(func.max(DimProduct.product_id))).scalar() or 0) + 1,
+            'dim_store': (conn.execute(select(func.max(DimStore.store_id))).scalar() or 0) + 1,
+        }
+
+    def _resolve(self, conn, table, id_column, key_column, key_map, rows):
+        """Surrogate keys for ``rows[key_column]``, inserting unseen dimension members"""
+        keys = rows[key_column]
+        ids = keys.map(key_map)
+        new = rows[ids.isna() & keys.notna()].drop_duplicates(key_column)
+        if len(new) > 0:
+            start = self._next_ids[table.name]
+            new_ids = np.arange(start, start + len(new))
+            _bulk_insert(conn, table, new.assign(**{id_column: new_ids}), self.batch_size)
+            key_map.update(zip(new[key_column].tolist(), new_ids.tolist()))
+            self._next_ids[table.name] = start + len(new)
+            ids = keys.map(key_map)
+        return ids.astype('Int64'), len(new)
+
+    def _resolve_dates(self, conn, dates):
+        date_ids = (dates.dt.year * 10000 + dates.dt.month * 100 + dates.dt.day).astype('Int64')
+        unique = pd.Series(dates.dt.normalize().unique()).dropna()
+        unique_ids = unique.dt.year * 10000 + unique.dt.month * 100 + unique.dt.day
+        new = unique[~unique_ids.isin(self._date_ids)]
+        if len(new) > 0:
+            _bulk_insert(conn, DimDate.__table__, pd.DataFrame({
+                'date_id': new.dt.year * 10000 + new.dt.month * 100 + new.dt.day,
+                'full_date': new.dt.date,
+                'year': new.dt.year,
+                'quarter': new.dt.quarter,
+                'month': new.dt.month,
+                'day': new.dt.day,
+            }), self.batch_size)
+            self._date_ids.update(unique_ids[~unique_ids.isin(self._date_ids)].tolist())
+        return date_ids, len(new)
+
+    def load(self, df):
+        """Load one cleaned DataFrame (e.g. a clean-data chunk); returns rows loaded"""
+        started = time.perf_counter()
+        n = len(df)
+        
+        price = _numeric(_source(df, 'price'))
+        quantity = _numeric(_source(df, 'quantity'), default=1)
+        quantity = pd.Series(quantity, index=df.index).fillna(1)
+        revenue = _numeric(_source(df, 'revenue'))
+        if not isinstance(revenue, pd.Series):
+            revenue = quantity * price if isinstance(price, pd.Series) else pd.Series(np.nan, index=df.index)
+        cost = _numeric(_source(df, 'cost'))
+        if isinstance(cost, pd.Series) and isinstance(price, pd.Series):
+            profit = (price - cost) * quantity
+        else:
+            profit = pd.Series(np.nan, index=df.index)
+        
+        customer_key = _source(df, 'customer_key')
+        product_key = _source(df, 'product_key')
+        store_key = _source(df, 'store_key')
+        dates = _source(df, 'date')
+        
+        def attribute(field):
+            series = _source(df, field)
+            return series if series is not None else pd.Series(None, index=df.index, dtype=object)
+        
+        try:
+            with self.engine.begin() as conn:
+                self._load_maps(conn)
+                
+                if customer_key is not None:
+                    customer_ids, added = self._resolve(
+                        conn, DimCustomer.__table__, 'customer_id', 'customer_key', self._customer_ids,
+                        pd.DataFrame({
+                            'customer_key': _keys(customer_key),
+                            'name': attribute('customer_name'),
+                            'segment': attribute('segment'),
+                            'city': attribute('city'),
+                            'country': attribute('country'),
+                        })
+                    )
+                    self.stats['customers'] += added
+                else:
+                    customer_ids = pd.Series(pd.NA, index=df.index, dtype='Int64')
+                
+                if product_key is not None:
+                    product_ids, added = self._resolve(
+                        conn, DimProduct.__table__, 'product_id', 'product_key', self._product_ids,
+                        pd.DataFrame({
+                            'product_key': _keys(product_key),
+                            'name': attribute('product_name'),
+                            'category': attribute('category'),
+                            'price': price if isinstance(price, pd.Series) else np.nan,
+                        })
+                    )
+                    self.stats['products'] += added
+                else:
+                    product_ids = pd.Series(pd.NA, index=df.index, dtype='Int64')
+                
+                if store_key is not None:
+                    store_ids, added = self._resolve(
+                        conn, DimStore.__table__, 'store_id', 'store_key', self._store_ids,
+                        pd.DataFrame({
+                            'store_key': _keys(store_key),
+                            'name': attribute('store_name'),
+                            'region': attribute('region'),
+                        })
+                    )
+                    self.stats['stores'] += added
+                else:
+                    store_ids = pd.Series(pd.NA, index=df.index, dtype='Int64')
+                
+                if dates is not None:
+                    date_ids, added = self._resolve_dates(conn, pd.to_datetime(dates, errors='coerce'))
+                    self.stats['dates'] += added
+                else:
+                    date_ids = pd.Series(pd.NA, index=df.index, dtype='Int64')
+                
+                transaction_id = _source(df, 'transaction_id')
+                _bulk_insert(conn, FactSales.__table__, pd.DataFrame({
+                    'transaction_id': _keys(transaction_id) if transaction_id is not None else None,
+                    'customer_id': customer_ids,
+                    'product_id': product_ids,
+                    'date_id': date_ids,
+                    'store_id': store_ids,
+                    'quantity': quantity.round().astype('Int64'),
+                    'revenue': revenue,
+                    'profit': profit,
+                }), self.batch_size)
+        except Exception:
+            # Keys allocated in the rolled-back transaction must not be reused
+            self._reset_maps()
+            raise
+        
+        self.stats['facts'] += n
+        self.stats['seconds'] += time.perf_counter() - started
+        return n
@@ -0,0 +1,62 @@
+import re
+from sqlalchemy import select
+from database.warehouse import DimProduct, DimStore
+from database.queries import baskets_query, transaction_totals_query, customer_rfm_query, daily_sales_query
+from database.rollups import source_query
+
+# A pass over every fact_sales row, through the table or a whole index
+# (SQLite / PostgreSQL wording)
+FULL_SCAN = re.compile(r'\bSCAN (TABLE )?fact_sales\b|Seq Scan on fact_sales')
+
+def explain(engine, stmt):
+    """Query plan lines for a statement, as reported by the database"""
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with engine.connect() as conn:
+        return [str(row[-1]) for row in conn.exec_driver_sql(prefix + sql)]
+
+def sample_values(engine):
+    """A store key and a category present in the warehouse, or None for each when it is empty"""
+    with engine.connect() as conn:
+        store = conn.execute(select(DimStore.store_key).order_by(DimStore.store_id).limit(1)).scalar()
+        category = conn.execute(
+            select(DimProduct.category).where(DimProduct.category.is_not(None))
+            .order_by(DimProduct.product_id).limit(1)
+        ).scalar()
+    return store, category
+
+def key_queries(start_date='2024-01-01', end_date='2024-01-31', product_id=1, store='sample', category='sample'):
+    """The warehouse's hot queries, scoped the way the API issues them.
+
+    ``store`` and ``category`` must be non-empty, or the scoped queries are
+    planned without their filters.
+    """
+    scope = {'start_date': start_date, 'end_date': end_date}
+    first_day = int(start_date.replace('-', ''))
+    last_day = int(end_date.replace('-', ''))
+    return {
+        'baskets': baskets_query(scope),
+        'transaction_totals': transaction_totals_query(scope),
+        'customer_rfm': customer_rfm_query(scope),
+        'daily_sales': daily_sales_query([product_id]),
+        'store_baskets': baskets_query({'store': store}),
+        'category_totals': transaction_totals_query({'category': category}),
+        'rollup_day_product': source_query('day', 'product', first_day, last_day),
+        'rollup_day_category': source_query('day', 'category', first_day, last_day),
+        'rollup_day_segment': source_query('day', 'segment', first_day, last_day),
+    }
+
+def check_query_plans(engine, **params):
+    """EXPLAIN each key query and flag any that fall back to a full fact_sales scan"""
+    store, category = sample_values(engine)
+    # Real values, so the planner sees the selectivity the API queries have
+    params.setdefault('store', store or 'sample')
+    params.setdefault('category', category or 'sample')
+    report = {}
+    for name, stmt in key_queries(**params).items():
+        plan = explain(engine, stmt)
+        report[name] = {
+            'full_scan': any(FULL_SCAN.search(line) for line in plan),
+            'plan': plan,
+        }
+    return report
@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, or_
+from database.warehouse import FactSales, DimCustomer, DimProduct, DimStore
+from utils.clustering import rfm_from_aggregates
+
+def date_id(value):
+    """YYYYMMDD smart key for a date-like value"""
+    ts = pd.Timestamp(value)
+    return ts.year * 10000 + ts.month * 100 + ts.day
+
+def _dates(date_ids):
+    return pd.to_datetime(date_ids.astype('int64').astype(str), format='%Y%m%d')
+
+def apply_scope(stmt, scope=None):
+    """Restrict a fact_sales query to a date range, store and/or product category.
+
+    Store and category filters are semi-joins on the dimension tables, so the
+    calling query does not need to join them itself. ``stores`` (set by the
+    sharded analyses, see ``store_shards``) limits facts to a list of store
+    keys, where None stands for facts without a store.
+    """
+    scope = scope or {}
+    if scope.get('start_date'):
+        stmt = stmt.where(FactSales.date_id >= date_id(scope['start_date']))
+    if scope.get('end_date'):
+        stmt = stmt.where(FactSales.date_id <= date_id(scope['end_date']))
+    if scope.get('store'):
+        stmt = stmt.where(FactSales.store_id.in_(
+            select(DimStore.store_id).where(or_(DimStore.store_key == scope['store'], DimStore.name == scope['store']))
+        ))
+    if scope.get('stores') is not None:
+        condition = FactSales.store_id.in_(
+            select(DimStore.store_id).where(DimStore.store_key.in_([key for key in scope['stores'] if key is not None]))
+        )
+        if None in scope['stores']:
+            condition = or_(condition, FactSales.store_id.is_(None))
+        stmt = stmt.where(condition)
+    if scope.get('category'):
+        stmt = stmt.where(FactSales.product_id.in_(
+            select(DimProduct.product_id).where(DimProduct.category == scope['category'])
+        ))
+    return stmt
+
+def read_frame(engine, stmt):
+    with engine.connect() as conn:
+        return pd.read_sql(stmt, conn)
+
+def warehouse_version(engine):
+    """Changes whenever facts are loaded; used to key cached warehouse results"""
+    with engine.connect() as conn:
+        return conn.execute(select(func.max(FactSales.sale_id))).scalar() or 0
+
+def store_shards(engine, shard_by='store', scope=None, unknown='unknown'):
+    """Store keys per shard, one shard per store or per region, for scopes with ``stores``.
+
+    Facts without a store join the ``unknown`` shard, as do stores without a
+    region.
+    """
+    scope = scope or {}
+    stmt = select(DimStore.store_key, DimStore.region)
+    if scope.get('store'):
+        stmt = stmt.where(or_(DimStore.store_key == scope['store'], DimStore.name == scope['store']))
+    with engine.connect() as conn:
+        stores = conn.execute(stmt).all()
+        storeless = not scope.get('store') and conn.execute(
+            select(FactSales.sale_id).where(FactSales.store_id.is_(None)).limit(1)
+        ).first() is not None
+    shards = {}
+    for store_key, region in stores:
+        shards.setdefault(store_key if shard_by == 'store' else region or unknown, []).append(store_key)
+    if storeless:
+        shards.setdefault(unknown, []).append(None)
+    return dict(sorted(shards.items()))
+
+def baskets_query(scope=None):
+    return apply_scope(
+        select(FactSales.transaction_id, DimProduct.name)
+        .join(DimProduct, FactSales.product_id == DimProduct.product_id)
+        .where(FactSales.transaction_id.is_not(None)),
+        scope
+    )
+
+def load_baskets(engine, scope=None):
+    """Product-name baskets, one list per transaction, and their transaction IDs"""
+    df = read_frame(engine, baskets_query(scope)).dropna(subset=['name'])
+    return group_baskets(df['transaction_id'], df['name'])
+
+def group_baskets(transaction_ids, names):
+    """Product-name lists per transaction ID, in order of first appearance"""
+    if len(names) == 0:
+        return [], []
+    
+    # Group by transaction with one stable sort instead of a Python groupby
+    codes, transaction_ids = pd.factorize(transaction_ids)
+    order = np.argsort(codes, kind='stable')
+    names = np.asarray(names, dtype=object)[order]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return [basket.tolist() for basket in np.split(names, bounds)], list(transaction_ids)
+
+def transaction_totals_query(scope=None):
+    return apply_scope(
+        select(
+            FactSales.transaction_id,
+            func.sum(FactSales.revenue).label('total_amount'),
+            func.count().label('item_count'),
+            func.max(FactSales.customer_id).label('customer_id'),
+        )
+        .where(FactSales.transaction_id.is_not(None))
+        .group_by(FactSales.transaction_id),
+        scope
+    )
+
+def load_transaction_totals(engine, scope=None):
+    """One row per transaction with its total amount, line count and customer"""
+    return read_frame(engine, transaction_totals_query(scope))
+
+def customer_rfm_query(scope=None):
+    # Aggregate on the fact table's customer index, then attach natural keys
+    totals = apply_scope(
+        select(
+            FactSales.customer_id,
+            func.min(FactSales.date_id).label('first_date_id'),
+            func.max(FactSales.date_id).label('last_date_id'),
+            func.count(func.distinct(FactSales.transaction_id)).label('frequency'),
+            func.sum(FactSales.revenue).label('monetary'),
+        )
+        .where(FactSales.customer_id.is_not(None))
+        .group_by(FactSales.customer_id),
+        scope
+    ).subquery()
+    return (
+        select(
+            DimCustomer.customer_key.label('customer_id'),
+            totals.c.first_date_id, totals.c.last_date_id, totals.c.frequency, totals.c.monetary
+        )
+        .join(DimCustomer, totals.c.customer_id == DimCustomer.customer_id)
+    )
+
+def load_customer_aggregates(engine, scope=None):
+    """First/last purchase, transaction count and spend per customer, aggregated in SQL"""
+    df = read_frame(engine, customer_rfm_query(scope))
+    aggregates = pd.DataFrame({
+        'first_purchase': _dates(df['first_date_id']),
+        'last_purchase': _dates(df['last_date_id']),
+        'frequency': df['frequency'],
+        'monetary': df['monetary'].fillna(0),
+    })
+    aggregates.index = df['customer_id']
+    return aggregates
+
+def load_customer_rfm(engine, scope=None):
+    """RFM features, average basket value and tenure per customer.
+
+    Aggregated in SQL; recency and tenure are measured from the scope's end
+    date, or from the latest sale in scope when no end date is given.
+    """
+    return rfm_from_aggregates(load_customer_aggregates(engine, scope), (scope or {}).get('end_date'))
+
+def daily_sales_query(product_ids, scope=None):
+    return apply_scope(
+        select(FactSales.date_id, func.sum(FactSales.quantity).label('sales'))
+        .where(FactSales.product_id.in_(product_ids))
+        .group_by(FactSales.date_id),
+        scope
+    )
+
+def load_daily_sales(engine, product, scope=None):
+    """Units sold per day for one product, by product key or name"""
+    # Resolving the product first lets the planner see a short IN list and use
+    # the product index; with a subquery SQLite prefers scanning in date order
+    with engine.connect() as conn:
+        product_ids = conn.execute(
+            select(DimProduct.product_id).where(or_(DimProduct.product_key == product, DimProduct.name == product))
+        ).scalars().all()
+    df = read_frame(engine, daily_sales_query(product_ids, scope))
+    df['date'] = _dates(df.pop('date_id'))
+    return df[['date', 'sales']].sort_values('date', ignore_index=True)
+
+def product_daily_sales_query(product_ids=None, scope=None):
+    stmt = (
+        select(FactSales.product_id, FactSales.date_id, func.sum(FactSales.quantity).label('sales'))
+        .group_by(FactSales.product_id, FactSales.date_id)
+    )
+    if product_ids is not None:
+        stmt = stmt.where(FactSales.product_id.in_(product_ids))
+    return apply_scope(stmt, scope)
+
+def load_product_daily_sales(engine, products=None, scope=None):
+    """Units sold per day for every product (or the given keys/names), in long format"""
+    with engine.connect() as conn:
+        stmt = select(DimProduct.product_id, func.coalesce(DimProduct.product_key, DimProduct.name))
+        if products:
+            stmt = stmt.where(or_(DimProduct.product_key.in_(products), DimProduct.name.in_(products)))
+        keys = dict(conn.execute(stmt).all())
+    if not keys:
+        return pd.DataFrame({'product_id': [], 'date': pd.to_datetime([]), 'sales': []})
+    df = read_frame(engine, product_daily_sales_query(list(keys) if products else None, scope))
+    return pd.DataFrame({
+        'product_id': df['product_id'].map(keys),
+        'date': _dates(df['date_id']),
+        'sales': df['sales'],
+    })
+
+def customer_products_query(after_sale_id=0):
+    return (
+        select(
+            DimCustomer.customer_key.label('customer_id'),
+            DimProduct.name.label('product_name'),
+            DimProduct.category,
+            DimProduct.price,
+            func.max(FactSales.sale_id).label('sale_id'),
+        )
+        .join(DimCustomer, FactSales.customer_id == DimCustomer.customer_id)
+        .join(DimProduct, FactSales.product_id == DimProduct.product_id)
+        .where(FactSales.sale_id > after_sale_id)
+        .group_by(FactSales.customer_id, FactSales.product_id)
+    )
+
+def load_customer_products(engine, after_sale_id=0):
+    """Distinct (customer, product) purchases in facts loaded after ``after_sale_id``"""
+    return read_frame(engine, customer_products_query(after_sale_id)).dropna(subset=['customer_id', 'product_name'])
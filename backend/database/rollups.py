@@ -0,0 +1,224 @@
+import time
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, Index, select, func, delete, or_
+from database.warehouse import FactSales, DimCustomer, DimProduct
+
+# Time grains from finest to coarsest. Periods are integer smart keys like
+# date_id: YYYYMMDD for days, YYYYMM for months and YYYYQ for quarters.
+TIME_GRAINS = ('day', 'month', 'quarter')
+
+# Rollup dimension -> (key column type, fact_sales expression it groups by)
+DIMENSIONS = {
+    'product': (Integer, FactSales.product_id),
+    'category': (String(50), DimProduct.category),
+    'segment': (String(50), DimCustomer.segment),
+}
+
+metadata = MetaData()
+
+# Highest fact_sales.sale_id already folded into the rollups
+rollup_state = Table(
+    'rollup_state', metadata,
+    Column('name', String(50), primary_key=True),
+    Column('last_sale_id', Integer, nullable=False),
+)
+
+def _rollup_table(grain, dimension):
+    name = f'rollup_sales_{grain}_{dimension}'
+    key_type, _ = DIMENSIONS[dimension]
+    return Table(
+        name, metadata,
+        Column('period', Integer, nullable=False),
+        Column(dimension, key_type),
+        Column('quantity', Integer),
+        Column('revenue', Float),
+        Column('profit', Float),
+        Column('fact_count', Integer),
+        Index(f'ix_{name}', 'period', dimension),
+    )
+
+ROLLUPS = {
+    (grain, dimension): _rollup_table(grain, dimension)
+    for grain in TIME_GRAINS for dimension in DIMENSIONS
+}
+
+def create_rollup_tables(engine):
+    metadata.create_all(engine)
+
+def _month(day):
+    return day // 100
+
+def _quarter(month):
+    return month // 100 * 10 + (month % 100 + 2) // 3
+
+def _first_month(quarter):
+    return quarter // 10 * 100 + (quarter % 10 - 1) * 3 + 1
+
+def _convert(period, source, target):
+    """Period key (Python int or SQL expression) at a coarser grain"""
+    if source == target:
+        return period
+    if source == 'day':
+        period = _month(period)
+    return period if target == 'month' else _quarter(period)
+
+def _period(value, grain):
+    ts = pd.Timestamp(value)
+    day = ts.year * 10000 + ts.month * 100 + ts.day
+    return _convert(day, 'day', grain)
+
+def _measures(table=None):
+    if table is None:
+        return [
+            func.sum(FactSales.quantity).label('quantity'),
+            func.sum(FactSales.revenue).label('revenue'),
+            func.sum(FactSales.profit).label('profit'),
+            func.count().label('fact_count'),
+        ]
+    return [func.sum(table.c[name]).label(name) for name in ('quantity', 'revenue', 'profit', 'fact_count')]
+
+def source_query(grain, dimension, first, last):
+    """Aggregate for one rollup over [first, last] periods, from the next finer grain"""
+    if grain == 'day':
+        key = DIMENSIONS[dimension][1]
+        stmt = (
+            select(FactSales.date_id, key, *_measures())
+            .where(FactSales.date_id.between(first, last))
+            .group_by(FactSales.date_id, key)
+        )
+        if dimension == 'category':
+            stmt = stmt.outerjoin(DimProduct, FactSales.product_id == DimProduct.product_id)
+        elif dimension == 'segment':
+            stmt = stmt.outerjoin(DimCustomer, FactSales.customer_id == DimCustomer.customer_id)
+        return stmt
+
+    finer = TIME_GRAINS[TIME_GRAINS.index(grain) - 1]
+    source = ROLLUPS[(finer, dimension)]
+    if grain == 'month':
+        bounds = (first * 100, last * 100 + 99)
+    else:
+        bounds = (_first_month(first), _first_month(last) + 2)
+    period = _convert(source.c.period, finer, grain)
+    return (
+        select(period, source.c[dimension], *_measures(source))
+        .where(source.c.period.between(*bounds))
+        .group_by(period, source.c[dimension])
+    )
+
+def refresh_rollups(engine, full=False):
+    """Fold facts loaded since the last refresh into the rollup tables.
+
+    Rollups are rebuilt over the contiguous span of periods the new facts
+    touch: day rollups from fact_sales, then each coarser grain from the one
+    below it. ``full`` recomputes everything, which is needed after facts
+    are updated or deleted rather than appended.
+    """
+    started = time.perf_counter()
+    create_rollup_tables(engine)
+    with engine.begin() as conn:
+        watermark = conn.execute(
+            select(rollup_state.c.last_sale_id).where(rollup_state.c.name == 'fact_sales')
+        ).scalar()
+        latest = conn.execute(select(func.max(FactSales.sale_id))).scalar() or 0
+
+        new_facts = FactSales.date_id.is_not(None)
+        if not full and watermark is not None:
+            if latest <= watermark:
+                return {'facts': 0, 'days': 0, 'seconds': time.perf_counter() - started}
+            new_facts = new_facts & (FactSales.sale_id > watermark)
+        first_day, last_day, n_facts = conn.execute(
+            select(func.min(FactSales.date_id), func.max(FactSales.date_id), func.count()).where(new_facts)
+        ).one()
+
+        if full:
+            for table in ROLLUPS.values():
+                conn.execute(delete(table))
+        if first_day is not None:
+            for grain in TIME_GRAINS:
+                first, last = _convert(first_day, 'day', grain), _convert(last_day, 'day', grain)
+                for dimension in DIMENSIONS:
+                    table = ROLLUPS[(grain, dimension)]
+                    conn.execute(delete(table).where(table.c.period.between(first, last)))
+                    conn.execute(table.insert().from_select(
+                        ['period', dimension, 'quantity', 'revenue', 'profit', 'fact_count'],
+                        source_query(grain, dimension, first, last)
+                    ))
+
+        if watermark is None:
+            conn.execute(rollup_state.insert().values(name='fact_sales', last_sale_id=latest))
+        else:
+            conn.execute(
+                rollup_state.update().where(rollup_state.c.name == 'fact_sales').values(last_sale_id=latest)
+            )
+
+    days = 0 if first_day is None else (pd.Timestamp(str(last_day)) - pd.Timestamp(str(first_day))).days + 1
+    return {'facts': n_facts, 'days': days, 'seconds': time.perf_counter() - started}
+
+def route_rollup(grain, start_date=None, end_date=None):
+    """Coarsest rollup grain that answers a query at ``grain`` exactly.
+
+    A coarser rollup can only be used when the date range starts and ends on
+    its period boundaries, e.g. month rollups for whole months.
+    """
+    start = pd.Timestamp(start_date) if start_date else None
+    end = pd.Timestamp(end_date) if end_date else None
+    candidates = TIME_GRAINS[:TIME_GRAINS.index(grain) + 1]
+    for candidate in reversed(candidates):
+        if candidate == 'day':
+            return candidate
+        starts_month = start is None or start.day == 1
+        ends_month = end is None or (end + pd.Timedelta(days=1)).day == 1
+        if candidate == 'month' and starts_month and ends_month:
+            return candidate
+        starts_quarter = start is None or (starts_month and start.month % 3 == 1)
+        ends_quarter = end is None or (ends_month and end.month % 3 == 0)
+        if candidate == 'quarter' and starts_quarter and ends_quarter:
+            return candidate
+
+def _period_labels(periods, grain):
+    text = periods.astype('int64').astype(str)
+    if grain == 'day':
+        return text.str[:4] + '-' + text.str[4:6] + '-' + text.str[6:]
+    if grain == 'month':
+        return text.str[:4] + '-' + text.str[4:]
+    return text.str[:4] + '-Q' + text.str[4:]
+
+def query_sales(engine, grain='month', by=None, start_date=None, end_date=None, keys=None):
+    """Quantity, revenue and profit per period (and per ``by`` key) from the rollups.
+
+    Returns the result frame and the name of the rollup table that served it.
+    Product keys match either the product key or the product name.
+    """
+    if grain not in TIME_GRAINS:
+        raise ValueError(f"Unknown grain '{grain}'. Use one of: {', '.join(TIME_GRAINS)}")
+    if by is not None and by not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension '{by}'. Use one of: {', '.join(DIMENSIONS)}")
+
+    source_grain = route_rollup(grain, start_date, end_date)
+    # Totals can come from any dimension; categories are the fewest rows
+    table = ROLLUPS[(source_grain, by or 'category')]
+    period = _convert(table.c.period, source_grain, grain).label('period')
+
+    columns = [period]
+    if by == 'product':
+        columns += [DimProduct.product_key, DimProduct.name]
+    elif by is not None:
+        columns.append(table.c[by])
+    stmt = select(*columns, *_measures(table)).group_by(*columns).order_by(*columns)
+    if by == 'product':
+        stmt = stmt.outerjoin(DimProduct, table.c.product == DimProduct.product_id)
+
+    if start_date:
+        stmt = stmt.where(table.c.period >= _period(start_date, source_grain))
+    if end_date:
+        stmt = stmt.where(table.c.period <= _period(end_date, source_grain))
+    if keys:
+        if by == 'product':
+            stmt = stmt.where(or_(DimProduct.product_key.in_(keys), DimProduct.name.in_(keys)))
+        elif by is not None:
+            stmt = stmt.where(table.c[by].in_(keys))
+
+    with engine.connect() as conn:
+        df = pd.read_sql(stmt, conn)
+    df['period'] = _period_labels(df['period'], grain)
+    return df, table.name
@@ -1,17 +1,31 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey
+from sqlalchemy import create_engine, event, inspect, Column, Integer, String, Float, Date, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
+from contextlib import contextmanager
 
 Base = declarative_base()
 
 # Fact Table
 class FactSales(Base):
     __tablename__ = 'fact_sales'
+    __table_args__ = (
+        # Date-range scans and day rollups; covers the additive measures
+        Index('ix_fact_sales_date_product', 'date_id', 'product_id', 'quantity', 'revenue', 'profit'),
+        # Per-product history (forecasts)
+        Index('ix_fact_sales_product_date', 'product_id', 'date_id', 'quantity'),
+        # Per-customer RFM aggregates
+        Index('ix_fact_sales_customer_date', 'customer_id', 'date_id', 'transaction_id', 'revenue'),
+        # Baskets and transaction totals
+        Index('ix_fact_sales_transaction', 'transaction_id', 'product_id', 'revenue'),
+        Index('ix_fact_sales_store_date', 'store_id', 'date_id'),
+    )
     
     sale_id = Column(Integer, primary_key=True)
+    transaction_id = Column(String(64))
     customer_id = Column(Integer, ForeignKey('dim_customer.customer_id'))
     product_id = Column(Integer, ForeignKey('dim_product.product_id'))
     date_id = Column(Integer, ForeignKey('dim_date.date_id'))
+    store_id = Column(Integer, ForeignKey('dim_store.store_id'))
     quantity = Column(Integer)
     revenue = Column(Float)
     profit = Column(Float)
@@ -21,8 +35,9 @@ class DimCustomer(Base):
     __tablename__ = 'dim_customer'
     
     customer_id = Column(Integer, primary_key=True)
+    customer_key = Column(String(255), unique=True)
     name = Column(String(100))
-    segment = Column(String(50))
+    segment = Column(String(50), index=True)
     city = Column(String(100))
     country = Column(String(100))
 
@@ -30,22 +45,114 @@ class DimProduct(Base):
     __tablename__ = 'dim_product'
     
     product_id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    category = Column(String(50))
+    product_key = Column(String(255), unique=True)
+    name = Column(String(100), index=True)
+    category = Column(String(50), index=True)
     price = Column(Float)
 
+class DimStore(Base):
+    __tablename__ = 'dim_store'
+    
+    store_id = Column(Integer, primary_key=True)
+    store_key = Column(String(255), unique=True)
+    name = Column(String(100), index=True)
+    region = Column(String(100))
+
 class DimDate(Base):
     __tablename__ = 'dim_date'
+    __table_args__ = (
+        Index('ix_dim_date_year_month', 'year', 'month'),
+    )
     
+    # Smart key: YYYYMMDD
     date_id = Column(Integer, primary_key=True)
-    full_date = Column(Date)
+    full_date = Column(Date, index=True)
     year = Column(Integer)
     quarter = Column(Integer)
     month = Column(Integer)
     day = Column(Integer)
 
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -200000,  # ~200 MB page cache
+    'mmap_size': 1 << 30,
+}
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def migrate_warehouse(engine):
+    """Bring an existing warehouse up to the current schema.
+
+    ``create_all`` only creates missing tables, so columns and indexes added
+    to existing tables since the database was created are added here. Unique
+    columns get a unique index, since most databases cannot add a UNIQUE
+    column in place. Planner statistics are refreshed after building indexes.
+    Returns the names of the columns and indexes added.
+    """
+    added = {'columns': [], 'indexes': []}
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"
+                )
+                added['columns'].append(f"{table.name}.{column.name}")
+                if column.unique:
+                    index = Index(f"uq_{table.name}_{column.name}", column, unique=True)
+                    index.create(conn)
+                    added['indexes'].append(index.name)
+            
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(conn)
+                    added['indexes'].append(index.name)
+        if added['indexes']:
+            conn.exec_driver_sql("ANALYZE")
+    return added
+
+@contextmanager
+def deferred_indexes(engine, table=None):
+    """Drop a table's secondary indexes for a bulk load and rebuild them after.
+
+    Building an index once over the loaded rows is cheaper than maintaining
+    it row by row; fact_sales loads run several times faster without them.
+    Indexes are rebuilt (and statistics refreshed) even if the load fails.
+    """
+    table = FactSales.__table__ if table is None else table
+    inspector = inspect(engine)
+    existing = {index['name'] for index in inspector.get_indexes(table.name)}
+    with engine.begin() as conn:
+        for index in table.indexes:
+            if index.name in existing:
+                index.drop(conn)
+    try:
+        yield
+    finally:
+        with engine.begin() as conn:
+            for index in table.indexes:
+                index.create(conn)
+            conn.exec_driver_sql(f"ANALYZE {engine.dialect.identifier_preparer.quote(table.name)}")
+
 def create_data_warehouse(db_url='sqlite:///retailiq_warehouse.db'):
-    """Create data warehouse schema"""
+    """Create data warehouse schema, migrating an existing one in place"""
     engine = create_engine(db_url)
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _set_sqlite_pragmas)
+    migrate_warehouse(engine)
     Base.metadata.create_all(engine)
     return engine
@@ -1,20 +1,79 @@
 # backend/main.py
-from fastapi import FastAPI, UploadFile, File, HTTPException
+# Imported first, so the startup report times every other import
+from utils.startup import startup, preload_modules, freeze_heap
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, Response
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, ValidationError
 from typing import List, Dict, Any, Optional
+from contextlib import asynccontextmanager
+from datetime import date
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LinearRegression
-from mlxtend.frequent_patterns import apriori, association_rules
-from mlxtend.preprocessing import TransactionEncoder
+import pyarrow as pa
+from utils.market_basket import (
+    mine_frequent_itemsets, count_itemsets, generate_association_rules, rules_frame, query_rules, RULE_COLUMNS,
+    RULE_SORT_COLUMNS
+)
+from utils.rule_store import IncrementalRuleStore
+from utils.locking import file_lock
+from utils.data_cleaning import clean_file_streaming, fill_missing
+from utils.executor import JobExecutor
+from utils.jobs import JobStore, execute_job, TERMINAL_STATUSES
+from utils.cache import ResultCache
+from utils.clustering import (
+    SegmentationModel, RFMStore, RFM_FEATURES, calculate_rfm_features, aggregate_transactions, rfm_from_aggregates
+)
+from utils.anomaly import AnomalyModel, ModelNotTrained, query_anomalies, ANOMALY_SORT_COLUMNS
+from utils.recommender import ItemSimilarityIndex
+from utils.payloads import (
+    ARROW_STREAM, ARROW_TYPES, CompressionMiddleware, PayloadTooLarge, media_type, decompress, read_arrow, write_arrow,
+    line_items, transaction_baskets
+)
+from utils.datasets import (
+    create_dataset_writer, dataset_path, read_manifest, list_datasets, delete_dataset, dataset_stats, read_dataset,
+    load_dataset_baskets, load_dataset_transactions, load_dataset_daily_sales, dataset_shards
+)
+from utils.sharding import (
+    SHARD_COLUMNS, shard_frame, local_itemsets, merge_itemset_counts, merge_customer_aggregates, merge_daily_sales
+)
+from utils.forecasting import HORIZONS, fit_sales_trends, predict_sales, confidence_labels, forecast_catalogue
+from utils.metrics import (
+    PROFILE_EXTENSIONS, MetricsMiddleware, TimedJSONResponse, registry, stage, add_rows, configure_logging,
+    log_event
+)
+from database.warehouse import create_data_warehouse, deferred_indexes
+from database.loader import StarSchemaLoader
+from database.queries import (
+    load_baskets, load_transaction_totals, load_customer_rfm, load_daily_sales, load_product_daily_sales,
+    load_customer_products, load_customer_aggregates, store_shards, warehouse_version
+)
+from database.rollups import create_rollup_tables, refresh_rollups, query_sales
+from database.planner import check_query_plans
+import asyncio
 import io
+import json
+import logging
+import os
+import pstats
+import shutil
+import tempfile
+import time
 import traceback
 
-app = FastAPI(title="RetailIQ ML Backend")
+@asynccontextmanager
+async def lifespan(app):
+    # Jobs that were queued or running when the server stopped start again; with
+    # several workers (serve.py), only the first one requeues them
+    if os.environ.get('RETAILIQ_REQUEUE_JOBS', '1') == '1':
+        for job_id, kind in job_store.requeue_unfinished():
+            schedule_job(job_id, kind)
+    startup.ready()
+    yield
+    executor.shutdown()
+
+app = FastAPI(title="RetailIQ ML Backend", lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 # CORS - Allow React frontend
 app.add_middleware(
@@ -24,295 +83,954 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# zstd/gzip responses for clients that accept them
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+# Outermost, so request timings include compression; X-Profile headers only work with profiling on
+app.add_middleware(MetricsMiddleware, profiling=os.environ.get('RETAILIQ_PROFILING', '0') == '1')
+
+MODELS_DIR = os.environ.get(
+    'RETAILIQ_MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+RULE_STORE_DIR = os.path.join(MODELS_DIR, 'rule_store')
+SEGMENTATION_MODEL_PATH = os.path.join(MODELS_DIR, 'segmentation.pkl')
+RFM_STORE_PATH = os.path.join(MODELS_DIR, 'rfm_store.pkl')
+ANOMALY_MODEL_PATH = os.path.join(MODELS_DIR, 'anomaly.pkl')
+RECOMMENDER_PATH = os.path.join(MODELS_DIR, 'recommender.pkl')
+# The anomaly model is retrained on the next large enough batch once it is this old;
+# it is only ever trained on at least ANOMALY_MIN_RETRAIN_ROWS transactions
+ANOMALY_RETRAIN_SECONDS = float(os.environ.get('RETAILIQ_ANOMALY_RETRAIN_HOURS', 24)) * 3600
+ANOMALY_MIN_RETRAIN_ROWS = int(os.environ.get('RETAILIQ_ANOMALY_MIN_ROWS', 1000))
+JOBS_DB = os.environ.get('RETAILIQ_JOBS_DB', os.path.join(MODELS_DIR, 'jobs.db'))
+CACHE_DIR = os.environ.get('RETAILIQ_CACHE_DIR', os.path.join(MODELS_DIR, 'cache'))
+DATASETS_DIR = os.environ.get('RETAILIQ_DATASETS_DIR', os.path.join(MODELS_DIR, 'datasets'))
+WAREHOUSE_URL = os.environ.get(
+    'RETAILIQ_WAREHOUSE_URL', 'sqlite:///' + os.path.join(MODELS_DIR, 'retailiq_warehouse.db')
+)
+PROFILE_DIR = os.environ.get('RETAILIQ_PROFILE_DIR', os.path.join(MODELS_DIR, 'profiles'))
+# Largest request body accepted, measured after decompression
+MAX_REQUEST_BYTES = int(os.environ.get('RETAILIQ_MAX_REQUEST_MB', 1024)) * 1024 * 1024
+
+# One JSON line per request and background job on stderr
+configure_logging(os.environ.get('RETAILIQ_LOG_LEVEL', 'INFO'))
+
+# Stores updated by requests are shared by every worker of serve.py: writers
+# hold a file lock across load, update and save, and each process reloads a
+# store when another one saved it. The asyncio locks only queue this
+# process's own requests, so they do not tie up threads waiting on the file lock
+def load_rule_store():
+    if os.path.exists(os.path.join(RULE_STORE_DIR, 'state.pkl')):
+        return IncrementalRuleStore.load(RULE_STORE_DIR)
+    return IncrementalRuleStore()
+
+# Reloads itself from disk inside ``rule_store.sync``
+rule_store = load_rule_store()
+rule_store_lock = asyncio.Lock()
+
+def saved_version(path):
+    """Changes whenever a store file is saved"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+_rfm_store = {'version': None, 'model': None}
+rfm_store_lock = asyncio.Lock()
+
+def current_rfm_store():
+    """The saved RFM store, reloaded in this process when another one updates it"""
+    version = saved_version(RFM_STORE_PATH)
+    if _rfm_store['model'] is None or version != _rfm_store['version']:
+        _rfm_store['model'] = RFMStore.load(RFM_STORE_PATH) if version else RFMStore()
+        _rfm_store['version'] = version
+    return _rfm_store['model']
+
+_recommender = {'version': None, 'model': None}
+# Lookups read the index directly; the lock only serializes updates
+recommender_lock = asyncio.Lock()
+
+def current_recommender():
+    """The saved similarity index, reloaded in this process when another one updates it"""
+    version = saved_version(RECOMMENDER_PATH)
+    if _recommender['model'] is None or version != _recommender['version']:
+        _recommender['model'] = ItemSimilarityIndex.load(RECOMMENDER_PATH) if version else ItemSimilarityIndex()
+        _recommender['version'] = version
+    return _recommender['model']
+
+def warehouse_lock():
+    """Held while loading facts or rebuilding rollups: the star-schema loader assumes a single writer"""
+    return file_lock(os.path.join(MODELS_DIR, 'warehouse.lock'))
+
+_warehouse_engines = {}
+
+def warehouse_engine():
+    """Warehouse engine for the current process; pool workers each open their own"""
+    pid = os.getpid()
+    if pid not in _warehouse_engines:
+        engine = create_data_warehouse(WAREHOUSE_URL)
+        create_rollup_tables(engine)
+        _warehouse_engines[pid] = engine
+    return _warehouse_engines[pid]
+
+# CPU-bound analyses run in a process pool so the event loop stays responsive
+# One warehouse load at a time per process; warehouse_lock serializes them across processes
+executor = JobExecutor.from_env([
+    'clean-data', 'warehouse-load', 'market-basket', 'customer-segmentation', 'anomaly-detection',
+    'sales-forecast', 'sales-forecast-batch', 'jobs', 'shards'
+], default_concurrency={'warehouse-load': 1, 'shards': os.cpu_count() or 1}, default_timeouts={'warehouse-load': 3600, 'jobs': 3600},
+   profile_dir=PROFILE_DIR)
+
+async def run_analysis(name, fn, *args):
+    """Run an analysis function in the process pool, mapping timeouts to 504"""
+    try:
+        return await executor.run(name, fn, *args)
+    except asyncio.TimeoutError:
+        raise HTTPException(504, f"{name} timed out after {executor.timeout(name):.0f}s")
+
+# Bump CACHE_VERSION whenever an analysis changes its output for the same input
+CACHE_VERSION = 1
+result_cache = ResultCache(
+    CACHE_DIR,
+    max_memory_items=int(os.environ.get('RETAILIQ_CACHE_MEMORY_ITEMS', 128)),
+    max_disk_bytes=int(os.environ.get('RETAILIQ_CACHE_DISK_MB', 512)) * 1024 * 1024,
+    version=CACHE_VERSION
+)
+
+async def cached_analysis(name, payload, params, fn, *args, scope=None):
+    """Serve an analysis from the result cache, running it in the pool on a miss
+
+    Warehouse-scoped results are keyed on the scope and the warehouse version,
+    so loading new facts invalidates them.
+    """
+    if scope is not None:
+        version = await asyncio.to_thread(warehouse_version, warehouse_engine())
+        params = dict(params, scope=scope, warehouse_version=version)
+    with stage('cache'):
+        key = await asyncio.to_thread(result_cache.make_key, name, payload_key(payload), params)
+        result = await asyncio.to_thread(result_cache.get, key)
+    if result is None:
+        # Sharded analyses are coroutines that fan out to the pool themselves
+        result = await fn(*args) if asyncio.iscoroutinefunction(fn) else await run_analysis(name, fn, *args)
+        with stage('cache'):
+            await asyncio.to_thread(result_cache.set, key, result)
+    return result
+
+def payload_key(payload):
+    """Payload for cache keys, with Arrow-decoded frames replaced by their body digest"""
+    if isinstance(payload, pd.DataFrame):
+        return {'arrow_digest': payload.attrs['digest']}
+    if isinstance(payload, dict):
+        return {key: payload_key(value) for key, value in payload.items()}
+    return payload
+
+async def parse_request(request, model, frame_field):
+    """Request model from a JSON body, or from an Arrow IPC body plus query options.
+
+    JSON is validated straight from bytes by pydantic. An Arrow body is
+    decoded into a DataFrame for ``frame_field`` (or the field named by the
+    ``field`` query parameter) without building per-row dicts; the other
+    options come from the query string. Both may be zstd or gzip encoded.
+    """
+    with stage('parse'):
+        try:
+            body = await asyncio.to_thread(
+                decompress, await request.body(), request.headers.get('content-encoding'), MAX_REQUEST_BYTES
+            )
+        except PayloadTooLarge as e:
+            raise HTTPException(413, str(e))
+        except (ValueError, OSError) as e:
+            raise HTTPException(415, str(e))
+        content_type = media_type(request.headers.get('content-type'))
+        try:
+            if content_type not in ARROW_TYPES:
+                return model.model_validate_json(body or b'{}')
+            options = dict(request.query_params)
+            field = options.pop('field', frame_field)
+            if field not in model.model_fields:
+                raise HTTPException(400, f"Unknown field '{field}'")
+            try:
+                frame = await asyncio.to_thread(read_arrow, body, content_type)
+            except (pa.ArrowInvalid, OSError) as e:
+                raise HTTPException(400, f"Invalid Arrow IPC body: {e}")
+            # Validate the options with an empty placeholder, then attach the frame as is
+            return model(**dict(options, **{field: []})).model_copy(update={field: frame})
+        except ValidationError as e:
+            raise HTTPException(422, jsonable_encoder(e.errors()))
+
+def wants_arrow(request):
+    return ARROW_STREAM in request.headers.get('accept', '')
+
+def require_dataset(dataset_id):
+    """404 for a dataset ID that does not exist; returns its directory"""
+    if dataset_id is None:
+        return None
+    try:
+        return dataset_path(DATASETS_DIR, dataset_id)
+    except KeyError:
+        raise HTTPException(404, f"Dataset '{dataset_id}' not found")
+
+def report_progress(progress, fraction, message):
+    """Forward a progress update to the job runner, if the analysis runs as a job"""
+    if progress is not None:
+        progress(fraction, message)
 
 # ================ Models ================
+class WarehouseScope(BaseModel):
+    """Slice of fact_sales to analyse instead of a JSON payload"""
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    store: Optional[str] = None
+    category: Optional[str] = None
+
 class TransactionData(BaseModel):
+    transactions: List[Dict[str, Any]] = []
+    scope: Optional[WarehouseScope] = None
+    # Read from a saved Parquet dataset (filtered by scope) instead
+    dataset_id: Optional[str] = None
+
+class MarketBasketRequest(TransactionData):
+    min_support: float = 0.03
+    max_len: Optional[int] = None
+    incremental: bool = False
+    # 'store' or 'region': count itemsets per shard in parallel, then merge
+    shard_by: Optional[str] = None
+    min_confidence: float = 0.2
+    # Returned rules: filtered by lift, sorted (descending) and paged; no limit returns them all
+    sort_by: str = 'lift'
+    min_lift: Optional[float] = None
+    offset: int = 0
+    limit: Optional[int] = 100
+
+class RuleStoreRebuildRequest(BaseModel):
+    min_support: Optional[float] = None
+    max_len: Optional[int] = None
+
+class AnomalyRequest(TransactionData):
+    contamination: float = 0.1
+    retrain: bool = False
+    # Returned anomalies: filtered, sorted most anomalous first and paged; no limit returns them all
+    sort_by: str = 'anomaly_score'
+    severity: Optional[str] = None
+    anomaly_type: Optional[str] = None
+    max_score: Optional[float] = None
+    offset: int = 0
+    limit: Optional[int] = 100
+
+class AnomalyScoreRequest(BaseModel):
     transactions: List[Dict[str, Any]]
+    contamination: float = 0.1
 
 class CustomerData(BaseModel):
-    customers: List[Dict[str, Any]]
+    customers: List[Dict[str, Any]] = []
+    transactions: List[Dict[str, Any]] = []
+    n_clusters: int = 4
+    refit: bool = False
+    incremental: bool = False
+    scope: Optional[WarehouseScope] = None
+    # 'store' or 'region': aggregate customers per shard in parallel, then merge
+    shard_by: Optional[str] = None
+
+class RecommendationRequest(BaseModel):
+    customer: Dict[str, Any] = {}
+    # Products in the current basket, used alongside the customer's history
+    items: List[str] = []
+    limit: int = 3
+    metric: str = 'cosine'
+
+class RecommenderIndexRequest(BaseModel):
+    transactions: List[Dict[str, Any]] = []
+    # Also ingest facts loaded into the warehouse since the last update
+    warehouse: bool = False
 
 class ForecastRequest(BaseModel):
     product_id: str
-    historical_sales: List[Dict[str, Any]]
+    historical_sales: List[Dict[str, Any]] = []
+    scope: Optional[WarehouseScope] = None
+
+class BatchForecastRequest(BaseModel):
+    # Rows of product_id, date and sales; ignored when a scope is given
+    sales: List[Dict[str, Any]] = []
+    product_ids: Optional[List[str]] = None
+    seasonal: bool = True
+    scope: Optional[WarehouseScope] = None
+    dataset_id: Optional[str] = None
+    # 'store' or 'region': sum daily sales per shard in parallel, then merge
+    shard_by: Optional[str] = None
 
 # ================ 1. DATA CLEANING ================
-@app.post("/api/clean-data")
-async def clean_data(file: UploadFile = File(...)):
-    """Clean uploaded dataset"""
-    try:
-        contents = await file.read()
-        
-        # Read file based on extension
-        if file.filename.endswith('.csv'):
+def clean_uploaded_data(contents, filename, load_warehouse=False, save_dataset=True):
+    """Clean an uploaded CSV/Excel file held in memory"""
+    # Read file based on extension
+    with stage('read'):
+        if filename.endswith('.csv'):
             df = pd.read_csv(io.BytesIO(contents))
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(contents))
         else:
-            raise HTTPException(400, "Unsupported file format. Use CSV or Excel.")
-        
-        original_shape = df.shape
+            df = pd.read_excel(io.BytesIO(contents))
+    
+    original_shape = df.shape
+    add_rows(original_shape[0])
+    with stage('clean'):
         missing_before = df.isnull().sum().sum()
-        
+    
         # Clean data
         df = df.drop_duplicates()
-        
+    
         # Handle missing values
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        for col in numeric_cols:
-            df[col] = df[col].fillna(df[col].median())
-        
-        categorical_cols = df.select_dtypes(include=['object']).columns
-        for col in categorical_cols:
-            if not df[col].mode().empty:
-                df[col] = df[col].fillna(df[col].mode()[0])
-            else:
-                df[col] = df[col].fillna('Unknown')
-        
+        df = fill_missing(df)
+    
         # Normalize column names
         df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('[^a-z0-9_]', '', regex=True)
-        
-        missing_after = df.isnull().sum().sum()
-        
-        return {
-            "success": True,
-            "original_rows": int(original_shape[0]),
-            "cleaned_rows": int(df.shape[0]),
-            "columns": list(df.columns),
-            "missing_before": int(missing_before),
-            "missing_after": int(missing_after),
-            "duplicates_removed": int(original_shape[0] - df.shape[0]),
-            "sample": df.head(5).to_dict('records')
-        }
     
+    missing_after = df.isnull().sum().sum()
+    
+    report = {
+        "success": True,
+        "original_rows": int(original_shape[0]),
+        "cleaned_rows": int(df.shape[0]),
+        "columns": list(df.columns),
+        "missing_before": int(missing_before),
+        "missing_after": int(missing_after),
+        "duplicates_removed": int(original_shape[0] - df.shape[0]),
+        "sample": df.head(5).to_dict('records')
+    }
+    
+    if save_dataset:
+        with stage('dataset'):
+            writer = create_dataset_writer(DATASETS_DIR, filename)
+            writer.write(df)
+            report["dataset_id"] = writer.close()["dataset_id"]
+    if load_warehouse:
+        with stage('warehouse'), warehouse_lock():
+            loader = StarSchemaLoader(warehouse_engine())
+            loader.load(df)
+            report["warehouse"] = loader.stats
+            report["rollups"] = refresh_rollups(warehouse_engine())
+    return report
+
+def clean_file(path, chunksize, load_warehouse=False, save_dataset=True, filename=None):
+    """Streaming clean, writing each cleaned chunk to a dataset and/or the warehouse"""
+    writer = create_dataset_writer(DATASETS_DIR, filename) if save_dataset else None
+    if not load_warehouse:
+        with stage('clean'):
+            report = clean_file_streaming(path, chunksize=chunksize, sink=writer)
+    else:
+        with warehouse_lock():
+            loader = StarSchemaLoader(warehouse_engine())
+            
+            def sink(chunk):
+                if writer is not None:
+                    writer.write(chunk)
+                loader.load(chunk)
+            
+            # Large files: build the fact indexes once at the end instead of per row
+            with stage('clean'), deferred_indexes(warehouse_engine()):
+                report = clean_file_streaming(path, chunksize=chunksize, sink=sink)
+            report["warehouse"] = loader.stats
+            with stage('rollups'):
+                report["rollups"] = refresh_rollups(warehouse_engine())
+    if writer is not None:
+        report["dataset_id"] = writer.close()["dataset_id"]
+    add_rows(report["original_rows"])
+    return report
+
+@app.post("/api/clean-data")
+async def clean_data(file: UploadFile = File(...), streaming: bool = False, chunksize: int = 100_000,
+                     load_warehouse: bool = False, save_dataset: bool = True):
+    """Clean uploaded dataset"""
+    if not file.filename.endswith(('.csv', '.xlsx', '.xls')):
+        raise HTTPException(400, "Unsupported file format. Use CSV or Excel.")
+    job_name = 'warehouse-load' if load_warehouse else 'clean-data'
+    if streaming:
+        return await clean_data_streaming(file, chunksize, job_name, load_warehouse, save_dataset)
+    
+    try:
+        contents = await file.read()
+        return await run_analysis(
+            job_name, clean_uploaded_data, contents, file.filename, load_warehouse, save_dataset
+        )
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"ERROR in clean-data: {str(e)}")
-        traceback.print_exc()
+        log_event('analysis_error', logging.ERROR, analysis='clean-data', error=str(e),
+                  traceback=traceback.format_exc())
         raise HTTPException(500, f"Data cleaning error: {str(e)}")
 
-# ================ 2. MARKET BASKET ANALYSIS ================
-@app.post("/api/market-basket")
-async def market_basket_analysis(data: TransactionData):
-    """Apriori algorithm for association rules"""
+async def clean_data_streaming(file: UploadFile, chunksize: int, job_name: str, load_warehouse: bool,
+                               save_dataset: bool):
+    """Spool the upload to disk and clean it chunk by chunk"""
+    suffix = os.path.splitext(file.filename)[1]
+    spooled = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
     try:
-        transactions = data.transactions
-        print(f"Received {len(transactions)} transactions")
-        
-        # Extract items from transactions
-        transaction_list = []
-        for trans in transactions:
-            items = []
-            if isinstance(trans.get('items'), list):
-                items = [item.get('product_name') for item in trans['items'] if item.get('product_name')]
-            transaction_list.append(items)
-        
-        # Remove empty transactions
-        transaction_list = [t for t in transaction_list if len(t) > 0]
-        
-        if len(transaction_list) < 2:
-            return {
-                "bundles": [],
-                "cross_sell_strategy": "Insufficient transaction data for analysis",
-                "layout_recommendations": "Import more transaction data with product items"
-            }
-        
-        # Apply Apriori
-        te = TransactionEncoder()
-        te_ary = te.fit(transaction_list).transform(transaction_list)
-        df = pd.DataFrame(te_ary, columns=te.columns_)
-        
-        frequent_itemsets = apriori(df, min_support=0.03, use_colnames=True)
-        
-        if len(frequent_itemsets) == 0:
-            return {
-                "bundles": [],
-                "cross_sell_strategy": "No frequent patterns found. Lower support threshold or add more data.",
-                "layout_recommendations": "Collect more transaction data"
-            }
-        
-        # Generate rules
-        rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=0.2)
-        rules = rules.sort_values('lift', ascending=False)
-        
-        # Create bundles from top rules
-        bundles = []
-        for i, row in rules.head(4).iterrows():
-            products_in_bundle = list(row['antecedents']) + list(row['consequents'])
-            bundles.append({
-                "name": f"Bundle: {' + '.join(products_in_bundle[:3])}",
-                "products": [{"name": p, "price": 99.99} for p in products_in_bundle],
-                "discount": int(15 + row['lift'] * 5),
-                "reasoning": f"Lift: {row['lift']:.2f}, Confidence: {row['confidence']:.0%}",
-                "confidence": float(row['confidence']),
-                "lift": float(row['lift']),
-                "frequency": int(row['support'] * len(transaction_list)),
-                "originalPrice": f"{len(products_in_bundle) * 99.99:.2f}",
-                "bundlePrice": f"{len(products_in_bundle) * 99.99 * 0.85:.2f}"
-            })
-        
+        with spooled:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, spooled, 1024 * 1024)
+        return await run_analysis(
+            job_name, clean_file, spooled.name, chunksize, load_warehouse, save_dataset, file.filename
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_event('analysis_error', logging.ERROR, analysis='clean-data', streaming=True, error=str(e),
+                  traceback=traceback.format_exc())
+        raise HTTPException(500, f"Data cleaning error: {str(e)}")
+    finally:
+        os.unlink(spooled.name)
+
+# ================ 2. MARKET BASKET ANALYSIS ================
+def market_basket_result(frequent_itemsets, n_baskets, min_confidence=0.2, sort_by='lift', min_lift=None, offset=0,
+                         limit=100, progress=None):
+    """Rules, bundles and the requested page of rules from mined itemsets"""
+    if n_baskets < 2:
         return {
-            "bundles": bundles,
-            "cross_sell_strategy": f"Identified {len(rules)} association rules from {len(transaction_list)} transactions",
-            "layout_recommendations": "Position high-lift product pairs near each other in store"
+            "bundles": [],
+            "rules": [],
+            "total_rules": 0,
+            "cross_sell_strategy": "Insufficient transaction data for analysis",
+            "layout_recommendations": "Import more transaction data with product items"
+        }
+    if len(frequent_itemsets) == 0:
+        return {
+            "bundles": [],
+            "rules": [],
+            "total_rules": 0,
+            "cross_sell_strategy": "No frequent patterns found. Lower support threshold or add more data.",
+            "layout_recommendations": "Collect more transaction data"
         }
     
+    # Generate rules
+    with stage('rules'):
+        rules = generate_association_rules(frequent_itemsets, min_confidence=min_confidence)
+    if len(rules) == 0:
+        return {
+            "bundles": [],
+            "rules": [],
+            "total_rules": 0,
+            "cross_sell_strategy": f"Found {len(frequent_itemsets)} frequent itemsets but no multi-item rules. Lower support threshold or add more data.",
+            "layout_recommendations": "Collect more transaction data"
+        }
+    report_progress(progress, 0.9, f"Generated {len(rules)} association rules")
+    
+    with stage('format'):
+        rules = rules_frame(rules)
+        # Create bundles from top rules
+        top, _ = query_rules(rules, 'lift', limit=4)
+        products = top['antecedent'] + top['consequent']
+        discounts = (15 + top['lift'] * 5).astype(int)
+        frequencies = (top['support'] * n_baskets).astype(int)
+        bundles = [{
+            "name": f"Bundle: {' + '.join(products_in_bundle[:3])}",
+            "products": [{"name": p, "price": 99.99} for p in products_in_bundle],
+            "discount": int(discount),
+            "reasoning": f"Lift: {lift:.2f}, Confidence: {confidence:.0%}",
+            "confidence": float(confidence),
+            "lift": float(lift),
+            "frequency": int(frequency),
+            "originalPrice": f"{len(products_in_bundle) * 99.99:.2f}",
+            "bundlePrice": f"{len(products_in_bundle) * 99.99 * 0.85:.2f}"
+        } for products_in_bundle, discount, lift, confidence, frequency in zip(
+            products, discounts, top['lift'], top['confidence'], frequencies
+        )]
+        
+        page, total_rules = query_rules(rules, sort_by, min_lift=min_lift, offset=offset, limit=limit)
+        page = page.to_dict('records')
+    
+    return {
+        "bundles": bundles,
+        "rules": page,
+        "total_rules": total_rules,
+        "offset": offset,
+        "limit": limit,
+        "cross_sell_strategy": f"Identified {len(rules)} association rules from {n_baskets} transactions",
+        "layout_recommendations": "Position high-lift product pairs near each other in store"
+    }
+
+def run_market_basket(transactions, min_support=0.03, max_len=None, incremental=False, scope=None,
+                      dataset_id=None, min_confidence=0.2, sort_by='lift', min_lift=None, offset=0, limit=100,
+                      progress=None):
+    """Sparse Eclat itemset mining for association rules"""
+    try:
+        if dataset_id is not None:
+            # Only the transaction and product columns are read from Parquet
+            with stage('load'):
+                transaction_list, transaction_ids = load_dataset_baskets(dataset_path(DATASETS_DIR, dataset_id), scope)
+        elif scope is not None:
+            # Baskets come straight from fact_sales
+            with stage('load'):
+                transaction_list, transaction_ids = load_baskets(warehouse_engine(), scope)
+        else:
+            log_event('analysis_input', analysis='market-basket', transactions=len(transactions))
+            
+            # Product-name baskets, dropping transactions without items
+            with stage('encode'):
+                transaction_list, transaction_ids = transaction_baskets(transactions)
+        add_rows(len(transaction_list))
+        report_progress(progress, 0.1, f"Extracted {len(transaction_list)} baskets")
+        
+        if incremental:
+            # Only transaction IDs the store has not seen are counted; the file
+            # lock keeps other workers from saving in between
+            with rule_store.sync(RULE_STORE_DIR):
+                with stage('ingest'):
+                    ingested, rebuilt = rule_store.ingest(transaction_list, transaction_ids)
+                    rule_store.save(RULE_STORE_DIR)
+                n_baskets = rule_store.n_baskets
+                with stage('mine'):
+                    frequent_itemsets = rule_store.frequent_itemsets(min_support, max_len)
+            log_event('rule_store_ingest', transactions=ingested, rebuilt=rebuilt)
+        else:
+            n_baskets = len(transaction_list)
+            if n_baskets < 2:
+                # Nothing to mine
+                return market_basket_result(pd.DataFrame(columns=['support', 'itemsets']), n_baskets)
+            # Mine frequent itemsets on the sparse encoding
+            with stage('mine'):
+                frequent_itemsets = mine_frequent_itemsets(
+                    transaction_list, min_support=min_support, max_len=max_len
+                )
+        report_progress(progress, 0.7, f"Found {len(frequent_itemsets)} frequent itemsets")
+        return market_basket_result(
+            frequent_itemsets, n_baskets, min_confidence, sort_by, min_lift, offset, limit, progress
+        )
+    
     except Exception as e:
-        print(f"ERROR in market-basket: {str(e)}")
-        traceback.print_exc()
+        if incremental and isinstance(e, ValueError):
+            # Input the rule store refuses, e.g. transactions without IDs; the handler answers 400
+            raise
+        log_event('analysis_error', logging.ERROR, analysis='market-basket', error=str(e),
+                  traceback=traceback.format_exc())
         return {
             "bundles": [],
+            "rules": [],
+            "total_rules": 0,
             "cross_sell_strategy": f"Analysis error: {str(e)}",
             "layout_recommendations": "Check transaction data format"
         }
 
+def check_rule_query(min_support=None, max_len=None):
+    """Raise ValueError when the rule store cannot answer these thresholds without a rebuild"""
+    with rule_store.sync(RULE_STORE_DIR):
+        rule_store.check_query(min_support, max_len)
+
+@app.post("/api/market-basket")
+async def market_basket_analysis(request: Request):
+    """Sparse Eclat itemset mining for association rules"""
+    data = await parse_request(request, MarketBasketRequest, 'transactions')
+    scope = jsonable_encoder(data.scope)
+    require_dataset(data.dataset_id)
+    if data.sort_by not in RULE_SORT_COLUMNS:
+        raise HTTPException(400, f"Unknown sort column '{data.sort_by}'. Use one of: {', '.join(RULE_SORT_COLUMNS)}")
+    if data.incremental and data.shard_by is not None:
+        raise HTTPException(400, "The incremental rule store cannot be sharded")
+    rule_options = (data.min_confidence, data.sort_by, data.min_lift, data.offset, data.limit)
+    params = {'min_support': data.min_support, 'max_len': data.max_len, 'dataset_id': data.dataset_id,
+              'min_confidence': data.min_confidence, 'sort_by': data.sort_by, 'min_lift': data.min_lift,
+              'offset': data.offset, 'limit': data.limit}
+    if data.shard_by is not None:
+        try:
+            result = await cached_analysis(
+                'market-basket', data.transactions, dict(params, shard_by=data.shard_by),
+                run_sharded_market_basket, data.shard_by, data.transactions, scope, data.dataset_id,
+                data.min_support, data.max_len, *rule_options, scope=scope
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    elif data.incremental:
+        # The rule store lives in this process; update it on a thread instead
+        async with rule_store_lock:
+            try:
+                await asyncio.to_thread(check_rule_query, data.min_support, data.max_len)
+                result = await asyncio.to_thread(
+                    run_market_basket, data.transactions, data.min_support, data.max_len, True, scope,
+                    data.dataset_id, *rule_options
+                )
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+    else:
+        result = await cached_analysis(
+            'market-basket', data.transactions, params,
+            run_market_basket, data.transactions, data.min_support, data.max_len, False, scope, data.dataset_id,
+            *rule_options, scope=scope
+        )
+    if wants_arrow(request):
+        # Just the page of rules, with the total in the schema metadata
+        page = pd.DataFrame(result['rules'], columns=RULE_COLUMNS)
+        body = await asyncio.to_thread(
+            write_arrow, page, {'total_rules': result['total_rules'], 'offset': data.offset}
+        )
+        return Response(body, media_type=ARROW_STREAM)
+    return result
+
+def synced_rules(min_support=None, min_confidence=0.2):
+    with rule_store.sync(RULE_STORE_DIR):
+        return rule_store.rules(min_support, min_confidence)
+
+def rebuild_rules(min_support=None, max_len=None):
+    with rule_store.sync(RULE_STORE_DIR):
+        rule_store.rebuild(min_support, max_len)
+        rule_store.save(RULE_STORE_DIR)
+
+@app.get("/api/market-basket/rules")
+async def market_basket_rules(request: Request, min_support: Optional[float] = None, min_confidence: float = 0.2,
+                              min_lift: Optional[float] = None, sort_by: str = 'lift', offset: int = 0,
+                              limit: Optional[int] = 100):
+    """Current rules from the incremental rule store, without re-mining"""
+    try:
+        async with rule_store_lock:
+            rules = await asyncio.to_thread(synced_rules, min_support, min_confidence)
+        page, total_rules = await asyncio.to_thread(
+            query_rules, rules_frame(rules), sort_by, min_lift=min_lift, offset=offset, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    
+    if wants_arrow(request):
+        body = await asyncio.to_thread(write_arrow, page, {'total_rules': total_rules, 'offset': offset})
+        return Response(body, media_type=ARROW_STREAM)
+    return {
+        "rules": page.to_dict('records'),
+        "total_rules": total_rules,
+        "offset": offset,
+        "limit": limit,
+        "total_transactions": rule_store.n_baskets,
+        "min_support": rule_store.min_support if min_support is None else min_support
+    }
+
+@app.post("/api/market-basket/rebuild")
+async def rebuild_rule_store(request: RuleStoreRebuildRequest):
+    """Full recount of the rule store, required after lowering thresholds"""
+    async with rule_store_lock:
+        await asyncio.to_thread(rebuild_rules, request.min_support, request.max_len)
+    return {
+        "success": True,
+        "total_transactions": rule_store.n_baskets,
+        "min_support": rule_store.min_support,
+        "max_len": rule_store.max_len,
+        "tracked_itemsets": len(rule_store.itemset_counts)
+    }
+
 # ================ 3. CUSTOMER SEGMENTATION ================
-@app.post("/api/customer-segmentation")
-async def customer_segmentation(data: CustomerData):
-    """KMeans clustering"""
+_segmentation_model = {'version': None, 'model': None}
+
+def segmentation_model_version():
+    """Changes whenever the saved segmentation model is retrained"""
     try:
-        customers = data.customers
-        print(f"Received {len(customers)} customers")
-        
-        if len(customers) < 4:
-            return {
-                "segment_insights": [{
-                    "segment": "insufficient_data",
-                    "characteristics": "Not enough customers for segmentation",
-                    "recommendation": "Import more customer data"
-                }],
-                "overall_strategy": "Collect more customer data before segmentation"
-            }
-        
-        df = pd.DataFrame(customers)
-        
-        # Create RFM features
-        df['recency'] = pd.to_numeric(df.get('recency', 180), errors='coerce').fillna(180)
-        df['frequency'] = pd.to_numeric(df.get('total_purchases', 5), errors='coerce').fillna(5)
-        df['monetary'] = pd.to_numeric(df.get('total_spent', 500), errors='coerce').fillna(500)
-        
-        features = df[['recency', 'frequency', 'monetary']].values
-        
-        # Standardize
-        scaler = StandardScaler()
-        features_scaled = scaler.fit_transform(features)
-        
-        # KMeans
-        n_clusters = min(4, len(customers))
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        df['cluster'] = kmeans.fit_predict(features_scaled)
-        
-        # Generate insights
-        insights = {
-            "segment_insights": [
-                {
-                    "segment": "premium",
-                    "characteristics": "High-value customers with frequent purchases",
-                    "recommendation": "Offer VIP programs and exclusive access"
-                },
-                {
-                    "segment": "regular",
-                    "characteristics": "Consistent shoppers with moderate spending",
-                    "recommendation": "Implement loyalty rewards"
-                },
-                {
-                    "segment": "budget",
-                    "characteristics": "Price-sensitive customers",
-                    "recommendation": "Target with promotional campaigns"
-                },
-                {
-                    "segment": "at_risk",
-                    "characteristics": "Declining engagement customers",
-                    "recommendation": "Re-engagement campaigns needed"
-                }
-            ][:n_clusters],
-            "overall_strategy": f"Segmented {len(customers)} customers into {n_clusters} groups using KMeans clustering"
+        return os.stat(SEGMENTATION_MODEL_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def current_segmentation_model():
+    """The saved segmentation model, reloaded in this process when another one retrains it"""
+    version = segmentation_model_version()
+    if version != _segmentation_model['version']:
+        _segmentation_model['model'] = SegmentationModel.load(SEGMENTATION_MODEL_PATH) if version else None
+        _segmentation_model['version'] = version
+    return _segmentation_model['model']
+
+def segment_customers(df, n_clusters=4, refit=False, progress=None):
+    """Segments and profiles for RFM features, reusing the saved model unless refitting"""
+    if len(df) < 4:
+        return {
+            "segment_insights": [{
+                "segment": "insufficient_data",
+                "characteristics": "Not enough customers for segmentation",
+                "recommendation": "Import more customer data"
+            }],
+            "customer_segments": [],
+            "overall_strategy": "Collect more customer data before segmentation"
         }
+    
+    add_rows(len(df))
+    # MiniBatchKMeans depends on row order, so fit in customer order: sharded
+    # and unsharded features then give the same segments
+    order = np.argsort(df['customer_id'].astype(str).to_numpy(), kind='stable')
+    df = df.iloc[order].reset_index(drop=True)
+    features = df[RFM_FEATURES].values
+    report_progress(progress, 0.3, "Built RFM features")
+    
+    # Reuse the saved model; new customers are assigned to its centroids
+    model = None if refit else current_segmentation_model()
+    if model is not None and model.n_clusters != min(n_clusters, len(df)):
+        model = None
+    trained = model is None
+    if trained:
+        with stage('fit'):
+            model = SegmentationModel(n_clusters=min(n_clusters, len(df))).fit(features)
+            model.save(SEGMENTATION_MODEL_PATH)
+        report_progress(progress, 0.8, f"Trained a {model.n_clusters}-segment model")
+    
+    with stage('predict'):
+        labels = model.predict(features)
+    names = np.array(model.segment_names())
+    assignments = pd.DataFrame({
+        "customer_id": df['customer_id'].to_numpy(),
+        "segment": names[labels],
+        "cluster": labels,
+    })
+    report_progress(progress, 0.9, f"Assigned {len(df)} customers to {model.n_clusters} segments")
+    
+    return {
+        "segment_insights": model.profiles(labels),
+        "customer_segments": assignments.to_dict('records'),
+        "overall_strategy": (
+            f"Segmented {len(df)} customers into {model.n_clusters} groups using "
+            f"{'a newly trained' if trained else 'the saved'} MiniBatchKMeans model"
+        )
+    }
+
+def run_customer_segmentation(customers, n_clusters=4, refit=False, scope=None, transactions=None,
+                              incremental=False, progress=None):
+    """MiniBatchKMeans segmentation with a persisted, reusable model"""
+    try:
+        # RFM features, from the most detailed source given
+        with stage('features'):
+            if scope is not None:
+                df = load_customer_rfm(warehouse_engine(), scope)
+            elif incremental:
+                with file_lock(RFM_STORE_PATH + '.lock'):
+                    rfm_store = current_rfm_store()
+                    ingested = rfm_store.update(pd.DataFrame(transactions if transactions is not None else []))
+                    rfm_store.save(RFM_STORE_PATH)
+                    _rfm_store['version'] = saved_version(RFM_STORE_PATH)
+                    df = rfm_store.features()
+                log_event('rfm_store_ingest', transactions=ingested)
+            elif transactions is not None and len(transactions) > 0:
+                log_event('analysis_input', analysis='customer-segmentation', transactions=len(transactions))
+                df = calculate_rfm_features(pd.DataFrame(transactions))
+            else:
+                log_event('analysis_input', analysis='customer-segmentation', customers=len(customers))
+                df = calculate_rfm_features(pd.DataFrame(customers))
         
-        return insights
+        return segment_customers(df, n_clusters, refit, progress)
     
     except Exception as e:
-        print(f"ERROR in customer-segmentation: {str(e)}")
-        traceback.print_exc()
+        log_event('analysis_error', logging.ERROR, analysis='customer-segmentation', error=str(e),
+                  traceback=traceback.format_exc())
         return {
             "segment_insights": [{
                 "segment": "error",
                 "characteristics": str(e),
                 "recommendation": "Check customer data format"
             }],
+            "customer_segments": [],
             "overall_strategy": "Analysis failed - review data"
         }
 
+@app.post("/api/customer-segmentation")
+async def customer_segmentation(request: Request):
+    """MiniBatchKMeans segmentation with a persisted, reusable model"""
+    data = await parse_request(request, CustomerData, 'customers')
+    scope = jsonable_encoder(data.scope)
+    if data.shard_by is not None:
+        if data.incremental:
+            raise HTTPException(400, "The incremental RFM store cannot be sharded")
+        if scope is None and len(data.transactions) == 0:
+            raise HTTPException(400, "Sharded segmentation needs transactions or a warehouse scope")
+        args = (data.shard_by, data.transactions, scope, data.n_clusters, data.refit)
+        try:
+            if data.refit:
+                return await run_sharded_segmentation(*args)
+            return await cached_analysis(
+                'customer-segmentation', {'transactions': data.transactions},
+                {'n_clusters': data.n_clusters, 'model': segmentation_model_version(), 'shard_by': data.shard_by},
+                run_sharded_segmentation, *args, scope=scope
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    args = (data.customers, data.n_clusters, data.refit, scope, data.transactions)
+    if data.incremental:
+        # The RFM store lives in this process; update it on a thread instead
+        async with rfm_store_lock:
+            return await asyncio.to_thread(run_customer_segmentation, *args, True)
+    if data.refit:
+        return await run_analysis('customer-segmentation', run_customer_segmentation, *args)
+    # Assignments depend on the saved model, so retraining invalidates them
+    return await cached_analysis(
+        'customer-segmentation', {'customers': data.customers, 'transactions': data.transactions},
+        {'n_clusters': data.n_clusters, 'model': segmentation_model_version()},
+        run_customer_segmentation, *args, scope=scope
+    )
+
 # ================ 4. ANOMALY DETECTION ================
-@app.post("/api/anomaly-detection")
-async def anomaly_detection(data: TransactionData):
-    """Isolation Forest for anomalies"""
+_anomaly_model = {'version': None, 'model': None}
+
+def anomaly_model_version():
+    """Changes whenever the saved anomaly model is retrained"""
+    try:
+        return os.stat(ANOMALY_MODEL_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def anomaly_model_stale(version):
+    """Whether the model saved at ``version`` (its mtime) is due for retraining, or missing"""
+    return version is None or time.time() - version / 1e9 > ANOMALY_RETRAIN_SECONDS
+
+def anomaly_model_lock():
+    """Held while checking, training and saving the anomaly model, so one worker retrains it at a time"""
+    return file_lock(ANOMALY_MODEL_PATH + '.lock')
+
+def current_anomaly_model():
+    """The saved anomaly model, reloaded in this process when another one retrains it"""
+    version = anomaly_model_version()
+    if version != _anomaly_model['version']:
+        _anomaly_model['model'] = AnomalyModel.load(ANOMALY_MODEL_PATH) if version else None
+        _anomaly_model['version'] = version
+    return _anomaly_model['model']
+
+ANOMALY_COLUMNS = ['transaction_id', 'anomaly_type', 'severity', 'reason', 'anomaly_score', 'recommendation']
+
+def run_anomaly_detection(transactions, contamination=0.1, scope=None, retrain=False, offset=0, limit=100,
+                          dataset_id=None, sort_by='anomaly_score', severity=None, anomaly_type=None, max_score=None,
+                          progress=None):
+    """Multi-feature Isolation Forest scoring with a persisted model"""
     try:
-        transactions = data.transactions
-        print(f"Analyzing {len(transactions)} transactions for anomalies")
+        with stage('load'):
+            if dataset_id is not None:
+                df = load_dataset_transactions(dataset_path(DATASETS_DIR, dataset_id), scope)
+            elif scope is not None:
+                df = load_transaction_totals(warehouse_engine(), scope)
+            else:
+                df = pd.DataFrame(transactions)
+        add_rows(len(df))
+        log_event('analysis_input', analysis='anomaly-detection', transactions=len(df))
         
-        if len(transactions) < 10:
+        if len(df) < 10:
             return {
                 "anomalous_transactions": [],
+                "total_anomalies": 0,
                 "patterns_detected": ["Insufficient data for anomaly detection"],
                 "fraud_risk_score": 0,
                 "investigation_priority": "Low"
             }
         
-        df = pd.DataFrame(transactions)
-        
-        # Prepare features
-        df['total_amount'] = pd.to_numeric(df.get('total_amount', 0), errors='coerce').fillna(0)
-        df['transaction_id'] = df.get('transaction_id', df.index.astype(str))
+        # Train once and reuse; retrain when asked or when the model is stale,
+        # and only on a batch large enough to stand for normal traffic
+        with anomaly_model_lock():
+            model = current_anomaly_model()
+            if retrain or anomaly_model_stale(anomaly_model_version()):
+                if len(df) >= ANOMALY_MIN_RETRAIN_ROWS:
+                    with stage('fit'):
+                        model = AnomalyModel().fit(df)
+                        model.save(ANOMALY_MODEL_PATH)
+                    report_progress(progress, 0.5, f"Trained anomaly model on {model.n_trained} transactions")
+                elif model is None:
+                    raise ModelNotTrained(
+                        f"No anomaly model trained yet; training needs at least {ANOMALY_MIN_RETRAIN_ROWS} "
+                        f"transactions, got {len(df)}"
+                    )
+                else:
+                    log_event('anomaly_retrain_skipped', logging.WARNING, transactions=len(df),
+                              min_rows=ANOMALY_MIN_RETRAIN_ROWS)
         
-        features = df[['total_amount']].values
+        with stage('score'):
+            scored = model.score(df, contamination)
+        report_progress(progress, 0.8, "Scored transactions")
         
-        # Apply Isolation Forest
-        iso = IsolationForest(contamination=0.1, random_state=42)
-        df['anomaly'] = iso.fit_predict(features)
-        df['anomaly_score'] = iso.score_samples(features)
+        with stage('format'):
+            # Every flagged transaction, most anomalous first, one page at a time
+            anomalies = scored[scored['is_anomaly']]
+            page, matching = query_anomalies(scored, sort_by, severity, anomaly_type, max_score, offset, limit)
+            anomalous_transactions = page[['transaction_id', 'anomaly_type', 'severity', 'reason']].assign(
+                anomaly_score=page['anomaly_score'].round(4),
+                recommendation="Review transaction and verify authenticity"
+            ).to_dict('records')
         
-        # Get anomalies
-        anomalies = df[df['anomaly'] == -1].head(10)
-        
-        anomalous_transactions = []
-        for _, row in anomalies.iterrows():
-            severity = "High" if abs(row['anomaly_score']) > 0.5 else "Medium"
-            anomalous_transactions.append({
-                "transaction_id": str(row['transaction_id']),
-                "anomaly_type": "Unusual Transaction Amount",
-                "severity": severity,
-                "reason": f"Amount ${row['total_amount']:.2f} deviates from normal patterns",
-                "recommendation": "Review transaction and verify authenticity"
-            })
-        
-        risk_score = min(int(len(anomalies) / len(df) * 100), 100)
+            risk_score = min(int(len(anomalies) / len(df) * 100), 100)
+            patterns = [f"{kind}: {count}" for kind, count in anomalies['anomaly_type'].value_counts().items()]
         
         return {
             "anomalous_transactions": anomalous_transactions,
+            "total_anomalies": int(len(anomalies)),
+            "matching_anomalies": matching,
+            "offset": offset,
+            "limit": limit,
             "patterns_detected": [
                 f"Detected {len(anomalies)} anomalies out of {len(df)} transactions",
-                f"Contamination rate: {len(anomalies)/len(df)*100:.1f}%"
+                f"Contamination rate: {len(anomalies)/len(df)*100:.1f}%",
+                *patterns
             ],
             "fraud_risk_score": risk_score,
             "investigation_priority": "High" if risk_score > 50 else "Medium" if risk_score > 20 else "Low"
         }
     
+    except ModelNotTrained:
+        raise
     except Exception as e:
-        print(f"ERROR in anomaly-detection: {str(e)}")
-        traceback.print_exc()
+        log_event('analysis_error', logging.ERROR, analysis='anomaly-detection', error=str(e),
+                  traceback=traceback.format_exc())
         return {
             "anomalous_transactions": [],
+            "total_anomalies": 0,
             "patterns_detected": [f"Analysis error: {str(e)}"],
             "fraud_risk_score": 0,
             "investigation_priority": "Low"
         }
 
+@app.post("/api/anomaly-detection")
+async def anomaly_detection(request: Request):
+    """Multi-feature Isolation Forest scoring with a persisted model"""
+    data = await parse_request(request, AnomalyRequest, 'transactions')
+    scope = jsonable_encoder(data.scope)
+    require_dataset(data.dataset_id)
+    if data.sort_by not in ANOMALY_SORT_COLUMNS:
+        raise HTTPException(400, f"Unknown sort column '{data.sort_by}'. Use one of: {', '.join(ANOMALY_SORT_COLUMNS)}")
+    args = (data.transactions, data.contamination, scope, data.retrain, data.offset, data.limit, data.dataset_id,
+            data.sort_by, data.severity, data.anomaly_type, data.max_score)
+    version = anomaly_model_version()
+    try:
+        if data.retrain or anomaly_model_stale(version):
+            # May train, so it bypasses the cache, which would otherwise keep serving the stale model
+            result = await run_analysis('anomaly-detection', run_anomaly_detection, *args)
+        else:
+            # Scores depend on the saved model, so retraining invalidates them
+            result = await cached_analysis(
+                'anomaly-detection', data.transactions,
+                {'contamination': data.contamination, 'offset': data.offset, 'limit': data.limit,
+                 'dataset_id': data.dataset_id, 'sort_by': data.sort_by, 'severity': data.severity,
+                 'anomaly_type': data.anomaly_type, 'max_score': data.max_score, 'model': version},
+                run_anomaly_detection, *args, scope=scope
+            )
+    except ModelNotTrained as e:
+        raise HTTPException(409, str(e))
+    if wants_arrow(request):
+        page = pd.DataFrame(result['anomalous_transactions'], columns=ANOMALY_COLUMNS)
+        body = await asyncio.to_thread(
+            write_arrow, page, {'total_anomalies': result['total_anomalies'], 'offset': data.offset}
+        )
+        return Response(body, media_type=ARROW_STREAM)
+    return result
+
+def score_transactions(transactions, contamination):
+    model = current_anomaly_model()
+    if model is None:
+        return None
+    add_rows(len(transactions))
+    with stage('score'):
+        scored = model.score(pd.DataFrame(transactions), contamination)
+    scored['anomaly_score'] = scored['anomaly_score'].round(4)
+    return scored
+
+@app.post("/api/anomaly-detection/score")
+async def anomaly_score(request: Request):
+    """Low-latency scoring of a few transactions against the saved model, without retraining"""
+    data = await parse_request(request, AnomalyScoreRequest, 'transactions')
+    scores = await asyncio.to_thread(score_transactions, data.transactions, data.contamination)
+    if scores is None:
+        raise HTTPException(409, "No anomaly model trained yet; run /api/anomaly-detection first")
+    if wants_arrow(request):
+        return Response(await asyncio.to_thread(write_arrow, scores), media_type=ARROW_STREAM)
+    return {"scores": scores.to_dict('records')}
+
 # ================ 5. SALES FORECAST ================
-@app.post("/api/sales-forecast")
-async def sales_forecast(request: ForecastRequest):
+def run_sales_forecast(historical_sales, product_id=None, scope=None, progress=None):
     """Linear Regression forecast"""
     try:
-        df = pd.DataFrame(request.historical_sales)
+        with stage('load'):
+            if scope is not None:
+                # Daily units for the product, summed in SQL
+                df = load_daily_sales(warehouse_engine(), product_id, scope)
+            else:
+                df = pd.DataFrame(historical_sales)
+        add_rows(len(df))
         
         if len(df) < 5:
             return {
@@ -327,22 +1045,15 @@ async def sales_forecast(request: ForecastRequest):
                 "insights": "Need more historical data for accurate forecasting"
             }
         
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-        df['days'] = (df['date'] - df['date'].min()).dt.days
-        
-        X = df[['days']].values
-        y = df['sales'].values
+        report_progress(progress, 0.5, f"Fitting trend on {len(df)} data points")
         
-        model = LinearRegression()
-        model.fit(X, y)
+        # Same least-squares fit as the batch forecast, for a single SKU
+        with stage('fit'):
+            trend = fit_sales_trends(df.assign(product_id=product_id)[['product_id', 'date', 'sales']])
+            predictions = predict_sales(trend, HORIZONS)[0]
         
-        last_day = df['days'].max()
-        future_days = np.array([[last_day + 30], [last_day + 60], [last_day + 90]])
-        predictions = model.predict(future_days)
-        
-        r2 = model.score(X, y)
-        confidence = "High" if r2 > 0.8 else "Medium" if r2 > 0.5 else "Low"
+        r2 = float(trend['r2'].iloc[0])
+        confidence = str(confidence_labels(r2))
         
         return {
             "monthly_predictions": [
@@ -353,7 +1064,8 @@ async def sales_forecast(request: ForecastRequest):
             "reorder_recommendation": int(sum(predictions) * 1.2),
             "key_factors": [
                 f"R² Score: {r2:.2f}",
-                "Historical trend analyzed",
+                "Historical trend and yearly seasonality analyzed" if trend['seasonal'].iloc[0]
+                else "Historical trend analyzed",
                 f"{len(df)} data points used"
             ],
             "risk_level": "Low" if r2 > 0.7 else "Medium",
@@ -361,8 +1073,8 @@ async def sales_forecast(request: ForecastRequest):
         }
     
     except Exception as e:
-        print(f"ERROR in sales-forecast: {str(e)}")
-        traceback.print_exc()
+        log_event('analysis_error', logging.ERROR, analysis='sales-forecast', error=str(e),
+                  traceback=traceback.format_exc())
         return {
             "monthly_predictions": [],
             "reorder_recommendation": 0,
@@ -371,56 +1083,515 @@ async def sales_forecast(request: ForecastRequest):
             "insights": "Forecasting failed - check data format"
         }
 
+@app.post("/api/sales-forecast")
+async def sales_forecast(request: ForecastRequest):
+    """Linear Regression forecast"""
+    return await run_analysis(
+        'sales-forecast', run_sales_forecast, request.historical_sales, request.product_id,
+        jsonable_encoder(request.scope)
+    )
+
+def run_batch_forecast(sales, product_ids=None, seasonal=True, scope=None, dataset_id=None, progress=None):
+    """Trend forecasts and reorder quantities for many SKUs in one vectorized fit"""
+    with stage('load'):
+        if dataset_id is not None:
+            df = load_dataset_daily_sales(dataset_path(DATASETS_DIR, dataset_id), product_ids, scope)
+        elif scope is not None:
+            df = load_product_daily_sales(warehouse_engine(), product_ids, scope)
+        else:
+            df = pd.DataFrame(sales, columns=['product_id', 'date', 'sales'])
+            if product_ids:
+                df = df[df['product_id'].astype(str).isin(product_ids)]
+    add_rows(len(df))
+    report_progress(progress, 0.3, f"Loaded {len(df)} daily sales rows")
+    return batch_forecast_result(df, seasonal, progress)
+
+def batch_forecast_result(df, seasonal=True, progress=None):
+    """Forecasts and reorder totals for every product in long-format daily sales"""
+    with stage('fit'):
+        forecasts, insufficient = forecast_catalogue(df, seasonal)
+    report_progress(progress, 0.9, f"Forecast {len(forecasts)} products")
+    
+    return {
+        "forecasts": forecasts,
+        "products_forecast": len(forecasts),
+        "insufficient_data": insufficient,
+        "total_reorder_units": sum(forecast["reorder_recommendation"] for forecast in forecasts),
+        "insights": f"Forecast {len(forecasts)} products from {len(df)} daily sales rows"
+                    + (f"; {len(insufficient)} had too little history" if insufficient else "")
+    }
+
+@app.post("/api/sales-forecast/batch")
+async def batch_sales_forecast(http_request: Request):
+    """Forecasts for many SKUs (or the whole catalogue in scope) in one call"""
+    request = await parse_request(http_request, BatchForecastRequest, 'sales')
+    scope = jsonable_encoder(request.scope)
+    require_dataset(request.dataset_id)
+    params = {'product_ids': request.product_ids, 'seasonal': request.seasonal, 'dataset_id': request.dataset_id}
+    if request.shard_by is not None:
+        try:
+            return await cached_analysis(
+                'sales-forecast-batch', request.sales, dict(params, shard_by=request.shard_by),
+                run_sharded_batch_forecast, request.shard_by, request.sales, scope, request.dataset_id,
+                request.product_ids, request.seasonal, scope=scope
+            )
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+    return await cached_analysis(
+        'sales-forecast-batch', request.sales, params,
+        run_batch_forecast, request.sales, request.product_ids, request.seasonal, scope, request.dataset_id,
+        scope=scope
+    )
+
 # ================ 6. RECOMMENDATIONS ================
+def recommend_products(customer_id, items, limit, metric):
+    return current_recommender().recommend(customer_id, items, limit, metric)
+
 @app.post("/api/product-recommendations")
-async def product_recommendations(data: Dict[str, Any]):
-    """Product recommendations"""
+async def product_recommendations(data: RecommendationRequest):
+    """Item-to-item recommendations from the precomputed similarity index"""
+    segment = data.customer.get('segment', 'regular')
     try:
-        customer = data.get('customer', {})
-        segment = customer.get('segment', 'regular')
-        
-        return {
-            "recommendations": [
-                {
-                    "product_name": "Wireless Earbuds Pro",
-                    "category": "electronics",
-                    "price": 149.99,
-                    "reason": f"Popular with {segment} customers",
-                    "confidence": 85
-                },
-                {
-                    "product_name": "Smart Fitness Tracker",
-                    "category": "electronics",
-                    "price": 99.99,
-                    "reason": "Based on purchase patterns",
-                    "confidence": 78
-                },
-                {
-                    "product_name": "Bluetooth Speaker",
-                    "category": "electronics",
-                    "price": 79.99,
-                    "reason": "Trending in your segment",
-                    "confidence": 72
-                }
-            ],
-            "discount_suggestion": {
-                "percentage": 15 if segment == "premium" else 20,
-                "reasoning": f"Optimized for {segment} segment"
-            },
-            "engagement_strategy": f"Personalized email campaign for {segment} customers"
-        }
+        # Loading a newer saved index unpickles it, so the lookup runs off the event loop
+        with stage('recommend'):
+            recommendations = await asyncio.to_thread(
+                recommend_products, data.customer.get('customer_id'), data.items, data.limit, data.metric
+            )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     
+    return {
+        "recommendations": recommendations,
+        "discount_suggestion": {
+            "percentage": 15 if segment == "premium" else 20,
+            "reasoning": f"Optimized for {segment} segment"
+        },
+        "engagement_strategy": f"Personalized email campaign for {segment} customers"
+    }
+
+def update_recommender(transactions, warehouse=False):
+    """Fold new purchases into the similarity index and save it; returns (purchases added, index)"""
+    with stage('encode'):
+        purchases = line_items(transactions)
+    add_rows(len(purchases))
+    with file_lock(RECOMMENDER_PATH + '.lock'):
+        recommender = current_recommender()
+        with stage('ingest'):
+            added = recommender.ingest(purchases)
+        if warehouse:
+            # Only facts past the watermark are read, so repeat calls are cheap
+            with stage('load'):
+                purchases = load_customer_products(warehouse_engine(), recommender.last_sale_id)
+            add_rows(len(purchases))
+            with stage('ingest'):
+                added += recommender.ingest(purchases)
+            if len(purchases):
+                recommender.last_sale_id = int(purchases['sale_id'].max())
+        recommender.save(RECOMMENDER_PATH)
+        _recommender['version'] = saved_version(RECOMMENDER_PATH)
+    return added, recommender
+
+@app.post("/api/product-recommendations/index")
+async def update_recommendation_index(request: Request):
+    """Incrementally add purchases to the recommendation index"""
+    data = await parse_request(request, RecommenderIndexRequest, 'transactions')
+    async with recommender_lock:
+        added, recommender = await asyncio.to_thread(update_recommender, data.transactions, data.warehouse)
+    return {
+        "success": True,
+        "new_purchases": added,
+        "customers": recommender.n_customers,
+        "products": recommender.n_items,
+        "last_sale_id": recommender.last_sale_id
+    }
+
+# ================ 7. ANALYSIS JOBS ================
+class JobRequest(BaseModel):
+    kind: str
+    payload: Dict[str, Any]
+
+# Job kind -> (request model, analysis function, request fields not passed on)
+# Jobs run inside one pool worker, so sharded requests run unsharded there (same results, no breakdown)
+JOB_KINDS = {
+    'market-basket': (MarketBasketRequest, run_market_basket, {'incremental', 'shard_by'}),
+    'customer-segmentation': (CustomerData, run_customer_segmentation, {'incremental', 'shard_by'}),
+    'anomaly-detection': (AnomalyRequest, run_anomaly_detection, set()),
+    'sales-forecast': (ForecastRequest, run_sales_forecast, set()),
+    'sales-forecast-batch': (BatchForecastRequest, run_batch_forecast, {'shard_by'}),
+}
+
+job_store = JobStore(JOBS_DB)
+job_tasks = {}
+
+async def run_job(job_id, kind):
+    """Run a stored job in the pool; the worker writes progress and results itself"""
+    try:
+        await executor.run('jobs', execute_job, JOBS_DB, job_id, JOB_KINDS[kind][1])
+    except asyncio.CancelledError:
+        # Server shutdown or job cancellation; unfinished jobs are requeued on startup
+        pass
+    except asyncio.TimeoutError:
+        await asyncio.to_thread(
+            job_store.finish, job_id, 'failed', None, f"Timed out after {executor.timeout('jobs'):.0f}s"
+        )
     except Exception as e:
-        print(f"ERROR in recommendations: {str(e)}")
-        return {
-            "recommendations": [],
-            "discount_suggestion": {"percentage": 15, "reasoning": "Standard discount"},
-            "engagement_strategy": "Email campaign"
-        }
+        log_event('job_error', logging.ERROR, job_id=job_id, kind=kind, error=str(e),
+                  traceback=traceback.format_exc())
+        await asyncio.to_thread(job_store.finish, job_id, 'failed', None, str(e))
+    finally:
+        job_tasks.pop(job_id, None)
+
+def schedule_job(job_id, kind):
+    job_tasks[job_id] = asyncio.create_task(run_job(job_id, kind))
+
+async def get_job_or_404(job_id):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job
+
+@app.post("/api/jobs")
+async def submit_job(request: JobRequest):
+    """Queue a long-running analysis and return its job ID immediately"""
+    if request.kind not in JOB_KINDS:
+        raise HTTPException(400, f"Unknown job kind '{request.kind}'. Use one of: {', '.join(JOB_KINDS)}")
+    
+    model, _, excluded = JOB_KINDS[request.kind]
+    try:
+        params = jsonable_encoder(model(**request.payload), exclude=excluded)
+    except ValidationError as e:
+        raise HTTPException(422, str(e))
+    
+    job_id = await asyncio.to_thread(job_store.create, request.kind, params)
+    schedule_job(job_id, request.kind)
+    return {"job_id": job_id, "kind": request.kind, "status": "queued"}
+
+@app.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    return {"jobs": await asyncio.to_thread(job_store.list, status, limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await get_job_or_404(job_id)
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await get_job_or_404(job_id)
+    if job['status'] != 'completed':
+        raise HTTPException(409, f"Job {job_id} is {job['status']}")
+    return await asyncio.to_thread(job_store.result, job_id)
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events with the job status until it finishes"""
+    await get_job_or_404(job_id)
+    
+    async def events():
+        last = None
+        while True:
+            job = await asyncio.to_thread(job_store.get, job_id)
+            if job != last:
+                yield f"data: {json.dumps(job)}\n\n"
+                last = job
+            if job['status'] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; running workers stop at their next progress update"""
+    job = await get_job_or_404(job_id)
+    if job['status'] in TERMINAL_STATUSES:
+        raise HTTPException(409, f"Job {job_id} is already {job['status']}")
+    
+    await asyncio.to_thread(job_store.cancel, job_id)
+    task = job_tasks.get(job_id)
+    if task is not None and job['status'] == 'queued':
+        task.cancel()
+    return {"job_id": job_id, "status": "cancelled"}
+
+# ================ 8. RESULT CACHE ================
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return result_cache.stats()
+
+@app.delete("/api/cache")
+async def invalidate_cache(namespace: Optional[str] = None):
+    """Drop cached results, optionally only for one endpoint (e.g. market-basket)"""
+    removed = await asyncio.to_thread(result_cache.invalidate, namespace)
+    return {"success": True, "removed": removed}
+
+# ================ 9. WAREHOUSE AGGREGATES ================
+def rebuild_rollups():
+    with warehouse_lock():
+        return refresh_rollups(warehouse_engine(), full=True)
+
+@app.get("/api/warehouse/sales")
+async def warehouse_sales(grain: str = 'month', by: Optional[str] = None, start_date: Optional[date] = None,
+                          end_date: Optional[date] = None, key: Optional[List[str]] = Query(None)):
+    """Quantity, revenue and profit per period, served from the coarsest matching rollup"""
+    try:
+        df, source = await asyncio.to_thread(query_sales, warehouse_engine(), grain, by, start_date, end_date, key)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return {
+        "grain": grain,
+        "by": by,
+        "source": source,
+        "rows": jsonable_encoder(df.astype(object).where(df.notna(), None).to_dict('records'))
+    }
+
+@app.post("/api/warehouse/rollups/rebuild")
+async def warehouse_rollups_rebuild():
+    """Recompute all rollups from fact_sales, e.g. after facts were changed outside the loader"""
+    return await run_analysis('warehouse-load', rebuild_rollups)
+
+@app.get("/api/warehouse/query-plans")
+async def warehouse_query_plans():
+    """EXPLAIN the warehouse's key queries and flag full fact_sales scans"""
+    return await asyncio.to_thread(check_query_plans, warehouse_engine())
+
+# ================ 10. DATASETS ================
+@app.get("/api/datasets")
+async def get_datasets():
+    """Cleaned datasets saved as Parquet, newest first"""
+    return {"datasets": await asyncio.to_thread(list_datasets, DATASETS_DIR)}
+
+@app.get("/api/datasets/{dataset_id}")
+async def get_dataset(dataset_id: str):
+    root = require_dataset(dataset_id)
+    manifest = await asyncio.to_thread(read_manifest, root)
+    return dict(manifest, **await asyncio.to_thread(dataset_stats, root))
+
+@app.get("/api/datasets/{dataset_id}/rows")
+async def get_dataset_rows(request: Request, dataset_id: str, columns: Optional[str] = None,
+                           start_date: Optional[date] = None, end_date: Optional[date] = None,
+                           store: Optional[str] = None, category: Optional[str] = None,
+                           offset: int = 0, limit: int = 100):
+    """Rows of a dataset, reading only the requested columns and matching partitions"""
+    root = require_dataset(dataset_id)
+    scope = {'start_date': start_date, 'end_date': end_date, 'store': store, 'category': category}
+    selected = columns.split(',') if columns else None
+    df = await asyncio.to_thread(read_dataset, root, selected, scope)
+    page = df.iloc[offset:offset + limit]
+    if wants_arrow(request):
+        body = await asyncio.to_thread(write_arrow, page, {'total_rows': len(df), 'offset': offset})
+        return Response(body, media_type=ARROW_STREAM)
+    return {
+        "total_rows": len(df),
+        "offset": offset,
+        "limit": limit,
+        "rows": jsonable_encoder(page.astype(object).where(page.notna(), None).to_dict('records'))
+    }
+
+@app.delete("/api/datasets/{dataset_id}")
+async def remove_dataset(dataset_id: str):
+    root = require_dataset(dataset_id)
+    await asyncio.to_thread(delete_dataset, root)
+    return {"deleted": dataset_id}
+
+# ================ 11. INSTRUMENTATION ================
+def cache_metrics():
+    stats = result_cache.stats()
+    return [
+        ('retailiq_cache_events_total', 'counter', "Result cache lookups and writes by outcome",
+         [({'event': event}, stats[event]) for event in result_cache.counters]),
+        ('retailiq_cache_memory_items', 'gauge', "Results held in the in-memory cache tier",
+         [({}, stats['memory_items'])]),
+        ('retailiq_cache_disk_bytes', 'gauge', "Bytes used by the on-disk cache tier", [({}, stats['disk_bytes'])]),
+    ]
+
+registry.collect(cache_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """Request, stage, pool job and cache metrics in the Prometheus text format"""
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+def profile_summary(path, limit):
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, raw: bool = False, limit: int = 50):
+    """A request profile: top functions by cumulative time, or the raw cProfile / collapsed-stack file"""
+    stem, extension = os.path.splitext(profile_id)
+    path = os.path.join(PROFILE_DIR, profile_id)
+    if not stem.replace('-', '').isalnum() or extension not in PROFILE_EXTENSIONS.values() or not os.path.exists(path):
+        raise HTTPException(404, f"Profile '{profile_id}' not found")
+    if raw or extension == PROFILE_EXTENSIONS['sample']:
+        with open(path, 'rb') as f:
+            content = f.read()
+        return Response(content, media_type="application/octet-stream" if raw else "text/plain")
+    return Response(await asyncio.to_thread(profile_summary, path, limit), media_type="text/plain")
+
+# ================ 12. MULTI-STORE SHARDING ================
+# Sharded analyses split their input by store (or region), compute a small
+# partial result per shard in parallel in the pool and merge the partials into
+# the result the unsharded analysis gives, plus a breakdown per shard
+
+def plan_shards(shard_by, rows=None, scope=None, dataset_id=None):
+    """(key, source) per shard, where a source is what the shard loaders read.
+
+    Dataset and warehouse shards are read by their own worker, limited to
+    the shard's stores; payload rows are split here and sent along.
+    """
+    if shard_by not in SHARD_COLUMNS:
+        raise ValueError(f"Cannot shard by '{shard_by}'. Use one of: {', '.join(SHARD_COLUMNS)}")
+    if dataset_id is not None:
+        shards = dataset_shards(dataset_path(DATASETS_DIR, dataset_id), shard_by, scope)
+        return [(key, {'dataset_id': dataset_id, 'scope': dict(scope or {}, stores=stores)})
+                for key, stores in shards.items()]
+    if scope is not None:
+        shards = store_shards(warehouse_engine(), shard_by, scope)
+        return [(key, {'scope': dict(scope, stores=stores)}) for key, stores in shards.items()]
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+    return [(key, {'rows': part}) for key, part in shard_frame(frame, shard_by)]
+
+async def map_shards(fn, shards, *args):
+    """``fn(source, *args)`` for every shard, all submitted to the pool at once"""
+    return await asyncio.gather(*(run_analysis('shards', fn, source, *args) for _, source in shards))
+
+def load_shard_baskets(source):
+    if 'rows' in source:
+        return transaction_baskets(source['rows'])[0]
+    if 'dataset_id' in source:
+        return load_dataset_baskets(dataset_path(DATASETS_DIR, source['dataset_id']), source['scope'])[0]
+    return load_baskets(warehouse_engine(), source['scope'])[0]
+
+def map_shard_itemsets(source, min_support, max_len=None):
+    with stage('load'):
+        baskets = load_shard_baskets(source)
+    add_rows(len(baskets))
+    with stage('mine'):
+        return local_itemsets(baskets, min_support, max_len)
+
+def map_shard_itemset_counts(source, itemsets):
+    with stage('load'):
+        baskets = load_shard_baskets(source)
+    with stage('count'):
+        return count_itemsets(baskets, itemsets)
+
+def reduce_market_basket(parts, min_support, *options):
+    with stage('merge'):
+        frequent_itemsets, n_baskets = merge_itemset_counts(parts, min_support)
+    return market_basket_result(frequent_itemsets, n_baskets, *options)
+
+async def run_sharded_market_basket(shard_by, transactions, scope, dataset_id, min_support, max_len, *options):
+    """Exact itemset counts in two passes over the shards (SON), then rules from the merged counts"""
+    shards = await asyncio.to_thread(plan_shards, shard_by, transactions, scope, dataset_id)
+    local = await map_shards(map_shard_itemsets, shards, min_support, max_len)
+    # Second pass: each shard counts the candidates it did not find frequent itself
+    candidates = sorted(set().union(*(counts for _, counts in local)), key=sorted)
+    missing = [[itemset for itemset in candidates if itemset not in counts] for _, counts in local]
+    extra = await asyncio.gather(*(
+        run_analysis('shards', map_shard_itemset_counts, source, itemsets) if itemsets else asyncio.sleep(0, {})
+        for (_, source), itemsets in zip(shards, missing)
+    ))
+    parts = [(n_baskets, {**counts, **more}) for (n_baskets, counts), more in zip(local, extra)]
+    result = await run_analysis('market-basket', reduce_market_basket, parts, min_support, *options)
+    result["shards"] = [
+        {"key": key, "baskets": n_baskets, "local_itemsets": len(counts)}
+        for (key, _), (n_baskets, counts) in zip(shards, local)
+    ]
+    return result
+
+def map_shard_customers(source):
+    with stage('load'):
+        if 'rows' in source:
+            aggregates = aggregate_transactions(source['rows'])
+        else:
+            aggregates = load_customer_aggregates(warehouse_engine(), source['scope'])
+    add_rows(len(aggregates))
+    return aggregates
+
+def reduce_segmentation(parts, n_clusters, refit, reference_date=None):
+    with stage('merge'):
+        df = rfm_from_aggregates(merge_customer_aggregates(parts), reference_date)
+    return segment_customers(df, n_clusters, refit)
+
+async def run_sharded_segmentation(shard_by, transactions, scope, n_clusters=4, refit=False):
+    """Per-customer purchase aggregates per shard, merged into RFM features for one global model"""
+    shards = await asyncio.to_thread(plan_shards, shard_by, transactions, scope)
+    parts = await map_shards(map_shard_customers, shards)
+    reference_date = (scope or {}).get('end_date')
+    result = await run_analysis(
+        'customer-segmentation', reduce_segmentation, parts, n_clusters, refit, reference_date
+    )
+    result["shards"] = [
+        {"key": key, "customers": len(part), "revenue": round(float(part['monetary'].sum()), 2)}
+        for (key, _), part in zip(shards, parts)
+    ]
+    return result
+
+def map_shard_daily_sales(source, product_ids=None):
+    with stage('load'):
+        if 'rows' in source:
+            df = pd.DataFrame(source['rows'], columns=['product_id', 'date', 'sales'])
+            if product_ids:
+                df = df[df['product_id'].astype(str).isin(product_ids)]
+            # Summed per product and day here, so the partials stay small
+            df = df.groupby(['product_id', 'date'], sort=False, as_index=False)['sales'].sum()
+        elif 'dataset_id' in source:
+            df = load_dataset_daily_sales(dataset_path(DATASETS_DIR, source['dataset_id']), product_ids, source['scope'])
+        else:
+            df = load_product_daily_sales(warehouse_engine(), product_ids, source['scope'])
+    add_rows(len(df))
+    return df
+
+def reduce_batch_forecast(parts, seasonal=True):
+    with stage('merge'):
+        df = merge_daily_sales(parts)
+    return batch_forecast_result(df, seasonal)
+
+async def run_sharded_batch_forecast(shard_by, sales, scope, dataset_id, product_ids=None, seasonal=True):
+    """Daily product sales rolled up per shard, merged and forecast as one catalogue"""
+    shards = await asyncio.to_thread(plan_shards, shard_by, sales, scope, dataset_id)
+    parts = await map_shards(map_shard_daily_sales, shards, product_ids)
+    result = await run_analysis('sales-forecast-batch', reduce_batch_forecast, parts, seasonal)
+    result["shards"] = [
+        {"key": key, "products": int(part['product_id'].nunique()), "units": float(part['sales'].sum())}
+        for (key, _), part in zip(shards, parts)
+    ]
+    return result
+
+# ================ 13. STARTUP ================
+# Preload in a parent process that forks workers (serve.py), so they share
+# the ML libraries and models copy-on-write instead of each loading them
+PRELOAD = os.environ.get('RETAILIQ_PRELOAD', '0') == '1'
+
+def preload_models():
+    """Load the persisted models and stores into this process; the rule store is loaded at import"""
+    current_anomaly_model()
+    current_segmentation_model()
+    current_rfm_store()
+    current_recommender()
+
+startup.finish_import()
+if PRELOAD:
+    with startup.phase('preload_modules'):
+        preload_modules()
+    with startup.phase('preload_models'):
+        preload_models()
+    freeze_heap()
+    startup.preloaded = True
+
+def startup_metrics():
+    return [
+        ('retailiq_startup_seconds', 'gauge', "Duration of each startup phase of this worker",
+         [({'phase': phase}, seconds) for phase, seconds in startup.phases.items()]),
+    ]
+
+registry.collect(startup_metrics)
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "service": "RetailIQ ML Backend"}
+    """Liveness, plus how long this worker took to import, preload and boot"""
+    return {"status": "healthy", "service": "RetailIQ ML Backend", "startup": startup.report()}
 
 if __name__ == "__main__":
     import uvicorn
@@ -432,4 +1603,7 @@ if __name__ == "__main__":
     print("  - POST /api/anomaly-detection")
     print("  - POST /api/sales-forecast")
     print("  - POST /api/product-recommendations")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    print("  - POST /api/jobs (GET /api/jobs/{id}, /result, /events; DELETE to cancel)")
+    print("  - GET  /api/warehouse/sales (rollup-backed aggregates)")
+    print("  - GET  /metrics (Prometheus metrics; X-Profile header with RETAILIQ_PROFILING=1)")
+    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""Preforking server: load the app once, then fork workers that share it.
+
+    python serve.py --workers 4 --port 8000
+
+The app is imported here with RETAILIQ_PRELOAD=1, so scikit-learn, mlxtend
+and the persisted models are loaded once, before forking, and the workers
+share those pages copy-on-write. ``uvicorn --workers`` instead spawns fresh
+interpreters that each import everything again. Workers that exit are
+replaced; SIGTERM or SIGINT shuts them all down.
+
+Each worker has its own analysis process pool; RETAILIQ_SERVER_WORKERS tells
+them how many workers split the CPUs, unless RETAILIQ_WORKERS sizes the pools.
+
+Workers share the incremental stores, the recommendation index and the
+warehouse through files: updates hold a file lock across load, update and
+save, and each worker reloads a store another one saved.
+"""
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+import uvicorn
+
+# A worker that dies sooner than this after starting is restarted only after a pause
+MIN_WORKER_LIFETIME = 5.0
+
+def bind(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def run_worker(app, sock, worker_id, requeue, log_level):
+    """Serve on the shared socket until told to stop; runs in the forked child"""
+    os.environ['RETAILIQ_WORKER_ID'] = str(worker_id)
+    os.environ['RETAILIQ_REQUEUE_JOBS'] = '1' if requeue else '0'
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan='on'))
+    server.run(sockets=[sock])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-preload', action='store_true',
+                        help="Fork without preloading; each worker imports ML modules on first use")
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    os.environ['RETAILIQ_PRELOAD'] = '0' if args.no_preload else '1'
+    # Read when main builds its executor, so it must be set before the import
+    os.environ['RETAILIQ_SERVER_WORKERS'] = str(args.workers)
+    started = time.perf_counter()
+    app = importlib.import_module('main').app
+    sock = bind(args.host, args.port)
+    print(f"Loaded the app in {time.perf_counter() - started:.2f}s "
+          f"({'lazy imports' if args.no_preload else 'preloaded'}); "
+          f"forking {args.workers} workers on {args.host}:{args.port}", flush=True)
+
+    workers = {}
+    stopping = False
+
+    def spawn(worker_id, requeue):
+        pid = os.fork()
+        if pid == 0:
+            # Drop the parent's handlers; uvicorn installs its own
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(app, sock, worker_id, requeue, args.log_level)
+            except BaseException:
+                code = 1
+            finally:
+                # Never return into the parent's loop
+                os._exit(code)
+        workers[pid] = (worker_id, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # Unfinished jobs are requeued once, by the first worker; replacements never requeue
+    for worker_id in range(args.workers):
+        spawn(worker_id, requeue=worker_id == 0)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id, spawned_at = workers.pop(pid, (None, None))
+        if worker_id is None or stopping:
+            continue
+        print(f"Worker {worker_id} (pid {pid}) exited with code {os.waitstatus_to_exitcode(status)}; restarting",
+              flush=True)
+        if time.monotonic() - spawned_at < MIN_WORKER_LIFETIME:
+            time.sleep(MIN_WORKER_LIFETIME)
+        if not stopping:
+            spawn(worker_id, requeue=False)
+    sock.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
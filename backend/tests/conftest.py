@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Modules are imported as the app imports them, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main keeps its models, stores and datasets here; tests get a throwaway directory
+os.environ.setdefault('RETAILIQ_MODELS_DIR', tempfile.mkdtemp(prefix='retailiq-tests-'))
+os.environ.setdefault('RETAILIQ_LOG_LEVEL', 'WARNING')
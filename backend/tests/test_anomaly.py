@@ -0,0 +1,52 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from bench.synthetic import RetailDataGenerator, transaction_rows
+
+@pytest.fixture(scope='module')
+def transactions():
+    rows = transaction_rows(RetailDataGenerator(seed=11).generate(4000)['transactions'])
+    assert len(rows) >= 1000
+    return rows
+
+@pytest.fixture(scope='module')
+def client():
+    import main
+    if os.path.exists(main.ANOMALY_MODEL_PATH):
+        os.remove(main.ANOMALY_MODEL_PATH)
+    with TestClient(main.app) as client:
+        yield client
+
+def test_no_model_until_a_large_enough_batch(client, transactions):
+    import main
+    small = {'transactions': transactions[:50]}
+    assert client.post('/api/anomaly-detection', json=small).status_code == 409
+    assert client.post('/api/anomaly-detection/score', json=small).status_code == 409
+    assert not os.path.exists(main.ANOMALY_MODEL_PATH)
+
+    response = client.post('/api/anomaly-detection', json={'transactions': transactions[:main.ANOMALY_MIN_RETRAIN_ROWS]})
+    assert response.status_code == 200
+    assert response.json()['total_anomalies'] > 0
+    assert os.path.exists(main.ANOMALY_MODEL_PATH)
+    # Small batches are scored with the saved model rather than training one
+    version = main.anomaly_model_version()
+    assert client.post('/api/anomaly-detection', json=small).status_code == 200
+    assert main.anomaly_model_version() == version
+
+def test_stale_model_is_retrained_despite_the_cache(client, transactions, monkeypatch):
+    import main
+    request = {'transactions': transactions[:main.ANOMALY_MIN_RETRAIN_ROWS]}
+    for _ in range(2):
+        assert client.post('/api/anomaly-detection', json=request).status_code == 200
+    version = main.anomaly_model_version()
+
+    # Every saved model is now stale, here and in freshly forked pool workers
+    monkeypatch.setattr(main, 'ANOMALY_RETRAIN_SECONDS', 0)
+    main.executor.shutdown(wait=True)
+    try:
+        # The identical request is cached under the same model version, yet must retrain
+        assert client.post('/api/anomaly-detection', json=request).status_code == 200
+        assert main.anomaly_model_version() > version
+    finally:
+        monkeypatch.undo()
+        main.executor.shutdown(wait=True)
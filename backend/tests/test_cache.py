@@ -0,0 +1,42 @@
+import multiprocessing
+from utils.cache import ResultCache
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.make_key('trends', {'b': 2, 'a': 1}, {'months': 3})
+    assert key == cache.make_key('trends', {'a': 1, 'b': 2}, {'months': 3})
+    assert cache.get(key) is None
+    cache.set(key, {'forecast': [1, 2, 3]})
+    assert cache.get(key) == {'forecast': [1, 2, 3]}
+    assert ResultCache(str(tmp_path)).get(key) == {'forecast': [1, 2, 3]}
+    assert cache.counters['memory_hits'] == 1
+    assert cache.counters['misses'] == 1
+
+def test_eviction_keeps_the_directory_under_its_limit(tmp_path):
+    first = ResultCache(str(tmp_path), max_disk_bytes=3000)
+    second = ResultCache(str(tmp_path), max_disk_bytes=3000)
+    keys = [first.make_key('rules', {'i': i}) for i in range(8)]
+    for i, key in enumerate(keys):
+        # Two writers sharing the directory, as serve.py workers do
+        (first if i % 2 else second).set(key, b'x' * 1000)
+    assert first.stats()['disk_bytes'] <= 3000
+    assert sum(p.stat().st_size for p in tmp_path.glob('*.pkl')) <= 3000
+    assert ResultCache(str(tmp_path)).get(keys[-1]) == b'x' * 1000
+    assert ResultCache(str(tmp_path)).get(keys[0]) is None
+
+def invalidate_in_child(directory, namespace):
+    ResultCache(directory).invalidate(namespace)
+
+def test_invalidation_reaches_other_processes(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key = cache.make_key('segments', {'k': 4})
+    cache.set(key, 'stale')
+    assert cache.get(key) == 'stale'
+    child = multiprocessing.get_context('fork').Process(
+        target=invalidate_in_child, args=(str(tmp_path), 'segments'))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert cache.get(key) is None
+    cache.set(key, 'fresh')
+    assert cache.get(key) == 'fresh'
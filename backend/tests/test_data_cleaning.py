@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.data_cleaning import clean_dataset, clean_file_streaming, _bounded_counts, _fill_values
+
+CSV = """Transaction ID,Customer,Store,Quantity,Price
+T1,alice,S1,2,9.5
+T2,bob,,1,
+T3,,S2,,4.0
+T1,alice,S1,2,9.5
+T4,carol,S1,3,12.0
+T5,bob,S2,,7.25
+T2,bob,,1,
+T6,alice,,5,3.0
+T7,,S1,1,
+T4,carol,S1,3,12.0
+T8,dave,S3,2,8.0
+"""
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'sales.csv'
+    path.write_text(CSV)
+    return str(path)
+
+def streamed(path, **options):
+    chunks = []
+    report = clean_file_streaming(path, sink=chunks.append, **options)
+    return report, pd.concat(chunks, ignore_index=True)
+
+@pytest.mark.parametrize('chunksize', [2, 3, 100])
+@pytest.mark.parametrize('partitions', [1, 4, 64])
+def test_streaming_matches_in_memory(csv_path, chunksize, partitions):
+    expected = clean_dataset(pd.read_csv(csv_path)).reset_index(drop=True)
+    report, cleaned = streamed(csv_path, chunksize=chunksize, partitions=partitions)
+    # Chunks without gaps parse as integers, so only values are compared
+    pd.testing.assert_frame_equal(cleaned, expected, check_dtype=False)
+    assert report['original_rows'] == 11
+    assert report['cleaned_rows'] == len(expected) == 8
+    assert report['duplicates_removed'] == 3
+    assert report['missing_after'] == 0
+
+def test_header_only_file(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text("a,b\n")
+    report, cleaned = streamed(str(path))
+    assert report['cleaned_rows'] == 0 and cleaned.empty
+
+def test_empty_file_is_rejected(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text("")
+    with pytest.raises(pd.errors.EmptyDataError):
+        clean_file_streaming(str(path))
+
+def test_only_columns_with_gaps_are_counted(tmp_path):
+    path = tmp_path / 'orders.csv'
+    rows = [f"order-{i},{'' if i % 7 == 0 else ('north' if i % 3 else f'store-{i}')}" for i in range(2000)]
+    path.write_text("order_id,region\n" + "\n".join(rows) + "\n")
+    keep = np.ones(2000, dtype=bool)
+    missing = pd.Series({'order_id': 0, 'region': 286})
+    # order_id has a distinct value per row and no gaps, so it is never counted
+    fill_values = _fill_values(str(path), 250, keep, pd.Index(['order_id', 'region']), missing,
+                               sample_size=100, seed=0, max_categories=50)
+    assert fill_values == {'region': 'north'}
+
+def test_bounded_counts_keep_the_most_frequent_values():
+    counts = pd.Series({'north': 40, 'south': 30, **{f"store-{i}": 1 for i in range(100)}})
+    bounded = _bounded_counts(counts, max_categories=10)
+    assert len(bounded) <= 10
+    assert bounded.idxmax() == 'north'
+    pd.testing.assert_series_equal(_bounded_counts(counts.head(5), 10), counts.head(5))
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+from bench.synthetic import RetailDataGenerator
+from database.queries import group_baskets
+from utils.datasets import (
+    DatasetWriter, dataset_stats, load_dataset_baskets, open_dataset, read_dataset, read_manifest, scope_filter
+)
+
+@pytest.fixture(scope='module')
+def lines():
+    return RetailDataGenerator(seed=21).generate(4000)['lines']
+
+@pytest.fixture(scope='module')
+def root(lines, tmp_path_factory):
+    root = str(tmp_path_factory.mktemp('datasets') / 'sales')
+    writer = DatasetWriter(root, source='sales.csv')
+    first = lines.iloc[:2500]
+    # A gap turns the integer quantity column into floats in this chunk only
+    second = lines.iloc[2500:].astype({'quantity': float})
+    second.iloc[0, second.columns.get_loc('quantity')] = np.nan
+    writer.write(first)
+    writer.write(second)
+    writer.close()
+    return root
+
+def test_manifest_and_stats(root, lines):
+    manifest = read_manifest(root)
+    assert manifest['rows'] == len(lines)
+    assert manifest['date_column'] == 'transaction_date' and manifest['store_column'] == 'store_id'
+    stats = dataset_stats(root)
+    assert stats['rows'] == len(lines)
+    assert len(stats['partitions']) == lines.groupby(
+        [lines['transaction_date'].dt.strftime('%Y-%m'), lines['store_id']], observed=True).ngroups
+
+def test_projection_reads_only_the_requested_columns(root, lines):
+    df = read_dataset(root, ['transaction_id', 'quantity', 'order_id', 'transaction_id'])
+    assert list(df.columns) == ['transaction_id', 'quantity']
+    assert len(df) == len(lines)
+    # Both chunks read back under the unified schema; the gap stays missing
+    assert df['quantity'].isna().sum() == 1
+    assert df['quantity'].sum() == lines['quantity'].drop(lines.index[2500]).sum()
+
+def test_scope_prunes_partitions_and_rows(root, lines):
+    store = str(lines['store_id'].iloc[0])
+    scope = {'start_date': '2023-02-10', 'end_date': '2023-04-20', 'store': store}
+    df = read_dataset(root, ['transaction_id', 'product_name', 'transaction_date'], scope,
+                      filters=[('product_name', '!=', lines['product_name'].iloc[0])])
+
+    day = lines['transaction_date'].dt.normalize()
+    expected = lines[(day >= '2023-02-10') & (day <= '2023-04-20') & (lines['store_id'].astype(str) == store)
+                     & (lines['product_name'] != lines['product_name'].iloc[0])]
+    assert len(expected) > 0
+    assert sorted(zip(df['transaction_id'], df['product_name'].astype(str))) == \
+        sorted(zip(expected['transaction_id'].astype(str), expected['product_name'].astype(str)))
+
+    # Only this store's February to April directories are opened
+    fragments = list(open_dataset(root).get_fragments(filter=scope_filter(read_manifest(root), scope)))
+    directories = {os.path.relpath(os.path.dirname(fragment.path), root) for fragment in fragments}
+    assert directories == {f"sale_month=2023-{month:02d}/store_key={store}" for month in (2, 3, 4)}
+
+def test_baskets_match_the_source_lines(root, lines):
+    baskets, transaction_ids = load_dataset_baskets(root)
+    expected_baskets, expected_ids = group_baskets(lines['transaction_id'].astype(str),
+                                                   lines['product_name'].astype(str))
+    assert dict(zip(transaction_ids, map(sorted, baskets))) == \
+        dict(zip(expected_ids, map(sorted, expected_baskets)))
@@ -0,0 +1,32 @@
+import asyncio
+import time
+import pytest
+from utils.executor import JobExecutor
+
+def test_pool_size_splits_cpus_between_server_workers(monkeypatch):
+    monkeypatch.delenv('RETAILIQ_WORKERS', raising=False)
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    monkeypatch.setenv('RETAILIQ_SERVER_WORKERS', '3')
+    assert JobExecutor.from_env(['clean-data']).max_workers == 2
+    monkeypatch.setenv('RETAILIQ_SERVER_WORKERS', '16')
+    assert JobExecutor.from_env(['clean-data']).max_workers == 1
+    monkeypatch.delenv('RETAILIQ_SERVER_WORKERS')
+    assert JobExecutor.from_env(['clean-data']).max_workers == 8
+    monkeypatch.setenv('RETAILIQ_WORKERS', '5')
+    assert JobExecutor.from_env(['clean-data']).max_workers == 5
+
+def test_concurrency_and_timeouts_from_env(monkeypatch):
+    monkeypatch.setenv('RETAILIQ_CLEAN_DATA_CONCURRENCY', '3')
+    monkeypatch.setenv('RETAILIQ_CLEAN_DATA_TIMEOUT', '0.5')
+    executor = JobExecutor.from_env(['clean-data', 'jobs'], default_timeouts={'jobs': 3600})
+    assert executor.concurrency == {'clean-data': 3, 'jobs': 2}
+    assert executor.timeout('clean-data') == 0.5 and executor.timeout('jobs') == 3600
+
+def test_run_in_pool_and_time_out():
+    executor = JobExecutor(max_workers=1, timeouts={'slow': 0.2})
+    try:
+        assert asyncio.run(executor.run('sum', sum, [1, 2, 3])) == 6
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(executor.run('slow', time.sleep, 2))
+    finally:
+        executor.shutdown()
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from utils.forecasting import YEAR_DAYS, fit_sales_trends, forecast_catalogue, predict_sales
+
+def sales_history(seed=0):
+    """Three SKUs: two years with a yearly cycle, four months of trend, and a two-day stub"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2022-01-01')
+    frames = []
+    for sku, days, slope, season in [('A', np.arange(0, 730, 3), 0.05, 8.0), ('B', np.arange(400, 520), -0.1, 0.0),
+                                     ('C', np.array([600, 601]), 0.0, 0.0)]:
+        sales = 50 + slope * days + season * np.sin(days * 2 * np.pi / YEAR_DAYS) + rng.normal(0, 1, len(days))
+        frames.append(pd.DataFrame({'product_id': sku, 'date': start + pd.to_timedelta(days, 'D'), 'sales': sales}))
+    return pd.concat(frames, ignore_index=True).sample(frac=1, random_state=seed)
+
+def lstsq_fit(days, sales, first_day, seasonal):
+    t = days - first_day
+    columns = [np.ones_like(t), t - t.mean()]
+    if seasonal:
+        angle = days * 2 * np.pi / YEAR_DAYS
+        columns += [np.sin(angle), np.cos(angle)]
+    coef, *_ = np.linalg.lstsq(np.column_stack(columns), sales, rcond=None)
+    return np.pad(coef, (0, 4 - len(coef)))
+
+def test_stacked_fit_matches_per_sku_lstsq():
+    sales = sales_history()
+    trends = fit_sales_trends(sales)
+    assert trends['seasonal'].to_dict() == {'A': True, 'B': False, 'C': False}
+
+    days = (sales['date'] - sales['date'].min()).dt.days.to_numpy(dtype=float)
+    for sku, row in trends.iterrows():
+        mask = (sales['product_id'] == sku).to_numpy()
+        expected = lstsq_fit(days[mask], sales['sales'].to_numpy()[mask], days[mask].min(), row['seasonal'])
+        actual = row[['intercept', 'slope', 'season_sin', 'season_cos']].to_numpy(dtype=float)
+        np.testing.assert_allclose(actual, expected, atol=1e-8)
+        assert row['data_points'] == mask.sum()
+    assert abs(trends.loc['A', 'season_sin'] - 8) < 1 and abs(trends.loc['B', 'slope'] + 0.1) < 0.02
+
+def test_catalogue_skips_short_histories():
+    sales = sales_history()
+    forecasts, insufficient = forecast_catalogue(sales, seasonal=False)
+    assert insufficient == ['C']
+    assert sorted(f['product_id'] for f in forecasts) == ['A', 'B']
+    trends = fit_sales_trends(sales, seasonal=False)
+    predicted = predict_sales(trends.loc[['B']])[0]
+    # B trends down, so each month ahead sells less
+    assert predicted[0] > predicted[1] > predicted[2]
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import apriori
+from mlxtend.preprocessing import TransactionEncoder
+from utils.market_basket import mine_frequent_itemsets, support_count
+
+# 25 baskets: butter and {bread, milk, eggs} are in 7 (support 0.28), {bread, milk} in 14 (0.56);
+# 0.28 * 25 and 0.56 * 25 come out just above 7 and 14 in floating point
+BASKETS = (
+    [['bread', 'milk', 'eggs']] * 7
+    + [['bread', 'milk']] * 7
+    + [['bread', 'butter']] * 4
+    + [['milk', 'eggs', 'butter']] * 3
+    + [['coffee']] * 2
+    + [['coffee', 'milk']] * 2
+)
+
+def as_set(frequent_itemsets):
+    return {(frozenset(itemset), round(support, 9))
+            for itemset, support in zip(frequent_itemsets['itemsets'], frequent_itemsets['support'])}
+
+def mlxtend_itemsets(baskets, min_support, max_len=None):
+    encoder = TransactionEncoder()
+    df = pd.DataFrame(encoder.fit(baskets).transform(baskets), columns=encoder.columns_)
+    return apriori(df, min_support=min_support, use_colnames=True, max_len=max_len)
+
+@pytest.mark.parametrize('min_support', [0.05, 0.12, 0.28, 0.4, 0.56, 0.72])
+@pytest.mark.parametrize('max_len', [None, 1, 2])
+def test_eclat_matches_apriori(min_support, max_len):
+    expected = as_set(mlxtend_itemsets(BASKETS, min_support, max_len))
+    assert as_set(mine_frequent_itemsets(BASKETS, min_support, max_len)) == expected
+    assert expected
+
+def test_support_threshold_is_inclusive():
+    # Itemsets in exactly 7 of 25 baskets reach min_support 0.28
+    itemsets = as_set(mine_frequent_itemsets(BASKETS, 0.28))
+    assert (frozenset({'butter'}), 0.28) in itemsets
+    assert (frozenset({'bread', 'milk', 'eggs'}), 0.28) in itemsets
+
+def test_support_count_rounding():
+    assert support_count(0.28, 25) == 7
+    assert support_count(0.56, 25) == 14
+    assert support_count(0.3, 10) == 3
+    assert support_count(0.25, 10) == 3
+    assert support_count(0.0, 10) == 0
+
+def test_repeated_items_count_once():
+    baskets = [['a', 'a', 'b'], ['a'], ['b', 'b']]
+    assert as_set(mine_frequent_itemsets(baskets, 0.5)) == as_set(mlxtend_itemsets(baskets, 0.5))
+
+def test_no_baskets():
+    assert mine_frequent_itemsets([], 0.1).empty
@@ -0,0 +1,80 @@
+import logging
+import re
+import pytest
+from fastapi.testclient import TestClient
+from utils.metrics import MetricsRegistry, add_rows, log_event, logger, run_traced, stage
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', "Requests", ('path', 'status'))
+    latency = registry.histogram('latency_seconds', "Latency", ('path',), buckets=(0.1, 1.0))
+    registry.collect(lambda: [('queue_depth', 'gauge', "Queued jobs", [({'pool': 'main'}, 3)])])
+    requests.inc('/a "quoted"', 200)
+    requests.inc('/a "quoted"', 200, amount=2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe('/a', value=value)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{path="/a \\"quoted\\"",status="200"} 3' in lines
+    # Buckets are cumulative, ending in +Inf
+    assert 'latency_seconds_bucket{path="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{path="/a",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{path="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{path="/a"} 5.55' in lines
+    assert 'latency_seconds_count{path="/a"} 3' in lines
+    assert '# TYPE queue_depth gauge' in lines and 'queue_depth{pool="main"} 3' in lines
+
+class Events(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), record.fields))
+
+@pytest.fixture
+def events():
+    handler = Events()
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    yield handler.records
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+def traced_work(n):
+    with stage('encode'):
+        add_rows(n)
+    log_event('analysis_input', rows=n)
+    return n * 2
+
+def test_run_traced_reports_stages_rows_and_request_id(events):
+    result, report = run_traced(traced_work, 'req-1', None, 7)
+    assert result == 14
+    assert report['rows'] == 7 and set(report['stages']) == {'encode'}
+    assert report['seconds'] >= report['stages']['encode']
+    assert report['profile'] is None
+    assert events == [('analysis_input', {'request_id': 'req-1', 'rows': 7})]
+
+def test_requests_are_timed_logged_and_exported(events):
+    import main
+    # Importing main configures logging from RETAILIQ_LOG_LEVEL
+    logger.setLevel(logging.INFO)
+    transactions = [{'transaction_id': i, 'items': [{'product_name': 'tea'}, {'product_name': 'cups'}]}
+                    for i in range(20)]
+    with TestClient(main.app) as client:
+        response = client.post('/api/market-basket', json={'transactions': transactions},
+                               headers={'X-Request-ID': 'metrics-test-1'})
+        assert response.status_code == 200
+        assert response.headers['X-Request-ID'] == 'metrics-test-1'
+        # Stages recorded in the pool worker come back with the response
+        timings = dict(part.split(';dur=') for part in response.headers['Server-Timing'].split(', '))
+        assert {'parse', 'encode', 'mine', 'serialize'} <= set(timings)
+
+        exported = client.get('/metrics').text
+    assert re.search(r'retailiq_http_requests_total\{method="POST",path="/api/market-basket",status="200"\} \d+',
+                     exported)
+    assert 'retailiq_stage_duration_seconds_count{path="/api/market-basket",stage="mine"}' in exported
+    assert re.search(r'retailiq_pool_jobs_total\{job="market-basket",outcome="ok"\} \d+', exported)
+    request = [fields for event, fields in events if event == 'request' and fields['request_id'] == 'metrics-test-1']
+    assert request and request[0]['status'] == 200 and request[0]['rows'] == 20
@@ -0,0 +1,29 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+from utils.payloads import PayloadTooLarge, compress, decompress
+
+@pytest.mark.parametrize('encoding', ['zstd', 'gzip'])
+def test_decompress_round_trip(encoding):
+    body = json.dumps({'transactions': [{'transaction_id': i} for i in range(5000)]}).encode()
+    assert decompress(compress(body, encoding), encoding) == body
+    assert decompress(compress(body, encoding), encoding, max_size=len(body)) == body
+
+@pytest.mark.parametrize('encoding', ['zstd', 'gzip', 'identity'])
+def test_decompress_stops_past_the_limit(encoding):
+    # 64 MB of zeros compresses to a few kilobytes
+    body = bytes(64 * 1024 * 1024) if encoding == 'identity' else compress(bytes(64 * 1024 * 1024), encoding)
+    with pytest.raises(PayloadTooLarge):
+        decompress(body, encoding, max_size=4 * 1024 * 1024)
+
+def test_oversized_and_unsupported_bodies_are_refused(monkeypatch):
+    import main
+    monkeypatch.setattr(main, 'MAX_REQUEST_BYTES', 1024 * 1024)
+    bomb = compress(b'{"transactions": [' + b' ' * (8 * 1024 * 1024) + b']}', 'zstd')
+    with TestClient(main.app) as client:
+        response = client.post('/api/market-basket', content=bomb,
+                               headers={'Content-Type': 'application/json', 'Content-Encoding': 'zstd'})
+        assert response.status_code == 413
+        response = client.post('/api/market-basket', content=b'{}',
+                               headers={'Content-Type': 'application/json', 'Content-Encoding': 'br'})
+        assert response.status_code == 415
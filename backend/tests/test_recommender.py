@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from bench.synthetic import RetailDataGenerator, transaction_records
+from utils.payloads import line_items
+from utils.recommender import ItemSimilarityIndex
+
+def purchases(n=3000, seed=5):
+    return line_items(transaction_records(RetailDataGenerator(seed=seed).generate(n)))
+
+def test_incremental_ingest_matches_a_full_build():
+    lines = purchases()
+    full = ItemSimilarityIndex()
+    full.ingest(lines)
+
+    incremental = ItemSimilarityIndex()
+    for batch in np.array_split(np.arange(len(lines)), 4):
+        incremental.ingest(lines.iloc[batch])
+    # Re-ingesting known purchases changes nothing
+    assert incremental.ingest(lines.iloc[:500]) == 0
+
+    # Same item order either way, so the matrices compare directly
+    assert incremental.items == full.items
+    assert (incremental.cooccurrence != full.cooccurrence).nnz == 0
+    expected = (full.purchases.T @ full.purchases).toarray()
+    np.testing.assert_array_equal(incremental.cooccurrence.toarray(), expected)
+    customer = lines['customer_id'].iloc[0]
+    assert incremental.recommend(customer, limit=5) == full.recommend(customer, limit=5)
+
+def test_unknown_customers_get_popular_products():
+    index = ItemSimilarityIndex(min_common=1)
+    index.ingest(pd.DataFrame({
+        'customer_id': ['a', 'a', 'b', 'b', 'c', 'd'],
+        'product_name': ['tea', 'cups', 'tea', 'cups', 'tea', 'jam'],
+        'price': [4.0, 9.5, 4.0, 9.5, 4.0, 3.0],
+    }))
+    recommendations = index.recommend('nobody', limit=3)
+    assert [r['product_name'] for r in recommendations] == ['tea', 'cups', 'jam']
+    assert all(r['reason'] == "Popular with customers" for r in recommendations)
+    assert recommendations[0]['confidence'] == 75
+
+    # A customer who owns tea gets cups from similarity, then popular fillers
+    recommendations = index.recommend('c', limit=2)
+    assert recommendations[0]['product_name'] == 'cups'
+    assert recommendations[0]['reason'] == "Often bought with tea"
+    assert recommendations[1]['product_name'] == 'jam'
@@ -0,0 +1,53 @@
+import os
+import pandas as pd
+from utils.clustering import RFMStore, calculate_rfm_features
+
+def line_items(start, n):
+    """Two lines per transaction, priced by their line total only"""
+    rows = []
+    for i in range(start, start + n):
+        for line in range(2):
+            rows.append({'transaction_id': f"T{i}", 'customer_id': f"C{i % 7}",
+                         'transaction_date': f"2024-01-{1 + i % 28:02d}", 'line_total': 10.0 + i + line})
+    return pd.DataFrame(rows)
+
+def assert_features_equal(store, transactions):
+    expected = calculate_rfm_features(transactions).sort_values('customer_id', ignore_index=True)
+    actual = store.features().sort_values('customer_id', ignore_index=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+def test_line_totals_count_as_spend():
+    features = calculate_rfm_features(line_items(0, 7))
+    assert features.set_index('customer_id').loc['C0', 'monetary'] == 10.0 + 11.0
+    assert (features['frequency'] == 1).all()
+
+def test_updates_skip_seen_transactions():
+    store = RFMStore()
+    assert store.update(line_items(0, 30)) == 60
+    # Re-posting the history with new transactions only folds in the new ones
+    assert store.update(line_items(0, 50)) == 40
+    assert_features_equal(store, line_items(0, 50))
+
+def test_saves_append_new_ids_to_the_log(tmp_path):
+    path = str(tmp_path / 'rfm_store.pkl')
+    store = RFMStore()
+    store.update(line_items(0, 30))
+    store.save(path)
+    log_size = os.path.getsize(path + '.transactions')
+    store.update(line_items(30, 10))
+    store.save(path)
+    with open(path + '.transactions') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 40 and lines[30] == 'T30'
+    assert os.path.getsize(path + '.transactions') > log_size
+
+    # A tail from an interrupted save is ignored on load and cut by the next save
+    with open(path + '.transactions', 'a') as f:
+        f.write("T99\n")
+    loaded = RFMStore.load(path)
+    assert loaded.seen_transactions == {f"T{i}" for i in range(40)}
+    assert loaded.update(line_items(0, 45)) == 10
+    loaded.save(path)
+    reloaded = RFMStore.load(path)
+    assert len(reloaded.seen_transactions) == 45 and 'T99' not in reloaded.seen_transactions
+    assert_features_equal(reloaded, line_items(0, 45))
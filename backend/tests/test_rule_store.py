@@ -0,0 +1,97 @@
+import os
+import random
+import pytest
+from utils.market_basket import mine_frequent_itemsets
+from utils.rule_store import IncrementalRuleStore
+
+ITEMS = ['bread', 'milk', 'eggs', 'butter', 'jam', 'tea', 'coffee', 'sugar']
+
+def baskets(n, seed=0, start=0):
+    rng = random.Random(seed)
+    weights = [8, 7, 5, 4, 2, 2, 1, 1]
+    drawn = [sorted(set(rng.choices(ITEMS, weights, k=rng.randint(1, 4)))) for _ in range(n)]
+    return drawn, [f"T{start + i}" for i in range(n)]
+
+def supports(frequent_itemsets):
+    return {itemset: round(support, 9)
+            for itemset, support in zip(frequent_itemsets['itemsets'], frequent_itemsets['support'])}
+
+def assert_exact(store, all_baskets):
+    expected = mine_frequent_itemsets(all_baskets, min_support=store.min_support, max_len=store.max_len)
+    assert supports(store.frequent_itemsets()) == supports(expected)
+
+def test_ingest_counts_only_new_transactions():
+    store = IncrementalRuleStore(min_support=0.1, max_len=3)
+    first, first_ids = baskets(300)
+    second, second_ids = baskets(200, seed=1, start=300)
+    assert store.ingest(first, first_ids)[0] == 300
+    # Re-posting the history with new receipts only counts the new ones
+    ingested, _ = store.ingest(first + second, first_ids + second_ids)
+    assert ingested == 200 and store.n_baskets == 500
+    assert_exact(store, first + second)
+
+def test_ingest_without_transaction_ids_is_rejected():
+    store = IncrementalRuleStore(min_support=0.1)
+    history, ids = baskets(50)
+    store.ingest(history, ids)
+    with pytest.raises(ValueError):
+        store.ingest(history)
+    with pytest.raises(ValueError):
+        store.ingest(history, ids[:-1] + [None])
+    assert store.n_baskets == 50
+
+def test_item_crossing_the_margin_rebuilds_its_history():
+    store = IncrementalRuleStore(min_support=0.2, max_len=2)
+    history, ids = baskets(200)
+    history = [[item for item in basket if item != 'honey'] + (['honey'] if i % 25 == 0 else [])
+               for i, basket in enumerate(history)]
+    store.ingest(history, ids)
+    assert store.item_ids['honey'] not in store.tracked
+    # honey with bread becomes common; its earlier pairs must be counted too
+    burst = [['bread', 'honey']] * 60
+    ingested, rebuilt = store.ingest(burst, [f"H{i}" for i in range(60)])
+    assert ingested == 60 and rebuilt
+    assert store.item_ids['honey'] in store.tracked
+    assert_exact(store, history + burst)
+
+def test_load_drops_a_partially_appended_save(tmp_path):
+    path = str(tmp_path)
+    store = IncrementalRuleStore(min_support=0.1)
+    history, ids = baskets(120)
+    store.ingest(history, ids)
+    store.save(path)
+    # An interrupted save: history appended, state never written
+    for name, tail in [('basket_items.bin', b'\x01\x00\x00\x00' * 5), ('basket_lengths.bin', b'\x05' + b'\x00' * 7),
+                       ('transactions.txt', b'T999\n')]:
+        with open(os.path.join(path, name), 'ab') as f:
+            f.write(tail)
+    loaded = IncrementalRuleStore.load(path)
+    assert loaded.n_baskets == 120 and 'T999' not in loaded.seen_transactions
+    assert_exact(loaded, history)
+
+    more, more_ids = baskets(80, seed=2, start=120)
+    loaded.ingest(more, more_ids)
+    loaded.save(path)
+    reloaded = IncrementalRuleStore.load(path)
+    assert reloaded.n_baskets == 200 and len(reloaded.seen_transactions) == 200
+    assert_exact(reloaded, history + more)
+
+def test_sync_catches_up_with_another_instance(tmp_path):
+    path = str(tmp_path)
+    IncrementalRuleStore(min_support=0.1).save(path)
+    first, second = IncrementalRuleStore.load(path), IncrementalRuleStore.load(path)
+    history, ids = baskets(100)
+    with first.sync(path):
+        first.ingest(history, ids)
+        first.save(path)
+    # A stale copy must not append over the other save
+    with pytest.raises(RuntimeError):
+        second.save(path)
+    more, more_ids = baskets(50, seed=3, start=100)
+    with second.sync(path):
+        assert second.n_baskets == 100
+        second.ingest(history + more, ids + more_ids)
+        second.save(path)
+    with first.sync(path):
+        assert first.n_baskets == 150
+        assert_exact(first, history + more)
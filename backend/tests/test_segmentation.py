@@ -0,0 +1,29 @@
+import numpy as np
+from utils.clustering import SegmentationModel
+
+# (recency days, purchases, spend) of four well separated customer groups
+GROUPS = {
+    'premium': (5, 40, 5000),
+    'regular': (30, 12, 1200),
+    'budget': (60, 4, 200),
+    'at_risk': (300, 3, 400),
+}
+
+def customers(per_group=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array(list(GROUPS.values()), dtype=float)
+    features = np.repeat(centers, per_group, axis=0) * rng.normal(1, 0.05, (len(centers) * per_group, 3))
+    return features, np.repeat(list(GROUPS), per_group)
+
+def test_segments_follow_the_groups(tmp_path):
+    features, groups = customers()
+    model = SegmentationModel(n_clusters=4).fit(features)
+    names = np.array(model.segment_names())[model.predict(features)]
+    assert (names == groups).all()
+    assert sorted(profile['size'] for profile in model.profiles()) == [200] * 4
+
+    path = str(tmp_path / 'segmentation.pkl')
+    model.save(path)
+    loaded = SegmentationModel.load(path)
+    new_features, new_groups = customers(per_group=20, seed=1)
+    assert (np.array(loaded.segment_names())[loaded.predict(new_features)] == new_groups).all()
@@ -0,0 +1,108 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+from bench.synthetic import RetailDataGenerator, transaction_records, transaction_rows
+from utils.clustering import aggregate_transactions
+from utils.market_basket import mine_frequent_itemsets, count_itemsets
+from utils.payloads import transaction_baskets
+from utils.sharding import (
+    shard_frame, local_itemsets, merge_itemset_counts, merge_customer_aggregates, merge_daily_sales
+)
+
+@pytest.fixture(scope='module')
+def data():
+    return RetailDataGenerator(seed=7).generate(6000)
+
+@pytest.fixture(scope='module')
+def client():
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+def itemset_supports(frequent_itemsets):
+    return {itemset: round(support, 9)
+            for itemset, support in zip(frequent_itemsets['itemsets'], frequent_itemsets['support'])}
+
+def rule_keys(result):
+    return sorted((tuple(rule['antecedent']), tuple(rule['consequent']), round(rule['support'], 9),
+                   round(rule['confidence'], 9), round(rule['lift'], 9)) for rule in result['rules'])
+
+def test_shard_frame(data):
+    lines = data['lines'].assign(store_id=data['lines']['store_id'].astype(object))
+    lines.loc[lines.index[:10], 'store_id'] = None
+    shards = shard_frame(lines, 'store')
+    assert [key for key, _ in shards] == sorted(key for key, _ in shards)
+    assert 'unknown' in dict(shards)
+    assert sum(len(rows) for _, rows in shards) == len(lines)
+    with pytest.raises(ValueError):
+        shard_frame(lines, 'region')
+    with pytest.raises(ValueError):
+        shard_frame(lines, 'city')
+
+def test_two_pass_itemsets_match_global_mining(data):
+    min_support = 0.02
+    shards = [transaction_baskets(rows)[0] for _, rows in shard_frame(data['lines'], 'store')]
+    local = [local_itemsets(baskets, min_support) for baskets in shards]
+    candidates = set().union(*(counts for _, counts in local))
+    parts = [
+        (n_baskets, {**counts, **count_itemsets(baskets, [c for c in candidates if c not in counts])})
+        for baskets, (n_baskets, counts) in zip(shards, local)
+    ]
+    merged, total = merge_itemset_counts(parts, min_support)
+    baskets = [basket for shard in shards for basket in shard]
+    assert total == len(baskets)
+    assert itemset_supports(merged) == itemset_supports(mine_frequent_itemsets(baskets, min_support))
+
+def test_merged_customer_aggregates_match_global(data):
+    transactions = data['transactions']
+    parts = [aggregate_transactions(rows) for _, rows in shard_frame(transactions, 'store')]
+    merged = merge_customer_aggregates(parts).sort_index()
+    expected = aggregate_transactions(transactions).sort_index()
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+
+def test_merged_daily_sales_match_global(data):
+    lines = data['lines'].assign(date=data['lines']['transaction_date'].dt.normalize(),
+                                 product_id=data['lines']['product_id'].astype(str))
+    daily = lambda rows: rows.groupby(['product_id', 'date'], as_index=False)['quantity'].sum() \
+        .rename(columns={'quantity': 'sales'})
+    merged = merge_daily_sales([daily(rows) for _, rows in shard_frame(lines, 'store')])
+    key = ['product_id', 'date']
+    pd.testing.assert_frame_equal(merged.sort_values(key, ignore_index=True),
+                                  daily(lines).sort_values(key, ignore_index=True), check_dtype=False)
+    assert merge_daily_sales([]).empty
+
+def test_sharded_market_basket_matches_unsharded(client, data):
+    body = {'transactions': transaction_records(data, 1500), 'min_support': 0.01, 'limit': None}
+    unsharded = client.post('/api/market-basket', json=body).json()
+    sharded = client.post('/api/market-basket', json=dict(body, shard_by='store')).json()
+    assert sharded['total_rules'] == unsharded['total_rules'] > 0
+    assert rule_keys(sharded) == rule_keys(unsharded)
+    assert sum(shard['baskets'] for shard in sharded['shards']) == 1500
+
+def test_sharded_segmentation_matches_unsharded(client, data):
+    body = {'customers': [], 'transactions': transaction_rows(data['transactions'].iloc[:3000]), 'refit': True}
+    unsharded = client.post('/api/customer-segmentation', json=body).json()
+    sharded = client.post('/api/customer-segmentation', json=dict(body, shard_by='store')).json()
+    assert sharded['customer_segments'] == unsharded['customer_segments']
+    assert sharded['segment_insights'] == unsharded['segment_insights']
+    assert len(sharded['shards']) > 1
+
+def test_sharded_batch_forecast_matches_unsharded(client, data):
+    lines = data['lines']
+    sales = lines.assign(
+        date=lines['transaction_date'].dt.strftime('%Y-%m-%d'), product_id=lines['product_id'].astype(str),
+        store_id=lines['store_id'].astype(str)
+    ).groupby(['product_id', 'date', 'store_id'], as_index=False)['quantity'].sum() \
+        .rename(columns={'quantity': 'sales'})
+    # The unsharded forecast expects one row per product and day
+    daily = sales.groupby(['product_id', 'date'], as_index=False)['sales'].sum()
+    unsharded = client.post('/api/sales-forecast/batch', json={'sales': daily.to_dict('records')}).json()
+    sharded = client.post('/api/sales-forecast/batch',
+                          json={'sales': sales.to_dict('records'), 'shard_by': 'store'}).json()
+    by_product = lambda result: {forecast['product_id']: forecast for forecast in result['forecasts']}
+    assert by_product(sharded) == by_product(unsharded)
+    assert sharded['total_reorder_units'] == unsharded['total_reorder_units']
+
+def test_bad_shard_by_is_rejected(client):
+    response = client.post('/api/market-basket', json={'transactions': [], 'shard_by': 'city'})
+    assert response.status_code == 400
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import select, func
+from bench.synthetic import RetailDataGenerator
+from database.loader import StarSchemaLoader
+from database.queries import load_baskets, load_customer_rfm, warehouse_version
+from database.rollups import query_sales, refresh_rollups
+from database.warehouse import create_data_warehouse, FactSales, DimCustomer, DimProduct, DimStore, DimDate
+from utils.clustering import calculate_rfm_features
+
+@pytest.fixture(scope='module')
+def lines():
+    return RetailDataGenerator(seed=13).generate(3000)['lines']
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_data_warehouse(f"sqlite:///{tmp_path / 'warehouse.db'}")
+
+def count(engine, table):
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(table)).scalar()
+
+def test_batches_load_each_dimension_member_once(engine, lines):
+    first, second = lines.iloc[:1800], lines.iloc[1800:]
+    loader = StarSchemaLoader(engine, batch_size=500)
+    assert loader.load(first) == len(first)
+    # A fresh loader reads the existing keys back instead of duplicating them
+    assert StarSchemaLoader(engine, batch_size=500).load(second) == len(second)
+
+    assert count(engine, FactSales) == len(lines)
+    assert count(engine, DimCustomer) == lines['customer_id'].nunique()
+    assert count(engine, DimProduct) == lines['product_id'].nunique()
+    assert count(engine, DimStore) == lines['store_id'].nunique()
+    assert count(engine, DimDate) == lines['transaction_date'].dt.normalize().nunique()
+
+    with engine.connect() as conn:
+        facts = pd.read_sql(
+            select(FactSales.transaction_id, DimProduct.product_key, FactSales.quantity, FactSales.revenue,
+                   FactSales.date_id)
+            .join(DimProduct, FactSales.product_id == DimProduct.product_id)
+            .order_by(FactSales.sale_id), conn
+        )
+    np.testing.assert_array_equal(facts['transaction_id'], lines['transaction_id'].astype(str))
+    np.testing.assert_array_equal(facts['product_key'], lines['product_id'].astype(str))
+    np.testing.assert_array_equal(facts['quantity'], lines['quantity'])
+    np.testing.assert_allclose(facts['revenue'], lines['total'])
+    np.testing.assert_array_equal(facts['date_id'], lines['transaction_date'].dt.strftime('%Y%m%d').astype(int))
+
+@pytest.fixture
+def loaded(engine, lines):
+    StarSchemaLoader(engine).load(lines)
+    return engine
+
+def test_scoped_baskets_match_the_source_lines(loaded, lines):
+    scope = {'start_date': '2023-03-01', 'end_date': '2023-05-31', 'store': str(lines['store_id'].iloc[0])}
+    baskets, transaction_ids = load_baskets(loaded, scope)
+
+    day = lines['transaction_date'].dt.normalize()
+    selected = lines[(day >= scope['start_date']) & (day <= scope['end_date'])
+                     & (lines['store_id'].astype(str) == scope['store'])]
+    expected = selected.groupby('transaction_id', sort=False, observed=True)['product_name'].apply(list)
+    assert len(baskets) > 0
+    assert dict(zip(transaction_ids, baskets)) == {str(key): value for key, value in expected.items()}
+
+def test_customer_rfm_from_sql_matches_pandas(loaded, lines):
+    # The warehouse keeps days, not times of day
+    expected = calculate_rfm_features(lines.assign(
+        transaction_date=lines['transaction_date'].dt.normalize(), customer_id=lines['customer_id'].astype(str)
+    ))
+    actual = load_customer_rfm(loaded)
+    pd.testing.assert_frame_equal(
+        actual.sort_values('customer_id', ignore_index=True),
+        expected.sort_values('customer_id', ignore_index=True),
+        check_dtype=False
+    )
+
+def test_rollups_track_two_incremental_loads(engine, lines):
+    first, second = lines.iloc[:2000], lines.iloc[2000:]
+    loader = StarSchemaLoader(engine)
+    loader.load(first)
+    assert refresh_rollups(engine)['facts'] == len(first)
+    version = warehouse_version(engine)
+    loader.load(second)
+    assert warehouse_version(engine) > version
+    # Only the facts past the watermark are folded in
+    assert refresh_rollups(engine)['facts'] == len(second)
+    assert refresh_rollups(engine)['facts'] == 0
+
+    month = lines['transaction_date'].dt.strftime('%Y-%m')
+    for by, key in [('category', lines['category']), ('product', lines['product_id'].astype(str))]:
+        expected = lines.groupby([month.rename('period'), key.rename('key')], observed=True)[['quantity', 'total']].sum()
+        rollup, table = query_sales(engine, 'month', by=by)
+        assert table == f'rollup_sales_month_{by}'
+        key_column = 'product_key' if by == 'product' else by
+        actual = rollup.set_index(['period', key_column]).rename_axis(['period', 'key'])
+        actual = actual.loc[expected.index]
+        np.testing.assert_array_equal(actual['quantity'], expected['quantity'])
+        np.testing.assert_allclose(actual['revenue'], expected['total'])
+
+    quarters, table = query_sales(engine, 'quarter', start_date='2023-01-01', end_date='2023-06-30')
+    assert table == 'rollup_sales_quarter_category'
+    in_range = lines['transaction_date'] < '2023-07-01'
+    np.testing.assert_allclose(quarters['revenue'].sum(), lines.loc[in_range, 'total'].sum())
@@ -0,0 +1,244 @@
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+
+# Feature group -> anomaly type reported when that group stands out most
+ANOMALY_TYPES = {
+    'amount': "Unusual Transaction Amount",
+    'items': "Unusual Basket Size",
+    'hour': "Unusual Purchase Time",
+    'customer': "Out-of-Pattern Customer Spend",
+    'payment': "Rare Payment Method",
+}
+
+# Shares below this are rare; unseen values are floored at a tenth of it
+RARE_SHARE = 0.001
+
+ANOMALY_SORT_COLUMNS = ('anomaly_score', 'severity')
+SEVERITY_RANK = {"High": 0, "Medium": 1}
+
+def query_anomalies(scored, sort_by='anomaly_score', severity=None, anomaly_type=None, max_score=None,
+                    offset=0, limit=100):
+    """Flagged rows of ``AnomalyModel.score`` output, filtered, sorted and paged with column operations.
+
+    Sorts most anomalous first, by score or by severity then score. Returns
+    the page and the number of flagged rows matching the filters; a ``limit``
+    of None returns every match from ``offset`` on.
+    """
+    if sort_by not in ANOMALY_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort column '{sort_by}'. Use one of: {', '.join(ANOMALY_SORT_COLUMNS)}")
+    mask = scored['is_anomaly'].to_numpy(dtype=bool)
+    if severity is not None:
+        mask &= (scored['severity'] == severity).to_numpy()
+    if anomaly_type is not None:
+        mask &= (scored['anomaly_type'] == anomaly_type).to_numpy()
+    if max_score is not None:
+        mask &= scored['anomaly_score'].to_numpy() <= max_score
+    matching = np.flatnonzero(mask)
+    scores = scored['anomaly_score'].to_numpy()[matching]
+    if sort_by == 'severity':
+        rank = scored['severity'].iloc[matching].map(SEVERITY_RANK).to_numpy()
+        order = np.lexsort((scores, rank))
+    else:
+        order = np.argsort(scores, kind='stable')
+    end = None if limit is None else offset + limit
+    return scored.iloc[matching[order][offset:end]], len(matching)
+
+class ModelNotTrained(Exception):
+    """No saved model to score with, and too few transactions to train one"""
+
+def _column(df, name, default=np.nan):
+    return df[name] if name in df else pd.Series(default, index=df.index)
+
+class AnomalyModel:
+    """Persisted multi-feature IsolationForest for transaction scoring.
+
+    Features are log amount, item count, rarity of the hour of day and of
+    the payment method, and how far the amount is from the customer's own
+    history. Each is a single numeric column, so no feature dilutes the
+    random splits of the forest. Trees can only split inside the range seen
+    in training, so values far outside it (and rare hours and payment
+    methods) are flagged by explicit limits as well.
+
+    ``fit`` trains once on a sample; ``score`` is a pure vectorized pass, so
+    any number of processes can score with the same saved model. Flagging
+    uses quantiles of the training scores, so the contamination rate can
+    change per request without retraining.
+    """
+
+    def __init__(self, n_estimators=100, sample_size=100_000, random_state=42):
+        self.n_estimators = n_estimators
+        self.sample_size = sample_size
+        self.random_state = random_state
+        self.forest = None
+        self.hour_share = None
+        self.payment_share = {}
+        self.customer_stats = None
+        self.fill_values = None
+        self.feature_mean = None
+        self.feature_std = None
+        self.limits = None
+        self.score_quantiles = None
+        self.trained_at = None
+        self.n_trained = 0
+
+    @property
+    def is_fitted(self):
+        return self.forest is not None
+
+    def _base_features(self, df):
+        amount = pd.to_numeric(_column(df, 'total_amount', 0), errors='coerce').fillna(0).clip(lower=0)
+        if 'items' in df:
+            items = df['items'].map(lambda items: len(items) if isinstance(items, (list, np.ndarray)) else np.nan)
+        else:
+            items = pd.to_numeric(_column(df, 'item_count'), errors='coerce')
+        timestamps = pd.to_datetime(_column(df, 'transaction_date', None), errors='coerce', format='mixed')
+        hour = timestamps.dt.hour + timestamps.dt.minute / 60
+        return pd.DataFrame({
+            'customer_id': _column(df, 'customer_id', None).astype(str).to_numpy(),
+            'amount': np.log1p(amount.to_numpy(dtype=float)),
+            'items': items.to_numpy(dtype=float),
+            'hour': hour.to_numpy(dtype=float),
+            'payment_method': _column(df, 'payment_method', None).to_numpy(dtype=object),
+        }, index=df.index)
+
+    def _features(self, base, fill=True):
+        features = pd.DataFrame({'amount': base['amount'], 'items': base['items']})
+        # Rarities are -log share in training; missing inputs are filled like
+        # any other missing feature rather than counted as rare
+        hour_share = np.where(base['hour'].notna(), self.hour_share[base['hour'].fillna(0).astype(int) % 24], np.nan)
+        features['hour'] = -np.log(np.maximum(hour_share, RARE_SHARE / 10))
+        # Deviation from the customer's own mean log amount, in their std devs
+        stats = self.customer_stats.reindex(base['customer_id'])
+        deviation = (base['amount'].to_numpy() - stats['mean'].to_numpy()) / stats['std'].to_numpy()
+        features['customer'] = np.where(stats['count'].to_numpy() >= 2, deviation, 0.0)
+        method = base['payment_method']
+        share = method.map(self.payment_share).fillna(0.0).where(method.notna()).to_numpy(dtype=float)
+        features['payment'] = -np.log(np.maximum(share, RARE_SHARE / 10))
+        return features.fillna(self.fill_values).fillna(0.0) if fill else features
+
+    def fit(self, df):
+        """Train on (a sample of) transactions, learning per-customer history from all of them"""
+        base = self._base_features(df)
+
+        # Per-customer mean/std of log amount; a floor on std keeps one-off
+        # repeat amounts from producing infinite deviations
+        grouped = base.groupby('customer_id', sort=False)['amount']
+        self.customer_stats = pd.DataFrame({
+            'count': grouped.size(),
+            'mean': grouped.mean(),
+            'std': grouped.std(ddof=0).clip(lower=0.1),
+        })
+
+        hours = base['hour'].dropna().astype(int) % 24
+        self.hour_share = np.bincount(hours, minlength=24) / max(len(hours), 1)
+        self.payment_share = base['payment_method'].dropna().astype(str).value_counts(normalize=True).to_dict()
+
+        if len(base) > self.sample_size:
+            base = base.sample(self.sample_size, random_state=self.random_state)
+        features = self._features(base, fill=False)
+        self.fill_values = features.median()
+        features = features.fillna(self.fill_values).fillna(0.0)
+
+        # Imported on first fit; scikit-learn is slow to import and loading a
+        # pickled model imports it anyway
+        from sklearn.ensemble import IsolationForest
+        self.forest = IsolationForest(
+            n_estimators=self.n_estimators, random_state=self.random_state, n_jobs=1
+        ).fit(features.to_numpy())
+        scores = self.forest.score_samples(features.to_numpy())
+        self.score_quantiles = np.quantile(scores, np.linspace(0, 1, 1001))
+        self.feature_mean = features.mean()
+        self.feature_std = features.std(ddof=0).replace(0, 1)
+        # Normal range widened by half its span; rarities are only bounded above
+        low, high = features.quantile(0.001), features.quantile(0.999)
+        self.limits = pd.DataFrame({'lower': low - (high - low) / 2, 'upper': high + (high - low) / 2})
+        self.limits.loc[['hour', 'payment'], 'lower'] = -np.inf
+        self.limits.loc[['hour', 'payment'], 'upper'] = -np.log(RARE_SHARE)
+        self.trained_at = time.time()
+        self.n_trained = len(features)
+        return self
+
+    def threshold(self, contamination):
+        """Score below which the given share of training transactions falls"""
+        return float(np.interp(contamination, np.linspace(0, 1, 1001), self.score_quantiles))
+
+    def score(self, df, contamination=0.1):
+        """Score transactions in one vectorized pass.
+
+        Returns one row per transaction with its anomaly score (lower is more
+        anomalous), whether it is flagged and, for flagged rows, the feature
+        that stands out most as anomaly type and reason. Rows outside the
+        training limits are always flagged, with High severity.
+        """
+        base = self._base_features(df)
+        features = self._features(base)
+        scores = self.forest.score_samples(features.to_numpy())
+        outside = (features < self.limits['lower']) | (features > self.limits['upper'])
+        out_of_range = outside.any(axis=1).to_numpy()
+        result = pd.DataFrame({
+            'transaction_id': _column(df, 'transaction_id', None).astype(str).to_numpy(),
+            'anomaly_score': scores,
+            'is_anomaly': (scores < self.threshold(contamination)) | out_of_range,
+        }, index=df.index)
+        if 'transaction_id' not in df:
+            result['transaction_id'] = df.index.astype(str)
+
+        flagged = result['is_anomaly'].to_numpy()
+        result['anomaly_type'] = None
+        result['reason'] = None
+        result['severity'] = None
+        if flagged.any():
+            explained = self._explain(base[flagged], features[flagged], outside[flagged])
+            result.loc[flagged, ['anomaly_type', 'reason']] = explained.to_numpy()
+            high = (np.abs(scores) > 0.5) | out_of_range
+            result.loc[flagged, 'severity'] = np.where(high[flagged], "High", "Medium")
+        return result
+
+    def _explain(self, base, features, outside):
+        z = (features - self.feature_mean) / self.feature_std
+        share = base['payment_method'].map(self.payment_share).fillna(0.0)
+        hour = (base['hour'].fillna(0) // 1).astype(int) % 24
+        signals = pd.DataFrame({
+            'amount': z['amount'].abs(),
+            'items': z['items'].abs(),
+            # Common hours and payment methods never explain a row
+            'hour': z['hour'].where(features['hour'] > -np.log(0.01), 0.0),
+            'customer': features['customer'].abs(),
+            'payment': z['payment'].where(features['payment'] > -np.log(0.01), 0.0),
+        })
+        # A feature outside the training limits always explains the row
+        signals += outside.reindex(columns=signals.columns, fill_value=False).to_numpy() * 1000
+        kind = signals.idxmax(axis=1)
+
+        amount = np.expm1(base['amount']).map('{:,.2f}'.format)
+        direction = np.where(z['amount'] > 0, "above", "below")
+        reasons = {
+            'amount': "Amount $" + amount + " is far " + direction + " the normal range",
+            'items': base['items'].fillna(0).astype(int).astype(str) + " items in one transaction",
+            'hour': "Purchased at " + hour.map('{:02d}:00'.format) + ", when "
+                + pd.Series(self.hour_share[hour], index=base.index).map('{:.2%}'.format) + " of transactions happen",
+            'customer': "Amount $" + amount + " is " + features['customer'].abs().map('{:.1f}'.format)
+                + " standard deviations from this customer's usual spend",
+            'payment': "Paid with " + base['payment_method'].astype(str) + ", used in " + share.map('{:.2%}'.format)
+                + " of transactions",
+        }
+        reason = pd.Series(None, index=base.index, dtype=object)
+        for name, text in reasons.items():
+            reason = reason.where(kind != name, text)
+        return pd.DataFrame({'anomaly_type': kind.map(ANOMALY_TYPES), 'reason': reason})
+
+    def save(self, path):
+        """Write the model atomically, so concurrent readers never see a partial file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from utils.locking import file_lock
+
+class ResultCache:
+    """Content-addressed cache for analysis results.
+
+    Keys are SHA-256 digests of the canonical JSON of the input payload and
+    parameters, prefixed with a namespace (usually the endpoint name) so a
+    whole namespace can be invalidated. Lookups go through an in-memory LRU
+    first, then a directory of pickles that is trimmed back under
+    ``max_disk_bytes`` by evicting the least recently used files.
+
+    Several processes (serve.py workers) can share the directory: writes,
+    eviction and invalidation hold a file lock, eviction measures the
+    directory itself rather than trusting one process's count, and
+    ``invalidate`` bumps a generation file that makes every process drop
+    its in-memory entries on its next lookup.
+    """
+
+    def __init__(self, directory, max_memory_items=128, max_disk_bytes=512 * 1024 * 1024, version=1):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.version = version
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+        self._file_lock = file_lock(os.path.join(directory, 'cache.lock'))
+        self._generation_path = os.path.join(directory, 'generation')
+        self._generation = self._read_generation()
+        self._disk_bytes = self._measure_disk()
+
+    def _read_generation(self):
+        try:
+            stat = os.stat(self._generation_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _check_generation(self):
+        """Drop the memory tier when any process invalidated since the last lookup; call holding ``_lock``"""
+        generation = self._read_generation()
+        if generation != self._generation:
+            self._memory.clear()
+            self._generation = generation
+
+    def _measure_disk(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith('.pkl'))
+
+    def make_key(self, namespace, payload, params=None):
+        """Stable key for a payload and its parameters, independent of dict key order"""
+        canonical = json.dumps(
+            {'version': self.version, 'params': params or {}, 'payload': payload},
+            sort_keys=True, separators=(',', ':'), default=str
+        )
+        return f"{namespace}-{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pkl')
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Cached value for ``key``, or None on a miss"""
+        with self._lock:
+            self._check_generation()
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return self._memory[key]
+        
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self._lock:
+                self.counters['misses'] += 1
+            return None
+        
+        with self._lock:
+            self.counters['disk_hits'] += 1
+            self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        
+        with self._file_lock, self._lock:
+            os.replace(tmp_path, path)
+            self.counters['stores'] += 1
+            self._check_generation()
+            self._remember(key, value)
+            # Other processes write here too, so the directory is measured, not counted
+            self._disk_bytes = self._measure_disk()
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith('.pkl')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._memory.pop(entry.name[:-len('.pkl')], None)
+            self._disk_bytes -= size
+            self.counters['evictions'] += 1
+
+    def invalidate(self, namespace=None):
+        """Drop every entry, or only those of one namespace; returns the number removed"""
+        prefix = f"{namespace}-" if namespace else ''
+        removed = 0
+        with self._file_lock, self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pkl') and entry.name.startswith(prefix):
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    removed += 1
+            # Every process drops its memory tier on its next lookup, this one included
+            tmp_path = f"{self._generation_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(f"{time.time_ns()}\n")
+            os.replace(tmp_path, self._generation_path)
+            self._check_generation()
+            self._disk_bytes = self._measure_disk()
+        return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['memory_hits'] + self.counters['disk_hits'] + self.counters['misses']
+            hits = lookups - self.counters['misses']
+            return {
+                **self.counters,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes
+            }
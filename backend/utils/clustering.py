@@ -1,23 +1,299 @@
-from sklearn.cluster import KMeans, DBSCAN
-from sklearn.preprocessing import StandardScaler
+import os
+import pickle
+import time
 import numpy as np
+import pandas as pd
+from database.loader import SOURCE_COLUMNS
+
+RFM_FEATURES = ['recency', 'frequency', 'monetary']
+
+# Source columns tried in order, for raw transactions and for customer records
+CUSTOMER_COLUMNS = ['customer_id', 'customer_email', 'email', 'customer_name']
+TRANSACTION_DATE_COLUMNS = ['transaction_date', 'date', 'order_date']
+# Transaction totals first, then the line revenue columns the warehouse loader reads
+AMOUNT_COLUMNS = ['total_amount', 'amount', *SOURCE_COLUMNS['revenue']]
+
+SEGMENT_RECOMMENDATIONS = {
+    'premium': "Offer VIP programs and exclusive access",
+    'regular': "Implement loyalty rewards",
+    'budget': "Target with promotional campaigns",
+    'at_risk': "Re-engagement campaigns needed",
+}
 
 def perform_kmeans_clustering(features, n_clusters=4):
     """Perform K-Means clustering"""
-    scaler = StandardScaler()
-    features_scaled = scaler.fit_transform(features)
+    model = SegmentationModel(n_clusters=n_clusters).fit(features)
+    return model.predict(features), model.kmeans
+
+def _first_column(df, candidates):
+    for column in candidates:
+        if column in df:
+            return column
+    return None
+
+def aggregate_transactions(transactions_df):
+    """Per-customer first/last purchase, transaction count and spend.
+
+    One vectorized groupby over the transactions; rows sharing a transaction
+    ID count as one purchase. The result can be merged with earlier
+    aggregates, see ``RFMStore``.
+    """
+    customer = _first_column(transactions_df, CUSTOMER_COLUMNS)
+    date = _first_column(transactions_df, TRANSACTION_DATE_COLUMNS)
+    amount = _first_column(transactions_df, AMOUNT_COLUMNS)
+    if customer is None or date is None:
+        raise ValueError("Transactions need a customer and a transaction date column")
+    
+    df = pd.DataFrame({
+        'customer_id': transactions_df[customer],
+        'date': pd.to_datetime(transactions_df[date], errors='coerce'),
+        'amount': pd.to_numeric(transactions_df[amount], errors='coerce').fillna(0) if amount else 0.0,
+    }).dropna(subset=['customer_id', 'date'])
+    
+    grouped = df.groupby('customer_id', sort=False)
+    aggregates = grouped.agg(
+        first_purchase=('date', 'min'), last_purchase=('date', 'max'), monetary=('amount', 'sum')
+    )
+    if 'transaction_id' in transactions_df:
+        purchases = transactions_df.loc[df.index, 'transaction_id']
+        aggregates['frequency'] = df.assign(purchase=purchases).drop_duplicates(['customer_id', 'purchase']) \
+            .groupby('customer_id', sort=False).size()
+    else:
+        aggregates['frequency'] = grouped.size()
+    return aggregates[['first_purchase', 'last_purchase', 'frequency', 'monetary']]
+
+def rfm_from_aggregates(aggregates, reference_date=None):
+    """RFM features plus average basket value and tenure from purchase aggregates.
+
+    Recency and tenure are in days before ``reference_date``, which defaults
+    to the latest purchase.
+    """
+    reference = pd.Timestamp(reference_date) if reference_date else aggregates['last_purchase'].max()
+    frequency = aggregates['frequency'].astype(float)
+    return pd.DataFrame({
+        'customer_id': aggregates.index,
+        'recency': (reference - aggregates['last_purchase']).dt.days.to_numpy(),
+        'frequency': frequency.to_numpy(),
+        'monetary': aggregates['monetary'].to_numpy(dtype=float),
+        'avg_basket': (aggregates['monetary'] / frequency.where(frequency > 0)).fillna(0).to_numpy(),
+        'tenure': (reference - aggregates['first_purchase']).dt.days.to_numpy(),
+    })
+
+def calculate_rfm_features(df, reference_date=None):
+    """Calculate RFM features for customer segmentation.
+
+    ``df`` is either raw transactions (customer, date and amount per row),
+    which are aggregated per customer, or customer records carrying
+    ``total_purchases``, ``total_spent`` and ``recency`` or
+    ``last_purchase_date``. Missing values in customer records take the
+    column median rather than a fixed default.
+    """
+    if _first_column(df, TRANSACTION_DATE_COLUMNS) and _first_column(df, AMOUNT_COLUMNS):
+        return rfm_from_aggregates(aggregate_transactions(df), reference_date)
     
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-    labels = kmeans.fit_predict(features_scaled)
+    customer = _first_column(df, CUSTOMER_COLUMNS)
+    features = pd.DataFrame({'customer_id': df[customer] if customer else df.index}, index=df.index)
+    if 'recency' in df:
+        features['recency'] = pd.to_numeric(df['recency'], errors='coerce')
+    elif 'last_purchase_date' in df:
+        last_purchase = pd.to_datetime(df['last_purchase_date'], errors='coerce')
+        reference = pd.Timestamp(reference_date) if reference_date else last_purchase.max()
+        features['recency'] = (reference - last_purchase).dt.days
+    else:
+        features['recency'] = np.nan
+    features['frequency'] = pd.to_numeric(df['total_purchases'], errors='coerce') if 'total_purchases' in df else np.nan
+    features['monetary'] = pd.to_numeric(df['total_spent'], errors='coerce') if 'total_spent' in df else np.nan
+    features['avg_basket'] = features['monetary'] / features['frequency'].where(features['frequency'] > 0)
     
-    return labels, kmeans
-
-def calculate_rfm_features(customers_df):
-    """Calculate RFM features for customer segmentation"""
-    # This is a simplified version - implement full RFM logic
-    features = {
-        'recency': customers_df.get('recency', [0] * len(customers_df)),
-        'frequency': customers_df.get('total_purchases', [0] * len(customers_df)),
-        'monetary': customers_df.get('total_spent', [0] * len(customers_df))
-    }
-    return features
+    columns = ['recency', 'frequency', 'monetary', 'avg_basket']
+    features[columns] = features[columns].astype(float).fillna(features[columns].median()).fillna(0)
+    return features.reset_index(drop=True)
+
+class RFMStore:
+    """Running per-customer purchase aggregates for incremental RFM.
+
+    ``update`` aggregates only the new transactions and merges them into the
+    stored aggregates (min/max dates, summed counts and spend), so features
+    stay current without re-reading the history. Transaction IDs already
+    seen are skipped, so the same transactions can be re-posted safely.
+
+    ``save`` pickles the aggregates and appends the newly seen IDs to a log
+    beside them (``<path>.transactions``), so the ever-growing ID set is
+    not rewritten on every update. Saves must not run concurrently.
+    """
+
+    def __init__(self):
+        self.aggregates = pd.DataFrame(
+            {'first_purchase': pd.Series(dtype='datetime64[ns]'), 'last_purchase': pd.Series(dtype='datetime64[ns]'),
+             'frequency': pd.Series(dtype='int64'), 'monetary': pd.Series(dtype=float)}
+        )
+        self.seen_transactions = set()
+        self._unsaved_transactions = []
+        self._transactions_size = 0
+
+    @property
+    def n_customers(self):
+        return len(self.aggregates)
+
+    def update(self, transactions_df):
+        """Fold new transactions in; returns the number of rows ingested"""
+        if 'transaction_id' in transactions_df:
+            # Membership per new row, rather than hashing the whole seen set
+            ids = transactions_df['transaction_id'].astype(str).tolist()
+            seen = np.fromiter((i in self.seen_transactions for i in ids), dtype=bool, count=len(ids))
+            transactions_df = transactions_df[~seen]
+            # Line items repeat their transaction's ID; each is recorded once
+            new_ids = list(dict.fromkeys(i for i, skip in zip(ids, seen) if not skip))
+            self.seen_transactions.update(new_ids)
+            self._unsaved_transactions.extend(new_ids)
+        if len(transactions_df) == 0:
+            return 0
+        
+        new = aggregate_transactions(transactions_df)
+        positions = self.aggregates.index.get_indexer(new.index)
+        known = positions >= 0
+        if known.any():
+            rows, updates = positions[known], new[known]
+            current = self.aggregates.iloc[rows]
+            self.aggregates.iloc[rows] = pd.DataFrame({
+                'first_purchase': np.minimum(current['first_purchase'].to_numpy(), updates['first_purchase'].to_numpy()),
+                'last_purchase': np.maximum(current['last_purchase'].to_numpy(), updates['last_purchase'].to_numpy()),
+                'frequency': current['frequency'].to_numpy() + updates['frequency'].to_numpy(),
+                'monetary': current['monetary'].to_numpy() + updates['monetary'].to_numpy(),
+            }, index=current.index)
+        self.aggregates = pd.concat([self.aggregates, new[~known]]) if self.n_customers else new
+        return len(transactions_df)
+
+    def features(self, reference_date=None):
+        return rfm_from_aggregates(self.aggregates, reference_date)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # The log is first cut back to its saved length, dropping any tail an
+        # interrupted save left, so it stays aligned with the pickle
+        with open(path + '.transactions', 'ab') as f:
+            f.truncate(self._transactions_size)
+            f.write(''.join(f"{transaction_id}\n" for transaction_id in self._unsaved_transactions).encode('utf-8'))
+            transactions_size = f.tell()
+        state = {'aggregates': self.aggregates, 'transactions_size': transactions_size}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._unsaved_transactions = []
+        self._transactions_size = transactions_size
+
+    @classmethod
+    def load(cls, path):
+        """Load a store written by ``save``, ignoring IDs logged after its pickle"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        store = cls()
+        store.aggregates = state['aggregates']
+        with open(path + '.transactions', 'rb') as f:
+            logged = f.read(state['transactions_size'])
+        store.seen_transactions = set(logged.decode('utf-8').splitlines())
+        store._transactions_size = state['transactions_size']
+        return store
+
+class SegmentationModel:
+    """Persistent scaler + MiniBatchKMeans customer segmentation model.
+
+    ``fit`` trains on the full per-customer feature matrix in mini-batches,
+    in the order given. Once trained, ``predict`` assigns customers to the
+    nearest of the k centroids without refitting. Segment names and profiles
+    are derived from the centroids, so they follow the data rather than
+    cluster order.
+    """
+
+    def __init__(self, n_clusters=4, batch_size=4096, feature_names=None, random_state=42):
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+        self.feature_names = list(feature_names or RFM_FEATURES)
+        self.random_state = random_state
+        # Imported here so modules that only need the RFM helpers stay light
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler()
+        self.kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters, batch_size=batch_size, random_state=random_state, n_init=3
+        )
+        self.counts = np.zeros(n_clusters, dtype=np.int64)
+        self.trained_at = None
+
+    @property
+    def is_fitted(self):
+        return self.trained_at is not None
+
+    def fit(self, features):
+        features = np.asarray(features, dtype=float)
+        scaled = self.scaler.fit_transform(features)
+        labels = self.kmeans.fit_predict(scaled)
+        self.counts = np.bincount(labels, minlength=self.n_clusters)
+        self.trained_at = time.time()
+        return self
+
+    def predict(self, features):
+        return self.kmeans.predict(self.scaler.transform(np.asarray(features, dtype=float)))
+
+    def segment_names(self):
+        """Name each cluster from its scaled centroid.
+
+        Clusters are ranked by value (spend and frequency up, recency down):
+        the best is 'premium', the most lapsed 'at_risk', the rest 'regular'
+        and 'budget' in order of value.
+        """
+        centers = dict(zip(self.feature_names, self.kmeans.cluster_centers_.T))
+        value = centers.get('monetary', 0) + centers.get('frequency', 0) - centers.get('recency', 0)
+        order = list(np.argsort(-value))
+        names = [None] * self.n_clusters
+        names[order.pop(0)] = 'premium'
+        if order and 'recency' in centers:
+            lapsed = max(order, key=lambda cluster: centers['recency'][cluster])
+            order.remove(lapsed)
+            names[lapsed] = 'at_risk'
+        tiers = {}
+        for rank, cluster in enumerate(order):
+            tiers.setdefault('regular' if rank < len(order) / 2 else 'budget', []).append(cluster)
+        # Numbered when k > 4 puts several clusters in one tier
+        for tier, clusters in tiers.items():
+            for i, cluster in enumerate(clusters, 1):
+                names[cluster] = tier if len(clusters) == 1 else f"{tier}_{i}"
+        return names
+
+    def profiles(self, labels=None):
+        """Per-segment centroid (in original units), size and recommendation"""
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        sizes = self.counts if labels is None else np.bincount(labels, minlength=self.n_clusters)
+        profiles = []
+        for cluster, name in enumerate(self.segment_names()):
+            centroid = dict(zip(self.feature_names, centers[cluster].round(2).tolist()))
+            if set(RFM_FEATURES) <= set(centroid):
+                characteristics = (
+                    f"Last purchase {centroid['recency']:.0f} days ago, {centroid['frequency']:.1f} purchases, "
+                    f"${centroid['monetary']:,.2f} spent on average"
+                )
+            else:
+                characteristics = ", ".join(f"{feature} {value:,.2f}" for feature, value in centroid.items())
+            profiles.append({
+                "segment": name,
+                "cluster": cluster,
+                "size": int(sizes[cluster]),
+                "centroid": centroid,
+                "characteristics": characteristics,
+                "recommendation": SEGMENT_RECOMMENDATIONS.get(name) or SEGMENT_RECOMMENDATIONS[name.rsplit('_', 1)[0]],
+            })
+        return profiles
+
+    def save(self, path):
+        """Write the model atomically, so concurrent readers never see a partial file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
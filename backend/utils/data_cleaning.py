@@ -1,3 +1,5 @@
+import os
+import tempfile
 import pandas as pd
 import numpy as np
 
@@ -7,18 +9,32 @@ def clean_dataset(df):
     df = df.drop_duplicates()
     
     # Handle missing values
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
-    
-    categorical_cols = df.select_dtypes(include=['object']).columns
-    for col in categorical_cols:
-        df[col] = df[col].fillna(df[col].mode()[0] if not df[col].mode().empty else 'Unknown')
+    df = fill_missing(df)
     
     # Normalize column names
     df.columns = df.columns.str.lower().str.replace(' ', '_')
     
     return df
 
+def fill_missing(df):
+    """Fill numeric gaps with column medians and text gaps with column modes, a whole block at a time.
+
+    Ties between modes go to the smallest value, like ``Series.mode()[0]``;
+    text columns with no values at all get 'Unknown'.
+    """
+    df = df.copy()
+    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    if len(numeric_cols):
+        df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].median())
+    
+    categorical_cols = df.select_dtypes(include=['object']).columns
+    missing = categorical_cols[df[categorical_cols].isna().any().to_numpy()] if len(categorical_cols) else categorical_cols
+    if len(missing):
+        modes = df[missing].mode(dropna=True)
+        fill = modes.iloc[0] if len(modes) else pd.Series(np.nan, index=missing, dtype=object)
+        df[missing] = df[missing].fillna(fill.fillna('Unknown'))
+    return df
+
 def generate_cleaning_report(original_df, cleaned_df):
     """Generate data cleaning report"""
     return {
@@ -26,4 +42,225 @@ def generate_cleaning_report(original_df, cleaned_df):
         "cleaned_shape": cleaned_df.shape,
         "duplicates_removed": original_df.shape[0] - cleaned_df.shape[0],
         "missing_values_handled": original_df.isnull().sum().to_dict()
-    }
\ No newline at end of file
+    }
+
+def normalize_column_names(columns):
+    """Lower-case column names and strip everything but [a-z0-9_]"""
+    return columns.str.lower().str.replace(' ', '_').str.replace('[^a-z0-9_]', '', regex=True)
+
+def iter_file_chunks(path, chunksize=100_000):
+    """Yield DataFrame chunks of a CSV or Excel file without loading it whole"""
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=chunksize)
+    elif path.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) == chunksize:
+                    yield pd.DataFrame.from_records(batch, columns=header)
+                    batch = []
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=header)
+        finally:
+            workbook.close()
+    elif path.endswith('.xls'):
+        # Legacy .xls has no streaming reader; it is read in one piece
+        yield pd.read_excel(path)
+    else:
+        raise ValueError("Unsupported file format. Use CSV or Excel.")
+
+# Hash of a missing value in any column
+_MISSING_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+def _row_hashes(chunk):
+    """64-bit row hashes, stable across chunks whose column dtypes differ.
+
+    Numbers hash as float64, and missing values hash alike whatever their
+    column was parsed as (in a chunk where a text column is empty, it is float).
+    """
+    hashes = np.zeros(len(chunk), dtype=np.uint64)
+    for col in chunk.columns:
+        values = chunk[col]
+        if values.dtype.kind in 'iuf':
+            values = values.astype('float64')
+        column_hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        column_hashes[values.isna().to_numpy()] = _MISSING_HASH
+        # Order-dependent combine; uint64 arithmetic wraps around
+        hashes = hashes * np.uint64(1000003) ^ column_hashes
+    return hashes
+
+def _spill_row_hashes(path, chunksize, directory, partitions):
+    """Pass over a file writing (row hash, row number) pairs to one file per hash partition.
+
+    Rows go to partition ``hash % partitions``, so identical rows always
+    land in the same file. Returns the columns of the first chunk, the row
+    count and the number of missing values per column.
+    """
+    files = [open(os.path.join(directory, f"{i}.bin"), 'wb') for i in range(partitions)]
+    columns = None
+    rows = 0
+    missing = None
+    try:
+        for chunk in iter_file_chunks(path, chunksize):
+            if columns is None:
+                columns = chunk.columns
+            counts = chunk.isnull().sum()
+            missing = counts if missing is None else missing.add(counts, fill_value=0)
+            hashes = _row_hashes(chunk)
+            partition = (hashes % np.uint64(partitions)).astype(np.intp)
+            order = np.argsort(partition, kind='stable')
+            pairs = np.column_stack([hashes[order], np.arange(rows, rows + len(chunk), dtype=np.uint64)[order]])
+            bounds = np.searchsorted(partition[order], np.arange(partitions + 1))
+            for i in np.flatnonzero(np.diff(bounds)):
+                pairs[bounds[i]:bounds[i + 1]].tofile(files[i])
+            rows += len(chunk)
+    finally:
+        for f in files:
+            f.close()
+    return columns, rows, missing
+
+def _keep_mask(directory, partitions, rows):
+    """Memory-mapped mask over all rows, False where a row repeats an earlier one.
+
+    Partitions are deduplicated one at a time, so memory holds one partition's
+    pairs rather than every distinct row hash.
+    """
+    if rows == 0:
+        return np.ones(0, dtype=bool)
+    keep = np.memmap(os.path.join(directory, 'keep.bin'), dtype=bool, mode='w+', shape=(rows,))
+    keep[:] = True
+    for i in range(partitions):
+        pairs = np.fromfile(os.path.join(directory, f"{i}.bin"), dtype=np.uint64).reshape(-1, 2)
+        # Sorted by hash, then row number, so the first of equal hashes is the earliest row
+        order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+        hashes, row_numbers = pairs[order, 0], pairs[order, 1]
+        keep[row_numbers[1:][hashes[1:] == hashes[:-1]]] = False
+    return keep
+
+def _mode(counts):
+    """Most frequent value, smallest first on ties like ``Series.mode``"""
+    ties = list(counts[counts == counts.max()].index)
+    try:
+        return sorted(ties)[0]
+    except TypeError:
+        return ties[0]
+
+def _bounded_counts(counts, max_categories):
+    """Trim value counts to at most ``max_categories`` entries (Misra-Gries).
+
+    Every count is lowered by the next largest one, so a value more frequent
+    than 1/(max_categories + 1) of the column always survives; below the cap
+    the counts are exact.
+    """
+    if len(counts) <= max_categories:
+        return counts
+    counts = counts.sort_values(ascending=False, kind='stable')
+    counts = counts.iloc[:max_categories] - counts.iloc[max_categories]
+    return counts[counts > 0]
+
+def _fill_values(path, chunksize, keep, columns, missing, sample_size, seed, max_categories):
+    """Pass 2: the fill value of every column that has missing values, over the kept rows"""
+    rng = np.random.default_rng(seed)
+    # Columns without gaps need no fill, however many distinct values they hold
+    gaps = [col for col in columns if missing.get(col, 0) > 0]
+    text_columns = set()
+    value_counts = {}
+    samples = {}
+    
+    start = 0
+    for chunk in iter_file_chunks(path, chunksize):
+        kept = chunk[np.asarray(keep[start:start + len(chunk)])]
+        start += len(chunk)
+        for col in gaps:
+            values = kept[col].dropna()
+            if kept[col].dtype.kind in 'iuf':
+                keys, sampled = samples.get(col, (np.empty(0), np.empty(0)))
+                keys = np.concatenate([keys, rng.random(len(values))])
+                sampled = np.concatenate([sampled, values.to_numpy(dtype='float64')])
+                if len(keys) > sample_size:
+                    smallest = np.argpartition(keys, sample_size)[:sample_size]
+                    keys, sampled = keys[smallest], sampled[smallest]
+                samples[col] = (keys, sampled)
+            elif kept[col].dtype == object:
+                text_columns.add(col)
+                counts = values.value_counts()
+                if col in value_counts:
+                    counts = value_counts[col].add(counts, fill_value=0)
+                value_counts[col] = _bounded_counts(counts, max_categories)
+    
+    # A column is text if any chunk parsed it as text; otherwise numeric
+    fill_values = {}
+    for col in gaps:
+        if col in text_columns:
+            counts = value_counts.get(col)
+            fill_values[col] = _mode(counts) if counts is not None and len(counts) > 0 else 'Unknown'
+        elif col in samples:
+            sampled = samples[col][1]
+            fill_values[col] = float(np.median(sampled)) if len(sampled) > 0 else np.nan
+    return fill_values
+
+def clean_file_streaming(path, chunksize=100_000, sample_size=100_000, sink=None, seed=42, partitions=64,
+                         max_categories=10_000):
+    """Clean a CSV/Excel file in fixed-size chunks with bounded memory.
+
+    Pass 1 spills 64-bit row hashes to ``partitions`` temporary files, which
+    are then deduplicated one at a time into an on-disk keep mask, so memory
+    does not grow with the number of distinct rows. Pass 2 gathers
+    imputation statistics over the kept rows of the columns that have gaps:
+    value counts for text columns, bounded to ``max_categories`` values and
+    exact below that, and a uniform bottom-k sample of ``sample_size``
+    values per numeric column, whose median is exact whenever the column has
+    no more values than that. Pass 3 applies the mask, fills missing
+    values, normalizes column names and hands each cleaned chunk to
+    ``sink``. Returns the same summary fields as the in-memory
+    ``/api/clean-data``.
+    """
+    with tempfile.TemporaryDirectory(prefix='retailiq-dedup-') as directory:
+        # Pass 1: row hashes to disk, then the dedup mask
+        columns, original_rows, missing = _spill_row_hashes(path, chunksize, directory, partitions)
+        if columns is None:
+            raise ValueError("Uploaded file contains no rows")
+        keep = _keep_mask(directory, partitions, original_rows)
+        fill_values = _fill_values(path, chunksize, keep, columns, missing, sample_size, seed, max_categories)
+        report = _clean_kept_rows(path, chunksize, keep, columns, original_rows, int(missing.sum()),
+                                  fill_values, sink)
+        # Unmap the mask before its directory is removed
+        del keep
+    return report
+
+def _clean_kept_rows(path, chunksize, keep, columns, original_rows, missing_before, fill_values, sink):
+    # Pass 3: apply dedup mask and fills
+    cleaned_rows = 0
+    missing_after = 0
+    sample = []
+    start = 0
+    for chunk in iter_file_chunks(path, chunksize):
+        end = start + len(chunk)
+        chunk = chunk[np.asarray(keep[start:end])].fillna(fill_values)
+        start = end
+        chunk.columns = normalize_column_names(chunk.columns)
+        
+        cleaned_rows += len(chunk)
+        missing_after += int(chunk.isnull().sum().sum())
+        if len(sample) < 5:
+            sample.extend(chunk.head(5 - len(sample)).to_dict('records'))
+        if sink is not None:
+            sink(chunk)
+    
+    return {
+        "success": True,
+        "original_rows": original_rows,
+        "cleaned_rows": cleaned_rows,
+        "columns": list(normalize_column_names(columns)),
+        "missing_before": missing_before,
+        "missing_after": missing_after,
+        "duplicates_removed": original_rows - cleaned_rows,
+        "sample": sample
+    }
@@ -0,0 +1,281 @@
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+from database.loader import SOURCE_COLUMNS
+from database.queries import group_baskets
+
+# Hive partition columns added to every dataset
+PARTITIONING = ds.partitioning(pa.schema([('sale_month', pa.string()), ('store_key', pa.string())]), flavor='hive')
+UNKNOWN_PARTITION = 'unknown'
+
+MANIFEST = '_dataset.json'
+SCHEMA_FILE = '_schema.arrow'
+
+def _first(columns, candidates):
+    return next((column for column in candidates if column in columns), None)
+
+class DatasetWriter:
+    """Append cleaned chunks to a Parquet dataset partitioned by month and store.
+
+    Every chunk becomes its own set of files, so the streaming cleaner can
+    write as it goes. Chunks may disagree on column types (an integer column
+    that had gaps in one chunk comes out as float there), so the writer keeps
+    a permissively unified schema that readers use to read all files alike.
+    Call ``close`` once to write the manifest. Usable directly as a cleaning
+    ``sink``.
+    """
+
+    def __init__(self, root, source=None):
+        self.root = root
+        self.source = source
+        self.schema = None
+        self.date_column = None
+        self.store_column = None
+        self.rows = 0
+        self.chunks = 0
+
+    def write(self, df):
+        if self.chunks == 0:
+            self.date_column = _first(df.columns, SOURCE_COLUMNS['date'])
+            self.store_column = _first(df.columns, SOURCE_COLUMNS['store_key'])
+
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        if self.date_column is not None:
+            df[self.date_column] = pd.to_datetime(df[self.date_column], errors='coerce', format='mixed')
+            df['sale_month'] = df[self.date_column].dt.strftime('%Y-%m').fillna(UNKNOWN_PARTITION)
+        else:
+            df['sale_month'] = UNKNOWN_PARTITION
+        if self.store_column is not None:
+            df['store_key'] = df[self.store_column].astype(str).where(df[self.store_column].notna(), UNKNOWN_PARTITION)
+        else:
+            df['store_key'] = UNKNOWN_PARTITION
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        ds.write_dataset(
+            table, self.root, format='parquet', partitioning=PARTITIONING,
+            basename_template=f'part-{self.chunks}-{{i}}.parquet', existing_data_behavior='overwrite_or_ignore'
+        )
+        data_schema = pa.schema([field for field in table.schema if field.name not in PARTITIONING.schema.names])
+        self.schema = data_schema if self.schema is None else pa.unify_schemas(
+            [self.schema, data_schema], promote_options='permissive'
+        )
+        self.rows += len(df)
+        self.chunks += 1
+
+    __call__ = write
+
+    def close(self):
+        """Write the schema and manifest; returns the manifest"""
+        os.makedirs(self.root, exist_ok=True)
+        schema = pa.unify_schemas([self.schema or pa.schema([]), PARTITIONING.schema])
+        with open(os.path.join(self.root, SCHEMA_FILE), 'wb') as f:
+            f.write(schema.serialize().to_pybytes())
+        manifest = {
+            "dataset_id": os.path.basename(self.root),
+            "source": self.source,
+            "rows": self.rows,
+            "columns": [name for name in schema.names if name not in PARTITIONING.schema.names],
+            "date_column": self.date_column,
+            "store_column": self.store_column,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(self.root, MANIFEST), 'w') as f:
+            json.dump(manifest, f)
+        return manifest
+
+def create_dataset_writer(datasets_dir, source=None):
+    """Writer for a new dataset with a fresh ID under ``datasets_dir``"""
+    return DatasetWriter(os.path.join(datasets_dir, uuid.uuid4().hex[:16]), source)
+
+def dataset_path(datasets_dir, dataset_id):
+    """Directory of a dataset; raises KeyError for unknown or malformed IDs"""
+    if not dataset_id or not dataset_id.isalnum():
+        raise KeyError(dataset_id)
+    root = os.path.join(datasets_dir, dataset_id)
+    if not os.path.exists(os.path.join(root, MANIFEST)):
+        raise KeyError(dataset_id)
+    return root
+
+def read_manifest(root):
+    with open(os.path.join(root, MANIFEST)) as f:
+        return json.load(f)
+
+def list_datasets(datasets_dir):
+    if not os.path.isdir(datasets_dir):
+        return []
+    manifests = []
+    for name in os.listdir(datasets_dir):
+        if os.path.exists(os.path.join(datasets_dir, name, MANIFEST)):
+            manifests.append(read_manifest(os.path.join(datasets_dir, name)))
+    return sorted(manifests, key=lambda manifest: manifest['created_at'], reverse=True)
+
+def delete_dataset(root):
+    shutil.rmtree(root)
+
+def open_dataset(root):
+    """Arrow dataset over the Parquet files, read through memory maps"""
+    with open(os.path.join(root, SCHEMA_FILE), 'rb') as f:
+        schema = pa.ipc.read_schema(pa.py_buffer(f.read()))
+    return ds.dataset(
+        root, schema=schema, format='parquet', partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+
+def scope_filter(manifest, scope=None):
+    """Arrow filter for a date range, store and/or category.
+
+    Month and store conditions hit the partition columns, so whole
+    directories are skipped; the exact date and category conditions are
+    pushed down to Parquet row-group statistics.
+    """
+    scope = scope or {}
+    conditions = []
+    date_column = manifest.get('date_column')
+    if date_column is not None:
+        if scope.get('start_date'):
+            start = pd.Timestamp(scope['start_date'])
+            conditions.append(ds.field('sale_month') >= start.strftime('%Y-%m'))
+            conditions.append(ds.field(date_column) >= start.to_datetime64())
+        if scope.get('end_date'):
+            end = pd.Timestamp(scope['end_date'])
+            conditions.append(ds.field('sale_month') <= end.strftime('%Y-%m'))
+            conditions.append(ds.field(date_column) < (end + pd.Timedelta(days=1)).to_datetime64())
+    if scope.get('store'):
+        conditions.append(ds.field('store_key') == str(scope['store']))
+    if scope.get('stores') is not None:
+        conditions.append(ds.field('store_key').isin([str(key) for key in scope['stores']]))
+    category_column = _first(manifest['columns'], SOURCE_COLUMNS['category'])
+    if scope.get('category') and category_column is not None:
+        conditions.append(ds.field(category_column) == scope['category'])
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def dataset_shards(root, shard_by='store', scope=None):
+    """Store partitions per shard, one shard per store or per region, for scopes with ``stores``.
+
+    Store shards come from the partition directories alone; region shards
+    read just the store and region columns. Stores without a region, and
+    rows without a store, fall in the 'unknown' shard.
+    """
+    manifest = read_manifest(root)
+    dataset = open_dataset(root)
+    expression = scope_filter(manifest, scope)
+    region = _first(manifest['columns'], SOURCE_COLUMNS['region'])
+    if shard_by == 'store' or region is None:
+        stores = sorted({
+            ds.get_partition_keys(fragment.partition_expression).get('store_key', UNKNOWN_PARTITION)
+            for fragment in dataset.get_fragments(filter=expression)
+        })
+        if shard_by == 'store':
+            return {store: [store] for store in stores}
+        return {UNKNOWN_PARTITION: stores} if stores else {}
+    
+    pairs = dataset.to_table(columns=['store_key', region], filter=expression) \
+        .group_by(['store_key', region]).aggregate([]).to_pandas()
+    # A store whose rows disagree on the region goes with the first one, so no rows are counted twice
+    pairs = pairs.sort_values(['store_key', region], na_position='last').drop_duplicates('store_key')
+    shards = {}
+    for store, store_region in zip(pairs['store_key'], pairs[region]):
+        shards.setdefault(UNKNOWN_PARTITION if pd.isna(store_region) else str(store_region), []).append(store)
+    return dict(sorted(shards.items()))
+
+def read_dataset(root, columns=None, scope=None, filters=None):
+    """Read a dataset into pandas, loading only ``columns`` and matching rows.
+
+    ``scope`` takes the warehouse scope fields; ``filters`` takes extra
+    conditions in ``pyarrow.parquet`` DNF form, e.g. [('quantity', '>', 0)].
+    Columns the dataset does not have are skipped, so callers can ask for
+    every name a field might go by.
+    """
+    manifest = read_manifest(root)
+    dataset = open_dataset(root)
+    if columns is not None:
+        columns = [column for column in dict.fromkeys(columns) if column in dataset.schema.names]
+    expression = scope_filter(manifest, scope)
+    if filters:
+        extra = pq.filters_to_expression(filters)
+        expression = extra if expression is None else expression & extra
+    table = dataset.to_table(columns=columns, filter=expression)
+    # split_blocks avoids consolidating columns, so numeric data is not copied again
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def dataset_stats(root):
+    """Row count, file count and partitions of a dataset, from Parquet footers only"""
+    dataset = open_dataset(root)
+    fragments = list(dataset.get_fragments())
+    partitions = sorted({
+        os.path.relpath(os.path.dirname(fragment.path), root) for fragment in fragments
+    })
+    return {
+        "rows": int(sum(fragment.metadata.num_rows for fragment in fragments)),
+        "files": len(fragments),
+        "bytes": int(np.sum([os.path.getsize(fragment.path) for fragment in fragments])),
+        "partitions": partitions,
+    }
+
+def load_dataset_baskets(root, scope=None):
+    """Product-name baskets and their transaction IDs, like ``load_baskets``"""
+    df = read_dataset(root, SOURCE_COLUMNS['transaction_id'] + ['product_name'], scope)
+    transaction_id = _first(df.columns, SOURCE_COLUMNS['transaction_id'])
+    if transaction_id is None or 'product_name' not in df:
+        return [], []
+    df = df.dropna(subset=[transaction_id, 'product_name'])
+    return group_baskets(df[transaction_id], df['product_name'])
+
+def load_dataset_transactions(root, scope=None):
+    """One row per transaction with total amount, line count, customer, date and payment method"""
+    fields = ['transaction_id', 'customer_key', 'date', 'revenue', 'quantity', 'price']
+    df = read_dataset(root, [c for field in fields for c in SOURCE_COLUMNS[field]] + ['payment_method'], scope)
+    source = {field: _first(df.columns, SOURCE_COLUMNS[field]) for field in fields}
+    if source['transaction_id'] is None:
+        return pd.DataFrame(columns=['transaction_id', 'total_amount', 'item_count'])
+
+    if source['revenue'] is not None:
+        amount = pd.to_numeric(df[source['revenue']], errors='coerce')
+    elif source['quantity'] is not None and source['price'] is not None:
+        amount = pd.to_numeric(df[source['quantity']], errors='coerce') * pd.to_numeric(df[source['price']], errors='coerce')
+    else:
+        amount = pd.Series(np.nan, index=df.index)
+    lines = pd.DataFrame({'transaction_id': df[source['transaction_id']], 'total_amount': amount})
+    aggregations = {'total_amount': ('total_amount', 'sum'), 'item_count': ('total_amount', 'size')}
+    for name, column in (('customer_id', source['customer_key']), ('transaction_date', source['date']),
+                         ('payment_method', 'payment_method' if 'payment_method' in df else None)):
+        if column is not None:
+            lines[name] = df[column]
+            aggregations[name] = (name, 'first')
+    return lines.groupby('transaction_id', sort=False).agg(**aggregations).reset_index()
+
+def load_dataset_daily_sales(root, products=None, scope=None):
+    """Units sold per product per day, in the long format of ``load_product_daily_sales``"""
+    manifest = read_manifest(root)
+    product = _first(manifest['columns'], SOURCE_COLUMNS['product_key'])
+    quantity = _first(manifest['columns'], SOURCE_COLUMNS['quantity'])
+    date = manifest.get('date_column')
+    if product is None or quantity is None or date is None:
+        return pd.DataFrame({'product_id': [], 'date': pd.to_datetime([]), 'sales': []})
+
+    # Product IDs arrive as strings; push the filter down only when the column is text too
+    text_keys = pa.types.is_string(open_dataset(root).schema.field(product).type)
+    filters = [(product, 'in', list(products))] if products and text_keys else None
+    df = read_dataset(root, [product, date, quantity], scope, filters)
+    if products and not text_keys:
+        df = df[df[product].astype(str).isin(products)]
+    daily = pd.DataFrame({
+        'product_id': df[product].astype(str),
+        'date': df[date].dt.normalize(),
+        'sales': pd.to_numeric(df[quantity], errors='coerce'),
+    }).dropna(subset=['date'])
+    return daily.groupby(['product_id', 'date'], sort=False, as_index=False)['sales'].sum()
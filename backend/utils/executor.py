@@ -0,0 +1,104 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import time
+from functools import partial
+from utils.metrics import JOBS, current_trace, profile_request, record_job, run_traced
+
+DEFAULT_CONCURRENCY = 2
+DEFAULT_TIMEOUT = 300
+
+class JobExecutor:
+    """Runs CPU-bound analysis functions in a process pool off the event loop.
+
+    Each job name gets its own concurrency limit (an asyncio semaphore, so
+    waiting requests queue without holding a worker) and timeout. Functions
+    and arguments must be picklable. A timed-out job is abandoned by the
+    caller but keeps its pool process busy until it finishes, since pool
+    workers cannot be interrupted; set timeouts with that capacity in mind.
+
+    Jobs run through ``run_traced``, so their stage timings, rows and peak
+    memory are recorded as metrics and added to the calling request; with
+    ``profile_dir`` set, requests asking for a profile get one per job.
+    """
+
+    def __init__(self, max_workers=None, concurrency=None, timeouts=None, profile_dir=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.concurrency = dict(concurrency or {})
+        self.timeouts = dict(timeouts or {})
+        self.profile_dir = profile_dir
+        self._pool = None
+        self._semaphores = {}
+
+    @classmethod
+    def from_env(cls, names, default_concurrency=None, default_timeouts=None, profile_dir=None):
+        """Build from RETAILIQ_WORKERS and RETAILIQ_<NAME>_CONCURRENCY / _TIMEOUT.
+
+        Every server process gets its own pool, so without RETAILIQ_WORKERS
+        the CPUs are split between the RETAILIQ_SERVER_WORKERS processes
+        that serve.py forks.
+        """
+        default_concurrency = default_concurrency or {}
+        default_timeouts = default_timeouts or {}
+        concurrency = {}
+        timeouts = {}
+        for name in names:
+            prefix = 'RETAILIQ_' + name.upper().replace('-', '_')
+            concurrency[name] = int(os.environ.get(
+                prefix + '_CONCURRENCY', default_concurrency.get(name, DEFAULT_CONCURRENCY)
+            ))
+            timeouts[name] = float(os.environ.get(prefix + '_TIMEOUT', default_timeouts.get(name, DEFAULT_TIMEOUT)))
+        workers = os.environ.get('RETAILIQ_WORKERS')
+        if workers:
+            workers = int(workers)
+        else:
+            servers = int(os.environ.get('RETAILIQ_SERVER_WORKERS', 1))
+            workers = max(1, (os.cpu_count() or 1) // max(servers, 1))
+        return cls(workers, concurrency, timeouts, profile_dir)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def timeout(self, name):
+        return self.timeouts.get(name, DEFAULT_TIMEOUT)
+
+    def _semaphore(self, name):
+        if name not in self._semaphores:
+            self._semaphores[name] = asyncio.Semaphore(self.concurrency.get(name, DEFAULT_CONCURRENCY))
+        return self._semaphores[name]
+
+    async def run(self, name, fn, *args, **kwargs):
+        """Run ``fn`` in the pool; raises asyncio.TimeoutError past the job timeout"""
+        trace = current_trace()
+        queued = time.perf_counter()
+        async with self._semaphore(name):
+            start = time.perf_counter()
+            if trace is not None:
+                trace.add_stage('queue', start - queued)
+            profile = profile_request(trace, self.profile_dir) if self.profile_dir else None
+            loop = asyncio.get_running_loop()
+            try:
+                future = loop.run_in_executor(self.pool, partial(run_traced, fn, trace.request_id if trace is not None else None, profile, *args, **kwargs))
+                result, report = await asyncio.wait_for(future, self.timeout(name))
+            except asyncio.TimeoutError:
+                JOBS.inc(name, 'timeout')
+                raise
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed); start a fresh pool for later jobs
+                JOBS.inc(name, 'error')
+                self.shutdown()
+                raise
+            except Exception:
+                JOBS.inc(name, 'error')
+                raise
+            record_job(name, report, time.perf_counter() - start)
+            return result
+
+    def shutdown(self, wait=False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import time
+import uuid
+
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+class JobCancelled(BaseException):
+    """Raised inside a worker when its job was cancelled.
+
+    Derives from BaseException, like asyncio.CancelledError, so the
+    ``except Exception`` fallbacks in the analysis functions do not swallow it.
+    """
+
+class JobStore:
+    """SQLite-backed queue and result store for analysis jobs.
+
+    Every call opens its own short-lived connection, so the store can be
+    used from the server process and from pool workers at the same time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    payload TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (job_id, kind, status, message, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, 'queued', 'Waiting for a worker', json.dumps(payload), time.time())
+            )
+        return job_id
+
+    def get(self, job_id):
+        """Job status without payload or result, or None if unknown"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(
+                'SELECT job_id, kind, status, progress, message, error, created_at, started_at, finished_at '
+                'FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status=None, limit=50):
+        query = 'SELECT job_id, kind, status, progress, message, created_at, finished_at FROM jobs'
+        params = ()
+        if status:
+            query += ' WHERE status = ?'
+            params = (status,)
+        query += ' ORDER BY created_at DESC LIMIT ?'
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(query, params + (limit,))]
+
+    def payload(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT payload FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def result(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT result FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def start(self, job_id):
+        """Mark a queued job running; False if it was cancelled meanwhile"""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, message = 'Started' "
+                "WHERE job_id = ? AND status = 'queued'", (time.time(), job_id)
+            ).rowcount
+        return updated == 1
+
+    def update_progress(self, job_id, progress, message):
+        """Record progress; returns the current status so workers can notice cancellation"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, message = ? WHERE job_id = ? AND status = 'running'",
+                (progress, message, job_id)
+            )
+            row = conn.execute('SELECT status FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def finish(self, job_id, status, result=None, error=None):
+        """Move a queued/running job to a terminal status; the payload is dropped"""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ?, "
+                "progress = CASE WHEN ? = 'completed' THEN 1 ELSE progress END, message = ? "
+                "WHERE job_id = ? AND status IN ('queued', 'running')",
+                (status, json.dumps(result) if result is not None else None, error, time.time(),
+                 status, status.capitalize(), job_id)
+            ).rowcount
+        return updated == 1
+
+    def cancel(self, job_id):
+        return self.finish(job_id, 'cancelled')
+
+    def requeue_unfinished(self):
+        """Put jobs interrupted by a server restart back in the queue"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', progress = 0, message = 'Requeued after restart' "
+                "WHERE status = 'running'"
+            )
+            rows = conn.execute(
+                "SELECT job_id, kind FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        return rows
+
+def execute_job(db_path, job_id, fn):
+    """Pool-side entry point: load the payload, run ``fn`` and store its result"""
+    store = JobStore(db_path)
+    if not store.start(job_id):
+        return
+    
+    def progress(fraction, message):
+        if store.update_progress(job_id, fraction, message) == 'cancelled':
+            raise JobCancelled(job_id)
+    
+    try:
+        result = fn(**store.payload(job_id), progress=progress)
+    except JobCancelled:
+        return
+    store.finish(job_id, 'completed', result=result)
@@ -0,0 +1,53 @@
+import fcntl
+import os
+import threading
+
+class FileLock:
+    """Exclusive lock on a file, held across processes (``flock``) and threads.
+
+    Reentrant within a thread, so code holding the lock can call methods
+    that take it again. Worker processes forked from the same app each open
+    the file themselves, so they exclude one another; the lock is released
+    when the holder exits or dies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+def file_lock(path):
+    """The process-wide ``FileLock`` for ``path``, so every caller shares its reentrancy"""
+    path = os.path.abspath(path)
+    with _locks_guard:
+        if path not in _locks:
+            _locks[path] = FileLock(path)
+        return _locks[path]
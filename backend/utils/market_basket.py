@@ -1,9 +1,13 @@
-from mlxtend.frequent_patterns import apriori, association_rules, fpgrowth
-from mlxtend.preprocessing import TransactionEncoder
+from scipy import sparse
+import numpy as np
 import pandas as pd
 
 def run_apriori(transactions, min_support=0.03):
     """Run Apriori algorithm"""
+    # mlxtend pulls in scikit-learn, so it is only imported when used
+    from mlxtend.frequent_patterns import apriori
+    from mlxtend.preprocessing import TransactionEncoder
+    
     te = TransactionEncoder()
     te_ary = te.fit(transactions).transform(transactions)
     df = pd.DataFrame(te_ary, columns=te.columns_)
@@ -11,23 +15,159 @@ def run_apriori(transactions, min_support=0.03):
     frequent_itemsets = apriori(df, min_support=min_support, use_colnames=True)
     return frequent_itemsets
 
+def encode_transactions(transactions):
+    """Encode baskets as a sparse basket x item CSR matrix of integer item IDs.
+
+    Returns the matrix and the array of item names indexed by item ID. Items
+    repeated within a basket are counted once.
+    """
+    lengths = np.fromiter((len(t) for t in transactions), dtype=np.int64, count=len(transactions))
+    flat = pd.Series([item for t in transactions for item in t], dtype=object)
+    codes, items = pd.factorize(flat)
+    
+    indptr = np.zeros(len(transactions) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    matrix = sparse.csr_matrix(
+        (np.ones(len(codes), dtype=np.int32), codes, indptr),
+        shape=(len(transactions), len(items))
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, np.asarray(items, dtype=object)
+
+def _item_bitsets(matrix):
+    """Vertical layout: one Python int bitset of basket IDs per item column"""
+    csc = matrix.tocsc()
+    n_baskets = matrix.shape[0]
+    bitsets = []
+    for col in range(matrix.shape[1]):
+        rows = csc.indices[csc.indptr[col]:csc.indptr[col + 1]]
+        bits = np.zeros(n_baskets, dtype=bool)
+        bits[rows] = True
+        bitsets.append(int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little'))
+    return bitsets
+
+def _eclat(prefix, candidates, min_count, max_len, out):
+    """Depth-first Eclat over (item, bitset, count) candidates"""
+    for i, (item, bits, count) in enumerate(candidates):
+        itemset = prefix + (item,)
+        out.append((itemset, count))
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+        
+        extensions = []
+        for other, other_bits, _ in candidates[i + 1:]:
+            joined = bits & other_bits
+            joined_count = joined.bit_count()
+            if joined_count >= min_count:
+                extensions.append((other, joined, joined_count))
+        if extensions:
+            _eclat(itemset, extensions, min_count, max_len, out)
+
+def support_count(min_support, n_baskets):
+    """Smallest basket count that reaches ``min_support`` (rounded so 0.3 * 10 is 3, not 4)"""
+    return int(np.ceil(round(min_support * n_baskets, 9)))
+
+def mine_frequent_itemsets(transactions, min_support=0.03, max_len=None):
+    """Mine frequent itemsets with Eclat over a sparse, vertical-bitset encoding.
+
+    Drop-in replacement for ``run_apriori`` that never materializes the dense
+    basket x item matrix: baskets are encoded as a CSR matrix of item IDs,
+    infrequent items are pruned by column counts, and only the surviving items
+    are turned into basket bitsets for support counting. Returns the same
+    ``support``/``itemsets`` DataFrame that mlxtend produces.
+    """
+    n_baskets = len(transactions)
+    if n_baskets == 0:
+        return pd.DataFrame(columns=['support', 'itemsets'])
+    
+    matrix, items = encode_transactions(transactions)
+    min_count = support_count(min_support, n_baskets)
+    
+    item_counts = np.asarray(matrix.sum(axis=0)).ravel()
+    frequent = np.flatnonzero(item_counts >= max(min_count, 1))
+    # Ascending support keeps the intersected bitsets small early in the search
+    frequent = frequent[np.argsort(item_counts[frequent], kind='stable')]
+    
+    bitsets = _item_bitsets(matrix[:, frequent])
+    del matrix
+    candidates = [(item, bits, int(item_counts[item])) for item, bits in zip(frequent, bitsets)]
+    
+    found = []
+    _eclat((), candidates, max(min_count, 1), max_len, found)
+    
+    return pd.DataFrame({
+        'support': np.array([count for _, count in found], dtype=float) / n_baskets,
+        'itemsets': [frozenset(items[list(itemset)]) for itemset, _ in found]
+    })
+
+def count_itemsets(transactions, itemsets):
+    """Exact basket counts of the given itemsets, by intersecting item bitsets"""
+    if not itemsets or not transactions:
+        return dict.fromkeys(itemsets, 0)
+    matrix, items = encode_transactions(transactions)
+    # Bitsets only for items that appear in some candidate
+    columns = np.flatnonzero(pd.Index(items).isin(set().union(*itemsets)))
+    bitsets = dict(zip(items[columns], _item_bitsets(matrix[:, columns])))
+    counts = {}
+    for itemset in itemsets:
+        bits = None
+        for item in itemset:
+            item_bits = bitsets.get(item, 0)
+            bits = item_bits if bits is None else bits & item_bits
+            if not bits:
+                break
+        counts[itemset] = bits.bit_count() if bits else 0
+    return counts
+
 def generate_association_rules(frequent_itemsets, min_confidence=0.2):
     """Generate association rules from frequent itemsets"""
     if len(frequent_itemsets) == 0:
         return pd.DataFrame()
     
+    from mlxtend.frequent_patterns import association_rules
     rules = association_rules(frequent_itemsets, metric="confidence", min_threshold=min_confidence)
     return rules
 
+RULE_COLUMNS = ['antecedent', 'consequent', 'support', 'confidence', 'lift']
+RULE_SORT_COLUMNS = ('lift', 'confidence', 'support')
+
+def rules_frame(rules):
+    """Association rules as plain columns: sorted antecedent/consequent lists plus metrics.
+
+    Item lists are sorted so a rule reads the same in every process
+    (frozenset order depends on string hashing).
+    """
+    if len(rules) == 0:
+        return pd.DataFrame(columns=RULE_COLUMNS)
+    return pd.DataFrame({
+        'antecedent': [sorted(items) for items in rules['antecedents']],
+        'consequent': [sorted(items) for items in rules['consequents']],
+        'support': rules['support'].to_numpy(dtype=float),
+        'confidence': rules['confidence'].to_numpy(dtype=float),
+        'lift': rules['lift'].to_numpy(dtype=float),
+    })
+
+def query_rules(rules, sort_by='lift', ascending=False, min_lift=None, min_confidence=None, min_support=None,
+                offset=0, limit=100):
+    """Filter, sort and page a ``rules_frame`` with column operations.
+
+    Returns the page and the number of rules matching the filters; a
+    ``limit`` of None returns every match from ``offset`` on.
+    """
+    if sort_by not in RULE_SORT_COLUMNS:
+        raise ValueError(f"Unknown sort column '{sort_by}'. Use one of: {', '.join(RULE_SORT_COLUMNS)}")
+    mask = np.ones(len(rules), dtype=bool)
+    for column, minimum in (('lift', min_lift), ('confidence', min_confidence), ('support', min_support)):
+        if minimum is not None:
+            mask &= rules[column].to_numpy(dtype=float) >= minimum
+    matching = np.flatnonzero(mask)
+    values = rules[sort_by].to_numpy(dtype=float)[matching]
+    # Stable, so rules with equal values keep their mining order
+    order = matching[np.argsort(values if ascending else -values, kind='stable')]
+    end = None if limit is None else offset + limit
+    return rules.iloc[order[offset:end]].reset_index(drop=True), len(matching)
+
 def format_rules_for_frontend(rules):
     """Format rules for frontend consumption"""
-    formatted = []
-    for _, row in rules.iterrows():
-        formatted.append({
-            "antecedent": list(row['antecedents']),
-            "consequent": list(row['consequents']),
-            "support": float(row['support']),
-            "confidence": float(row['confidence']),
-            "lift": float(row['lift'])
-        })
-    return formatted
\ No newline at end of file
+    return rules_frame(rules).to_dict('records')
@@ -0,0 +1,447 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+MEMORY_BUCKETS = tuple(2 ** i * 1024 * 1024 for i in range(4, 16))
+PROFILE_MODES = ('cprofile', 'sample')
+PROFILE_EXTENSIONS = {'cprofile': '.prof', 'sample': '.folded'}
+
+logger = logging.getLogger('retailiq.requests')
+
+# ================ Registry ================
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+def _value_text(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class _Metric:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+class CounterMetric(_Metric):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = defaultdict(float)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] += amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labels, labels, value) for labels, value in self.values.items()]
+
+class HistogramMetric(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.counts = {}
+        self.sums = defaultdict(float)
+
+    def observe(self, *labels, value):
+        with self._lock:
+            counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self.sums[labels] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, counts in self.counts.items():
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + '_bucket', self.labels + ('le',), labels + (repr(float(bound)),), count))
+                samples.append((self.name + '_bucket', self.labels + ('le',), labels + ('+Inf',), counts[-1]))
+                samples.append((self.name + '_sum', self.labels, labels, self.sums[labels]))
+                samples.append((self.name + '_count', self.labels, labels, counts[-1]))
+        return samples
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format.
+
+    ``collect`` callbacks add point-in-time values (memory, cache sizes) at
+    scrape time; each returns (name, type, help, [(labels dict, value)]).
+    Metrics live in the server process; pool workers report theirs back
+    with each job, see ``run_traced``.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self.metrics.setdefault(name, CounterMetric(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        return self.metrics.setdefault(name, HistogramMetric(name, help, labels, buckets))
+
+    def collect(self, callback):
+        self.collectors.append(callback)
+        return callback
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, label_names, label_values, value in metric.samples():
+                lines.append(f"{name}{_label_text(label_names, label_values)} {_value_text(value)}")
+        for callback in self.collectors:
+            for name, type, help, values in callback():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type}")
+                for labels, value in values:
+                    lines.append(f"{name}{_label_text(tuple(labels), tuple(labels.values()))} {_value_text(value)}")
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+REQUESTS = registry.counter('retailiq_http_requests_total', "HTTP requests by route and status",
+                            ('method', 'path', 'status'))
+REQUEST_SECONDS = registry.histogram('retailiq_http_request_duration_seconds', "HTTP request latency",
+                                     ('method', 'path'))
+STAGE_SECONDS = registry.histogram('retailiq_stage_duration_seconds', "Time per processing stage of a request",
+                                   ('path', 'stage'))
+ROWS = registry.counter('retailiq_rows_processed_total', "Input rows processed", ('path',))
+JOBS = registry.counter('retailiq_pool_jobs_total', "Process pool jobs by outcome", ('job', 'outcome'))
+JOB_SECONDS = registry.histogram('retailiq_pool_job_duration_seconds', "Run time of pool jobs inside the worker",
+                                 ('job',))
+JOB_MEMORY = registry.histogram('retailiq_pool_job_peak_memory_bytes', "Peak resident memory of the worker per job",
+                                ('job',), MEMORY_BUCKETS)
+
+# ================ Memory ================
+def resident_memory():
+    """Current resident bytes of this process, or None where /proc is unavailable"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def reset_peak_memory():
+    """Restart the kernel's peak RSS tracking for this process (Linux only)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_memory():
+    """Peak resident bytes since the last reset, or over the process lifetime without /proc"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+@registry.collect
+def _process_metrics():
+    rss = resident_memory()
+    return [
+        ('retailiq_process_resident_memory_bytes', 'gauge', "Resident memory of the server process",
+         [({}, rss)] if rss is not None else []),
+        ('retailiq_process_peak_resident_memory_bytes', 'gauge', "Peak resident memory of the server process",
+         [({}, peak_memory())]),
+    ]
+
+# ================ Traces ================
+class Trace:
+    """Stage timings, rows processed and pool jobs of one request (or one pool job)"""
+
+    def __init__(self, request_id=None, profile=None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.profile = profile
+        self.stages = defaultdict(float)
+        self.rows = 0
+        self.jobs = []
+        self.profiles = []
+        self.closed = False
+
+    def add_stage(self, name, seconds):
+        if not self.closed:
+            self.stages[name] += seconds
+
+    def add_rows(self, rows):
+        if not self.closed:
+            self.rows += int(rows)
+
+    def add_job(self, name, report, wall_seconds):
+        """Merge a pool job's report; time outside the worker counts as the 'pool' stage"""
+        if self.closed:
+            return
+        for stage_name, seconds in report['stages'].items():
+            self.stages[stage_name] += seconds
+        self.stages['pool'] += max(wall_seconds - report['seconds'], 0.0)
+        self.rows += report['rows']
+        self.jobs.append({'job': name, 'seconds': round(report['seconds'], 4), 'peak_rss_mb': _mb(report['peak_rss'])})
+        if report['profile']:
+            self.profiles.append(report['profile'])
+
+_current_trace = contextvars.ContextVar('retailiq_trace', default=None)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def stage(name):
+    """Time a block as a named stage of the current request; a no-op outside requests"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, time.perf_counter() - start)
+
+def add_rows(rows):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_rows(rows)
+
+def _mb(value):
+    return None if value is None else round(value / (1024 * 1024), 1)
+
+# ================ Profiling ================
+class StackSampler:
+    """Sampling profiler: records the stack of one thread every ``interval`` seconds.
+
+    Writes collapsed stacks ("outer;inner count" lines), which flamegraph.pl
+    and speedscope read. Overhead is a thread waking up per sample, so it
+    can stay on for long analyses where cProfile would distort timings.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+def profile_request(trace, profile_dir):
+    """Profile target for the next pool job of a request: (mode, path), or None when not profiling"""
+    if trace is None or trace.profile is None or trace.closed:
+        return None
+    os.makedirs(profile_dir, exist_ok=True)
+    name = f"{trace.request_id}-{len(trace.profiles) + 1}{PROFILE_EXTENSIONS[trace.profile]}"
+    return trace.profile, os.path.join(profile_dir, name)
+
+def run_traced(fn, request_id, profile, *args, **kwargs):
+    """Run ``fn`` in a pool worker and return it with a report of the run.
+
+    Events ``fn`` logs carry ``request_id``, the ID of the calling request.
+
+    The report holds the stages and rows ``fn`` recorded, its run time, the
+    worker's peak resident memory during the call, and the file name of the
+    profile when ``profile`` is a (mode, path) pair.
+    """
+    trace = Trace(request_id)
+    token = _current_trace.set(trace)
+    profiler = None
+    if profile is not None:
+        profiler = cProfile.Profile() if profile[0] == 'cprofile' else StackSampler()
+    reset = reset_peak_memory()
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile[1])
+    finally:
+        _current_trace.reset(token)
+    return result, {
+        'stages': dict(trace.stages),
+        'rows': trace.rows,
+        'seconds': time.perf_counter() - start,
+        # Without a reset the peak covers the worker's whole life, so it is only an upper bound
+        'peak_rss': peak_memory(),
+        'peak_reset': reset,
+        'profile': os.path.basename(profile[1]) if profile is not None else None,
+    }
+
+def record_job(name, report, wall_seconds):
+    """Count a finished pool job and fold its report into the current request"""
+    JOBS.inc(name, 'ok')
+    JOB_SECONDS.observe(name, value=report['seconds'])
+    if report['peak_rss'] is not None and report['peak_reset']:
+        JOB_MEMORY.observe(name, value=report['peak_rss'])
+    trace = _current_trace.get()
+    if trace is not None and not trace.closed:
+        trace.add_job(name, report, wall_seconds)
+    else:
+        # Background jobs outlive the request that queued them; log them on their own
+        log_event('job', job=name, seconds=round(report['seconds'], 4), stages_ms=_milliseconds(report['stages']),
+                  rows=report['rows'], peak_rss_mb=_mb(report['peak_rss']), profile=report['profile'])
+
+def _milliseconds(stages):
+    return {name: round(seconds * 1000, 2) for name, seconds in stages.items()}
+
+# ================ Logging ================
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname.lower(), 'event': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, default=str)
+
+def configure_logging(level='INFO'):
+    """One JSON object per line on stderr for request and job events"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level.upper())
+
+def log_event(event, level=logging.INFO, **fields):
+    """Log one JSON line; inside a request (or its pool jobs) it carries the request ID"""
+    if logger.isEnabledFor(level):
+        trace = _current_trace.get()
+        if trace is not None:
+            fields = {'request_id': trace.request_id, **fields}
+        logger.log(level, event, extra={'fields': fields})
+
+# ================ Middleware ================
+_route_paths = {}
+
+def _route_path(scope):
+    """Route template of a handled request, so metrics do not get one series per ID"""
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return '<unmatched>'
+    if endpoint not in _route_paths:
+        app = scope.get('app')
+        _route_paths[endpoint] = next(
+            (route.path for route in getattr(app, 'routes', []) if getattr(route, 'endpoint', None) is endpoint),
+            getattr(endpoint, '__name__', '<unknown>')
+        )
+    return _route_paths[endpoint]
+
+class MetricsMiddleware:
+    """Time every request, record its metrics and log it as one JSON line.
+
+    Handlers and analyses add stages with ``stage`` (pool jobs report theirs
+    back through the executor). Responses carry ``X-Request-ID`` and a
+    ``Server-Timing`` header with the stages. When ``profiling`` is on, an
+    ``X-Profile: cprofile`` or ``X-Profile: sample`` request header profiles
+    the request's pool jobs; the profile IDs come back in ``X-Profile-ID``.
+    """
+
+    def __init__(self, app, profiling=False):
+        self.app = app
+        self.profiling = profiling
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        profile = headers.get('x-profile', '').strip().lower() if self.profiling else ''
+        request_id = ''.join(c for c in headers.get('x-request-id', '') if c.isalnum() or c == '-')[:64]
+        trace = Trace(request_id or None, profile if profile in PROFILE_MODES else None)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                response_headers = MutableHeaders(scope=message)
+                response_headers['X-Request-ID'] = trace.request_id
+                if trace.stages:
+                    response_headers['Server-Timing'] = ', '.join(
+                        f"{name};dur={seconds * 1000:.1f}" for name, seconds in trace.stages.items()
+                    )
+                if trace.profiles:
+                    response_headers['X-Profile-ID'] = ','.join(trace.profiles)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - start
+            trace.closed = True
+            path = _route_path(scope)
+            method = scope['method']
+            REQUESTS.inc(method, path, status)
+            REQUEST_SECONDS.observe(method, path, value=duration)
+            for name, seconds in trace.stages.items():
+                STAGE_SECONDS.observe(path, name, value=seconds)
+            if trace.rows:
+                ROWS.inc(path, amount=trace.rows)
+            if path != '/metrics':
+                log_event(
+                    'request', logging.WARNING if status >= 500 else logging.INFO,
+                    request_id=trace.request_id, method=method, path=path, status=status,
+                    duration_ms=round(duration * 1000, 2), stages_ms=_milliseconds(trace.stages), rows=trace.rows,
+                    jobs=trace.jobs, profiles=trace.profiles
+                )
+
+class TimedJSONResponse(JSONResponse):
+    """JSON response whose encoding counts as the request's 'serialize' stage"""
+
+    def render(self, content):
+        with stage('serialize'):
+            return super().render(content)
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from starlette.datastructures import MutableHeaders
+from database.queries import group_baskets
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+ARROW_FILE = 'application/vnd.apache.arrow.file'
+ARROW_TYPES = (ARROW_STREAM, ARROW_FILE)
+
+# Content codings understood in both directions, in order of preference
+ENCODINGS = ('zstd', 'gzip')
+# Compressed request bodies are decoded this many bytes at a time
+DECOMPRESS_CHUNK = 1024 * 1024
+
+class PayloadTooLarge(Exception):
+    """A request body, once decompressed, is over the size limit"""
+
+def media_type(content_type):
+    return (content_type or 'application/json').split(';')[0].strip().lower()
+
+def decompress(body, encoding, max_size=None):
+    """Undo a request Content-Encoding; raises ValueError for unsupported codings.
+
+    Decodes in chunks and raises PayloadTooLarge as soon as the output passes
+    ``max_size`` bytes, so a small compressed body cannot expand without bound.
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding not in ENCODINGS and encoding != 'identity':
+        raise ValueError(f"Unsupported Content-Encoding '{encoding}'. Use one of: {', '.join(ENCODINGS)}")
+    too_large = PayloadTooLarge(f"Request body is larger than {max_size} bytes")
+    if encoding == 'identity':
+        if max_size is not None and len(body) > max_size:
+            raise too_large
+        return body
+    # The streaming decoder does not need the decompressed size up front
+    stream = pa.CompressedInputStream(pa.BufferReader(body), encoding)
+    chunks = []
+    size = 0
+    while chunk := stream.read(DECOMPRESS_CHUNK):
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def compress(body, encoding):
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, encoding) as stream:
+        stream.write(body)
+    return sink.getvalue().to_pybytes()
+
+def accepted_encoding(accept_encoding):
+    """Preferred coding allowed by an Accept-Encoding header, or None"""
+    allowed = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip()[2:] if params.strip().startswith('q=') else '1'
+        try:
+            allowed[name.strip().lower()] = float(quality)
+        except ValueError:
+            continue
+    for encoding in ENCODINGS:
+        if allowed.get(encoding, allowed.get('*', 0)) > 0:
+            return encoding
+    return None
+
+class CompressionMiddleware:
+    """Compress responses with zstd or gzip, as the client's Accept-Encoding allows.
+
+    Only single-message bodies of at least ``minimum_size`` bytes are
+    compressed; streaming responses such as server-sent events pass through
+    untouched. Large bodies are compressed on a thread.
+    """
+
+    def __init__(self, app, minimum_size=1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        request_headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        encoding = accepted_encoding(request_headers.get('accept-encoding'))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body' or passthrough:
+                return await send(message)
+
+            body = message.get('body', b'')
+            headers = MutableHeaders(scope=start)
+            if message.get('more_body', False) or len(body) < self.minimum_size or 'content-encoding' in headers:
+                passthrough = True
+                await send(start)
+                return await send(message)
+
+            if len(body) > 1024 * 1024:
+                body = await asyncio.to_thread(compress, body, encoding)
+            else:
+                body = compress(body, encoding)
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(body))
+            headers.add_vary_header('Accept-Encoding')
+            await send(start)
+            await send({'type': 'http.response.body', 'body': body})
+
+        await self.app(scope, receive, send_compressed)
+
+def read_arrow(body, content_type=ARROW_STREAM):
+    """Arrow IPC stream or file body as a DataFrame, without building per-row objects.
+
+    The SHA-256 of the body is kept in ``df.attrs['digest']`` so results can
+    be cached without hashing the frame again.
+    """
+    reader = pa.ipc.open_file(body) if media_type(content_type) == ARROW_FILE else pa.ipc.open_stream(body)
+    df = reader.read_all().to_pandas(split_blocks=True, self_destruct=True)
+    df.attrs['digest'] = hashlib.sha256(body).hexdigest()
+    return df
+
+def write_arrow(df, metadata=None):
+    """DataFrame as an Arrow IPC stream, with optional string schema metadata"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        table = table.replace_schema_metadata({key: str(value) for key, value in metadata.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+LINE_COLUMNS = ['basket', 'transaction_id', 'customer_id', 'product_name', 'category', 'price']
+
+def line_items(transactions):
+    """Flat (transaction, customer, product, category, price) rows from any transaction payload.
+
+    Accepts JSON-style transactions with nested ``items`` lists, or a
+    DataFrame that is either nested the same way or already one row per
+    line item with a ``product_name`` column. ``basket`` numbers the
+    transactions, so ones without an ID still form separate baskets. Lines
+    without a product name are dropped.
+    """
+    if isinstance(transactions, pd.DataFrame):
+        df = transactions
+        if 'items' not in df.columns:
+            lines = pd.DataFrame({column: df[column] if column in df else None for column in LINE_COLUMNS[1:]})
+            if 'price' not in df and 'unit_price' in df:
+                lines['price'] = df['unit_price']
+            if 'transaction_id' in df:
+                lines.insert(0, 'basket', pd.factorize(df['transaction_id'], use_na_sentinel=False)[0])
+            else:
+                lines.insert(0, 'basket', np.arange(len(df)))
+            return lines.dropna(subset=['product_name']).reset_index(drop=True)
+        transactions = df.to_dict('records')
+
+    rows = []
+    for basket, trans in enumerate(transactions):
+        items = trans.get('items')
+        if not isinstance(items, (list, np.ndarray)):
+            continue
+        for item in items:
+            if isinstance(item, dict) and item.get('product_name'):
+                rows.append((
+                    basket, trans.get('transaction_id'), trans.get('customer_id'), item['product_name'],
+                    item.get('category'), item.get('unit_price', item.get('price'))
+                ))
+    return pd.DataFrame(rows, columns=LINE_COLUMNS)
+
+def transaction_baskets(transactions):
+    """Product-name baskets and their transaction IDs, like ``load_baskets``"""
+    lines = line_items(transactions)
+    baskets, _ = group_baskets(lines['basket'], lines['product_name'])
+    ids = lines.groupby('basket', sort=False)['transaction_id'].first()
+    return baskets, ids.astype(object).where(ids.notna(), None).tolist()
@@ -0,0 +1,195 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+METRICS = ('cosine', 'lift')
+
+def _resize(matrix, shape):
+    matrix = matrix.tocsr(copy=True)
+    matrix.resize(shape)
+    return matrix
+
+class ItemSimilarityIndex:
+    """Item-to-item recommender over a sparse customer x product matrix.
+
+    ``purchases`` marks which customers bought which products and
+    ``cooccurrence`` (its Gram matrix) counts the customers who bought each
+    pair, with per-product customer counts on the diagonal. ``ingest`` only
+    multiplies the *new* purchase entries into the co-occurrence counts, so
+    history is never rescanned. After each ingest the top ``top_n`` most
+    similar products per product are re-derived, by cosine and by lift, and
+    kept as flat CSR-style arrays; a recommendation is then a handful of
+    array slices over the products the customer already bought.
+
+    Updates build new arrays and swap them in at the end, so lookups can run
+    concurrently with an ingest and see either the old or the new index.
+    """
+
+    def __init__(self, top_n=50, min_common=2):
+        self.top_n = top_n
+        self.min_common = min_common
+        self.items = []
+        self.item_ids = {}
+        self.item_info = {}
+        self.customer_ids = {}
+        self.purchases = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.cooccurrence = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.neighbours = {}
+        self.popular = np.array([], dtype=np.int64)
+        # Highest fact_sales.sale_id already ingested from the warehouse
+        self.last_sale_id = 0
+
+    @property
+    def n_customers(self):
+        return len(self.customer_ids)
+
+    @property
+    def n_items(self):
+        return len(self.items)
+
+    @staticmethod
+    def _ids(mapping, keys, names=None):
+        codes = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            code = mapping.get(key)
+            if code is None:
+                code = mapping[key] = len(mapping)
+                if names is not None:
+                    names.append(key)
+            codes[i] = code
+        return codes
+
+    def ingest(self, purchases):
+        """Add (customer_id, product_name) purchases; returns the number of new pairs.
+
+        Optional category and price columns fill in product details. Repeat
+        purchases of a product by the same customer do not change the index.
+        """
+        purchases = purchases.dropna(subset=['customer_id', 'product_name'])
+        for column in ('category', 'price'):
+            if column in purchases:
+                info = purchases.dropna(subset=[column]).drop_duplicates('product_name', keep='last')
+                for name, value in zip(info['product_name'], info[column]):
+                    self.item_info.setdefault(name, {})[column] = value
+        pairs = purchases[['customer_id', 'product_name']].astype(str).drop_duplicates()
+        if len(pairs) == 0:
+            return 0
+
+        rows = self._ids(self.customer_ids, pairs['customer_id'].tolist())
+        cols = self._ids(self.item_ids, pairs['product_name'].tolist(), self.items)
+        shape = (self.n_customers, self.n_items)
+        old = _resize(self.purchases, shape)
+
+        # New entries only: D = candidates minus what was already recorded
+        candidates = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape)
+        new = candidates - candidates.multiply(old)
+        new.eliminate_zeros()
+        if new.nnz == 0:
+            self.purchases = old
+            return 0
+
+        # (X + D)^T (X + D) - X^T X = D^T X + X^T D + D^T D
+        cross = new.T @ old
+        delta = cross + cross.T + new.T @ new
+        self.cooccurrence = (_resize(self.cooccurrence, (self.n_items, self.n_items)) + delta).tocsr()
+        self.purchases = (old + new).tocsr()
+        self._refresh_neighbours()
+        return int(new.nnz)
+
+    def _refresh_neighbours(self):
+        counts = self.cooccurrence.diagonal().astype(float)
+        pairs = self.cooccurrence.tocoo()
+        keep = (pairs.row != pairs.col) & (pairs.data >= self.min_common)
+        row, col, common = pairs.row[keep], pairs.col[keep], pairs.data[keep].astype(float)
+        scores = {
+            'cosine': common / np.sqrt(counts[row] * counts[col]),
+            'lift': common * self.n_customers / (counts[row] * counts[col]),
+        }
+
+        neighbours = {}
+        for metric, score in scores.items():
+            # Best first within each product, then the first top_n per product
+            order = np.lexsort((-score, row))
+            sorted_rows = row[order]
+            starts = np.searchsorted(sorted_rows, np.arange(self.n_items))
+            rank = np.arange(len(order)) - starts[sorted_rows]
+            order = order[rank < self.top_n]
+            indptr = np.searchsorted(row[order], np.arange(self.n_items + 1))
+            neighbours[metric] = (indptr, col[order].astype(np.int32), score[order].astype(np.float32))
+        self.neighbours = neighbours
+        self.popular = np.argsort(-counts, kind='stable')
+
+    def _details(self, item, score, reason, confidence):
+        info = self.item_info.get(self.items[item], {})
+        price = info.get('price')
+        return {
+            "product_name": self.items[item],
+            "category": info.get('category'),
+            "price": None if price is None or pd.isna(price) else round(float(price), 2),
+            "score": round(float(score), 4),
+            "reason": reason,
+            "confidence": int(confidence),
+        }
+
+    def recommend(self, customer_id=None, items=(), limit=5, metric='cosine'):
+        """Top products for a customer and/or a basket of product names.
+
+        Candidates are scored by summing their similarity to each product the
+        customer owns. Customers with no history (or no similar products) get
+        the most widely bought products instead.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}")
+        purchases, neighbours, popular = self.purchases, self.neighbours.get(metric), self.popular
+
+        owned = set(self.item_ids[name] for name in items if name in self.item_ids)
+        customer = self.customer_ids.get(str(customer_id)) if customer_id is not None else None
+        if customer is not None and customer < purchases.shape[0]:
+            owned.update(purchases.indices[purchases.indptr[customer]:purchases.indptr[customer + 1]].tolist())
+
+        results = []
+        if owned and neighbours is not None:
+            indptr, neighbour_items, neighbour_scores = neighbours
+            sources = [item for item in owned if item < len(indptr) - 1]
+            candidates = np.concatenate([neighbour_items[indptr[i]:indptr[i + 1]] for i in sources] or [[]])
+            scores = np.concatenate([neighbour_scores[indptr[i]:indptr[i + 1]] for i in sources] or [[]])
+            origins = np.concatenate([np.full(indptr[i + 1] - indptr[i], i) for i in sources] or [[]])
+            mask = ~np.isin(candidates, list(owned))
+            candidates, scores, origins = candidates[mask].astype(np.int64), scores[mask], origins[mask].astype(np.int64)
+            if len(candidates):
+                unique, inverse = np.unique(candidates, return_inverse=True)
+                totals = np.bincount(inverse, weights=scores)
+                # The owned product contributing most explains each candidate
+                best = np.lexsort((-scores, inverse))
+                first = best[np.searchsorted(inverse[best], np.arange(len(unique)))]
+                for j in np.argsort(-totals, kind='stable')[:limit]:
+                    similarity = scores[first[j]]
+                    confidence = min(similarity, 1.0) * 100 if metric == 'cosine' else min(similarity / 5, 1.0) * 100
+                    results.append(self._details(
+                        unique[j], totals[j], f"Often bought with {self.items[origins[first[j]]]}", confidence
+                    ))
+
+        if len(results) < limit:
+            chosen = owned | {self.item_ids[r["product_name"]] for r in results}
+            share = self.cooccurrence.diagonal() / max(self.n_customers, 1)
+            for item in popular:
+                if len(results) >= limit:
+                    break
+                if item not in chosen:
+                    results.append(self._details(item, share[item], "Popular with customers", share[item] * 100))
+        return results
+
+    def save(self, path):
+        """Write the index atomically, so a crash never leaves a partial file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
@@ -0,0 +1,284 @@
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from itertools import combinations
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from utils.locking import file_lock
+from utils.market_basket import generate_association_rules
+
+# Held by ``save``, ``load`` and ``sync``; the lock is reentrant, so saving inside ``sync`` is fine
+LOCK_FILE = 'store.lock'
+
+def state_version(path):
+    """Changes whenever a store directory's state is saved; None before the first save"""
+    try:
+        stat = os.stat(os.path.join(path, 'state.pkl'))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def store_lock(path):
+    return file_lock(os.path.join(path, LOCK_FILE))
+
+class IncrementalRuleStore:
+    """Persistent itemset-count store that keeps association rules current.
+
+    Exact counts are kept for every item and for every itemset (up to
+    ``max_len``) made of *tracked* items, i.e. items whose support reached
+    ``track_support``, a safety margin below ``min_support``. Appending
+    baskets only counts the new baskets; rules are derived from the counts
+    without touching history. The encoded basket history is kept so that
+    ``rebuild`` can recount everything when thresholds change, or when an
+    untracked item crosses the margin and its past co-occurrences are unknown.
+
+    ``save`` appends only the baskets added since the previous save, so the
+    on-disk history grows like a log instead of being rewritten each time.
+    Saves hold the store's file lock and refuse to append to a directory
+    another process saved to since, see ``sync``.
+    """
+
+    def __init__(self, min_support=0.03, max_len=3, track_ratio=0.5):
+        self.min_support = min_support
+        self.max_len = max_len
+        self.track_ratio = track_ratio
+        self.items = []
+        self.item_ids = {}
+        self.item_counts = Counter()
+        self.tracked = set()
+        self.itemset_counts = Counter()
+        self.seen_transactions = set()
+        # Basket history as a flat array of item IDs plus basket offsets
+        self.basket_items = array('i')
+        self.basket_offsets = array('q', [0])
+        self._saved_baskets = 0
+        self._unsaved_transactions = []
+        self._transactions_size = 0
+        self._version = None
+
+    @property
+    def track_support(self):
+        return self.min_support * self.track_ratio
+
+    @property
+    def n_baskets(self):
+        return len(self.basket_offsets) - 1
+
+    def _encode(self, basket):
+        ids = set()
+        for name in basket:
+            item_id = self.item_ids.get(name)
+            if item_id is None:
+                item_id = self.item_ids[name] = len(self.items)
+                self.items.append(name)
+            ids.add(item_id)
+        return sorted(ids)
+
+    def _count_combinations(self, basket):
+        tracked = [item for item in basket if item in self.tracked]
+        for size in range(2, min(len(tracked), self.max_len) + 1):
+            self.itemset_counts.update(combinations(tracked, size))
+
+    def _iter_baskets(self):
+        for start, end in zip(self.basket_offsets[:-1], self.basket_offsets[1:]):
+            yield self.basket_items[start:end]
+
+    def _untracked_frequent(self):
+        min_count = self.track_support * self.n_baskets
+        return [item for item, count in self.item_counts.items()
+                if count >= min_count and item not in self.tracked]
+
+    def ingest(self, baskets, transaction_ids=None):
+        """Add new baskets; returns (baskets ingested, whether a rebuild ran).
+
+        Baskets whose transaction ID was already ingested are skipped, so the
+        full history can be re-posted and only new receipts are counted.
+        Every basket needs an ID: a re-posted basket without one would be
+        counted again, so such batches raise ValueError before any is added.
+        """
+        if transaction_ids is None or any(transaction_id is None for transaction_id in transaction_ids):
+            raise ValueError("Incremental ingest needs a transaction_id for every transaction")
+        if len(transaction_ids) != len(baskets):
+            raise ValueError("Expected one transaction ID per basket")
+        
+        ingested = 0
+        for transaction_id, basket in zip(transaction_ids, baskets):
+            transaction_id = str(transaction_id)
+            if transaction_id in self.seen_transactions:
+                continue
+            self.seen_transactions.add(transaction_id)
+            self._unsaved_transactions.append(transaction_id)
+            encoded = self._encode(basket)
+            if not encoded:
+                continue
+            self.basket_items.extend(encoded)
+            self.basket_offsets.append(len(self.basket_items))
+            self.item_counts.update(encoded)
+            self._count_combinations(encoded)
+            ingested += 1
+        
+        # An item that just became trackable has uncounted past co-occurrences
+        if self._untracked_frequent():
+            self.rebuild()
+            return ingested, True
+        return ingested, False
+
+    def rebuild(self, min_support=None, max_len=None):
+        """Full recount over the stored history, optionally with new thresholds"""
+        if min_support is not None:
+            self.min_support = min_support
+            # Items are only dropped from tracking when thresholds change;
+            # otherwise items hovering around the margin would force a rebuild
+            # every time they cross it again
+            self.tracked = set()
+        if max_len is not None:
+            self.max_len = max_len
+        
+        min_count = self.track_support * self.n_baskets
+        self.tracked |= {item for item, count in self.item_counts.items() if count >= min_count}
+        self.itemset_counts = Counter()
+        for basket in self._iter_baskets():
+            self._count_combinations(basket)
+
+    def check_query(self, min_support=None, max_len=None):
+        """Raise ValueError for thresholds the counts cannot answer without a rebuild"""
+        if min_support is not None and min_support < self.track_support:
+            raise ValueError(
+                f"min_support {min_support} is below the tracked support "
+                f"{self.track_support:.4f}; rebuild the store with the new threshold"
+            )
+        if max_len is not None and max_len > self.max_len:
+            raise ValueError(
+                f"max_len {max_len} is above the store's max_len {self.max_len}; "
+                f"rebuild the store with the new max_len"
+            )
+
+    def frequent_itemsets(self, min_support=None, max_len=None):
+        """Current frequent itemsets in the mlxtend ``support``/``itemsets`` format.
+
+        ``max_len`` may only lower the store's own ``max_len``.
+        """
+        self.check_query(min_support, max_len)
+        min_support = self.min_support if min_support is None else min_support
+        if self.n_baskets == 0:
+            return pd.DataFrame(columns=['support', 'itemsets'])
+        
+        min_count = int(np.ceil(round(min_support * self.n_baskets, 9)))
+        found = [((item,), count) for item, count in self.item_counts.items() if count >= min_count]
+        found += [(itemset, count) for itemset, count in self.itemset_counts.items()
+                  if count >= min_count and (max_len is None or len(itemset) <= max_len)]
+        
+        return pd.DataFrame({
+            'support': np.array([count for _, count in found], dtype=float) / self.n_baskets,
+            'itemsets': [frozenset(self.items[item] for item in itemset) for itemset, _ in found]
+        })
+
+    def rules(self, min_support=None, min_confidence=0.2, max_len=None):
+        """Association rules (support, confidence, lift) from the current counts"""
+        return generate_association_rules(self.frequent_itemsets(min_support, max_len), min_confidence)
+
+    @contextmanager
+    def sync(self, path):
+        """Hold the store's file lock, first catching up with saves made by other processes.
+
+        Wrap reads, and ingesting plus saving, in ``with store.sync(path):``
+        so every process works on the latest saved state.
+        """
+        with store_lock(path):
+            version = state_version(path)
+            if version is not None and version != self._version:
+                self.__dict__.update(self._load(path).__dict__)
+            yield self
+
+    def save(self, path):
+        """Persist counts and append new history to the store directory.
+
+        Raises RuntimeError when another process saved the directory after
+        this store was loaded or last saved; appending would corrupt it.
+        """
+        with store_lock(path):
+            version = state_version(path)
+            if version is not None and version != self._version:
+                raise RuntimeError("The rule store was saved by another process; sync it before saving")
+            self._save(path)
+
+    def _save(self, path):
+        start = self.basket_offsets[self._saved_baskets]
+        lengths = array('q', (end - begin for begin, end in zip(
+            self.basket_offsets[self._saved_baskets:-1], self.basket_offsets[self._saved_baskets + 1:]
+        )))
+        # Each file is first cut back to its saved length, dropping any tail an
+        # interrupted save left, so the appends stay aligned with the state
+        with open(os.path.join(path, 'basket_items.bin'), 'ab') as f:
+            f.truncate(start * self.basket_items.itemsize)
+            self.basket_items[start:].tofile(f)
+        with open(os.path.join(path, 'basket_lengths.bin'), 'ab') as f:
+            f.truncate(self._saved_baskets * lengths.itemsize)
+            lengths.tofile(f)
+        with open(os.path.join(path, 'transactions.txt'), 'ab') as f:
+            f.truncate(self._transactions_size)
+            f.write(''.join(f"{transaction_id}\n" for transaction_id in self._unsaved_transactions).encode('utf-8'))
+            transactions_size = f.tell()
+        
+        state = {
+            'min_support': self.min_support,
+            'max_len': self.max_len,
+            'track_ratio': self.track_ratio,
+            'items': self.items,
+            'item_counts': self.item_counts,
+            'tracked': self.tracked,
+            'itemset_counts': self.itemset_counts,
+            'n_baskets': self.n_baskets,
+            'n_items': len(self.basket_items),
+            'transactions_size': transactions_size,
+        }
+        tmp_path = os.path.join(path, 'state.pkl.tmp')
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, os.path.join(path, 'state.pkl'))
+        
+        self._saved_baskets = self.n_baskets
+        self._unsaved_transactions = []
+        self._transactions_size = transactions_size
+        self._version = state_version(path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a store written by ``save``, dropping history appended after the last state"""
+        with store_lock(path):
+            return cls._load(path)
+
+    @classmethod
+    def _load(cls, path):
+        with open(os.path.join(path, 'state.pkl'), 'rb') as f:
+            state = pickle.load(f)
+        
+        # A save interrupted between the history appends and the state write
+        # leaves a partial tail; cut it so later appends stay aligned
+        store = cls(state['min_support'], state['max_len'], state['track_ratio'])
+        os.truncate(os.path.join(path, 'basket_items.bin'), state['n_items'] * store.basket_items.itemsize)
+        os.truncate(os.path.join(path, 'basket_lengths.bin'), state['n_baskets'] * store.basket_offsets.itemsize)
+        os.truncate(os.path.join(path, 'transactions.txt'), state['transactions_size'])
+        
+        store.items = state['items']
+        store.item_ids = {name: item_id for item_id, name in enumerate(store.items)}
+        store.item_counts = state['item_counts']
+        store.tracked = state['tracked']
+        store.itemset_counts = state['itemset_counts']
+        
+        with open(os.path.join(path, 'basket_items.bin'), 'rb') as f:
+            store.basket_items.fromfile(f, state['n_items'])
+        lengths = array('q')
+        with open(os.path.join(path, 'basket_lengths.bin'), 'rb') as f:
+            lengths.fromfile(f, state['n_baskets'])
+        store.basket_offsets = array('q', [0])
+        store.basket_offsets.extend(np.cumsum(lengths, dtype=np.int64).tolist())
+        with open(os.path.join(path, 'transactions.txt'), encoding='utf-8') as f:
+            store.seen_transactions = {line.rstrip('\n') for line in f}
+        
+        store._saved_baskets = store.n_baskets
+        store._transactions_size = state['transactions_size']
+        store._version = state_version(path)
+        return store
@@ -0,0 +1,75 @@
+from collections import Counter
+import numpy as np
+import pandas as pd
+from database.loader import SOURCE_COLUMNS
+from utils.market_basket import mine_frequent_itemsets, support_count
+
+# Payload columns tried in order for each way of sharding
+SHARD_COLUMNS = {'store': SOURCE_COLUMNS['store_key'], 'region': SOURCE_COLUMNS['region']}
+# Shard of rows without a store (or region)
+UNKNOWN_SHARD = 'unknown'
+
+def shard_frame(df, shard_by='store'):
+    """(key, rows) per store or region of a payload frame, in key order"""
+    if shard_by not in SHARD_COLUMNS:
+        raise ValueError(f"Cannot shard by '{shard_by}'. Use one of: {', '.join(SHARD_COLUMNS)}")
+    column = next((column for column in SHARD_COLUMNS[shard_by] if column in df.columns), None)
+    if column is None:
+        raise ValueError(f"Rows need a {' or '.join(SHARD_COLUMNS[shard_by])} column to shard by {shard_by}")
+    keys = df[column].astype(str).where(df[column].notna(), UNKNOWN_SHARD).to_numpy()
+    return [(key, rows) for key, rows in df.groupby(keys, sort=True)]
+
+def local_itemsets(baskets, min_support, max_len=None):
+    """Map, first pass: itemsets frequent within one shard, with their basket counts.
+
+    An itemset frequent over all shards is frequent in at least one of them,
+    so the union over shards is a complete set of candidates (SON).
+    """
+    if not baskets:
+        return 0, {}
+    frequent = mine_frequent_itemsets(baskets, min_support=min_support, max_len=max_len)
+    counts = np.rint(frequent['support'].to_numpy(dtype=float) * len(baskets)).astype(np.int64)
+    return len(baskets), dict(zip(frequent['itemsets'], counts.tolist()))
+
+def merge_itemset_counts(parts, min_support):
+    """Reduce: frequent itemsets over all shards, in the ``mine_frequent_itemsets`` format.
+
+    ``parts`` holds (baskets, counts) per shard, where after the second pass
+    each shard's counts cover every candidate. Returns the itemsets and the
+    total number of baskets.
+    """
+    total = sum(n_baskets for n_baskets, _ in parts)
+    counts = Counter()
+    for _, shard_counts in parts:
+        counts.update(shard_counts)
+    min_count = max(support_count(min_support, total), 1)
+    frequent = [(itemset, count) for itemset, count in counts.items() if count >= min_count]
+    return pd.DataFrame({
+        'support': np.array([count for _, count in frequent], dtype=float) / max(total, 1),
+        'itemsets': [itemset for itemset, _ in frequent],
+    }), total
+
+def merge_customer_aggregates(parts):
+    """Reduce: per-customer purchase aggregates over all shards.
+
+    Takes ``aggregate_transactions`` output per shard; a customer who shops
+    at several stores gets the earliest and latest purchase and the summed
+    count and spend. Transactions never span stores, so counts are exact.
+    """
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame(
+            {'first_purchase': pd.Series(dtype='datetime64[ns]'), 'last_purchase': pd.Series(dtype='datetime64[ns]'),
+             'frequency': pd.Series(dtype='int64'), 'monetary': pd.Series(dtype=float)}
+        )
+    return pd.concat(parts).groupby(level=0, sort=False).agg(
+        first_purchase=('first_purchase', 'min'), last_purchase=('last_purchase', 'max'),
+        frequency=('frequency', 'sum'), monetary=('monetary', 'sum')
+    )
+
+def merge_daily_sales(parts):
+    """Reduce: units sold per product per day over all shards"""
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame({'product_id': [], 'date': pd.to_datetime([]), 'sales': []})
+    return pd.concat(parts, ignore_index=True).groupby(['product_id', 'date'], sort=False, as_index=False)['sales'].sum()
@@ -0,0 +1,81 @@
+import gc
+import importlib
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Imported by the analyses on first use; preloading imports them up front
+HEAVY_MODULES = (
+    'sklearn.cluster', 'sklearn.preprocessing', 'sklearn.ensemble',
+    'mlxtend.frequent_patterns', 'mlxtend.preprocessing',
+)
+
+def process_age():
+    """Seconds since this process started (since the fork, for forked workers), or None without /proc"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the command name, which may itself contain spaces; starttime is field 22
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class StartupReport:
+    """Timed startup phases of the server, for /health and /metrics.
+
+    Phases timed before a fork (importing the app, preloading) are kept by
+    the forked workers, which report them as inherited; ``boot`` is always
+    the time this process took from its own start to serving.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.created = time.perf_counter()
+        self.phases = {}
+        self.preloaded = False
+        self.ready_at = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+
+    def finish_import(self):
+        """Time from importing this module (first thing the app does) until now"""
+        self.phases['import'] = time.perf_counter() - self.created
+
+    def ready(self):
+        self.ready_at = time.time()
+        age = process_age()
+        self.phases['boot'] = age if age is not None else time.perf_counter() - self.created
+
+    def report(self):
+        return {
+            "pid": os.getpid(),
+            "mode": "preload" if self.preloaded else "lazy",
+            "inherited": os.getpid() != self.pid,
+            "phases_s": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "uptime_s": round(time.time() - self.ready_at, 1) if self.ready_at else None,
+            "heavy_modules": {name: name in sys.modules for name in HEAVY_MODULES},
+        }
+
+startup = StartupReport()
+
+def preload_modules(modules=HEAVY_MODULES):
+    for name in modules:
+        importlib.import_module(name)
+
+def freeze_heap():
+    """Keep everything allocated so far out of garbage collection.
+
+    Collections write to the header of every tracked object, so without this
+    forked workers gradually copy the pages they share with their parent.
+    """
+    gc.collect()
+    gc.freeze()
@@ -1,5 +1,9 @@
 const API_URL = 'http://localhost:8000/api';
 
+// Payloads larger than this run as backend jobs instead of a single request
+const JOB_THRESHOLD = 20000;
+const JOB_POLL_INTERVAL_MS = 1000;
+
 let globalTransactions = [];
 let globalCustomers = [];
 let globalProducts = [];
@@ -33,13 +37,9 @@ export async function InvokeLLM({ prompt, response_json_schema }) {
 
       console.log('📊 Sending to backend:', processedTransactions.length, 'transactions');
       
-      const response = await fetch(`${API_URL}/market-basket`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          transactions: processedTransactions
-        })
-      });
+      const response = await postAnalysis('market-basket', {
+        transactions: processedTransactions
+      }, processedTransactions.length);
       
       if (!response.ok) {
         console.warn('ML backend unavailable, using fallback');
@@ -58,13 +58,9 @@ export async function InvokeLLM({ prompt, response_json_schema }) {
     
     // ==================== CUSTOMER SEGMENTATION ====================
     if (response_json_schema.properties.segment_insights) {
-      const response = await fetch(`${API_URL}/customer-segmentation`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          customers: globalCustomers
-        })
-      });
+      const response = await postAnalysis('customer-segmentation', {
+        customers: globalCustomers
+      }, globalCustomers.length);
       
       if (!response.ok) {
         console.warn('ML backend unavailable, using fallback');
@@ -82,13 +78,9 @@ export async function InvokeLLM({ prompt, response_json_schema }) {
         total_amount: parseFloat(t.total_amount) || 0
       }));
 
-      const response = await fetch(`${API_URL}/anomaly-detection`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          transactions: processedTransactions
-        })
-      });
+      const response = await postAnalysis('anomaly-detection', {
+        transactions: processedTransactions
+      }, processedTransactions.length);
       
       if (!response.ok) {
         console.warn('ML backend unavailable, using fallback');
@@ -144,6 +136,49 @@ export async function InvokeLLM({ prompt, response_json_schema }) {
   }
 }
 
+// Helper: POST an analysis directly, or as a backend job for large payloads.
+// Resolves to a fetch Response either way.
+async function postAnalysis(kind, payload, recordCount) {
+  if (recordCount > JOB_THRESHOLD) {
+    return runJob(kind, payload);
+  }
+  
+  return fetch(`${API_URL}/${kind}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload)
+  });
+}
+
+// Helper: Submit a backend job and poll until its result is ready
+async function runJob(kind, payload) {
+  const submitted = await fetch(`${API_URL}/jobs`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ kind, payload })
+  });
+  if (!submitted.ok) return submitted;
+  
+  const { job_id } = await submitted.json();
+  console.log(`⏳ Running ${kind} as job ${job_id}`);
+  
+  while (true) {
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    
+    const statusResponse = await fetch(`${API_URL}/jobs/${job_id}`);
+    if (!statusResponse.ok) return statusResponse;
+    
+    const job = await statusResponse.json();
+    if (job.status === 'completed') {
+      return fetch(`${API_URL}/jobs/${job_id}/result`);
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      console.warn(`Job ${job_id} ${job.status}:`, job.error);
+      return new Response(null, { status: 500 });
+    }
+  }
+}
+
 // Helper: Store transactions globally
 export function setGlobalTransactions(transactions) {
   globalTransactions = transactions;